@@ -0,0 +1,260 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+import weakref
+from loguru import logger
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_SHED, ADMISSION_WAIT
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+# 모든 요청이 함께 쓰는 전체 동시 실행 한도
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", 64))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 256))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", 10.0))
+# OCR/LLM/STT 파이프라인 동시 실행 한도 (업스트림 rate limit과 메모리 기준)
+ADMISSION_PIPELINE_CONCURRENCY = int(os.getenv("ADMISSION_PIPELINE_CONCURRENCY", 8))
+ADMISSION_PIPELINE_MAX_QUEUE = int(os.getenv("ADMISSION_PIPELINE_MAX_QUEUE", 32))
+ADMISSION_PIPELINE_MAX_WAIT = float(os.getenv("ADMISSION_PIPELINE_MAX_WAIT", 60.0))
+# 차트 PDF 렌더링 동시 실행 한도
+ADMISSION_EXPORT_CONCURRENCY = int(os.getenv("ADMISSION_EXPORT_CONCURRENCY", 4))
+ADMISSION_EXPORT_MAX_QUEUE = int(os.getenv("ADMISSION_EXPORT_MAX_QUEUE", 16))
+ADMISSION_EXPORT_MAX_WAIT = float(os.getenv("ADMISSION_EXPORT_MAX_WAIT", 30.0))
+# 서비스 시간 이동 평균 가중치 (대기 시간 예측용)
+SERVICE_TIME_ALPHA = 0.2
+
+# 숫자가 작을수록 먼저 입장
+PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW = 0, 1, 2
+PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_NORMAL: "normal", PRIORITY_LOW: "low"}
+
+# (메서드, 라우트 경로 템플릿) -> 전용 풀
+ENDPOINT_POOLS = {
+    ("POST", "/extract_prescription"): "pipeline",
+    ("POST", "/extract_prescription/images"): "pipeline",
+    ("POST", "/extract_prescriptions/batch"): "pipeline",
+    ("POST", "/transcribe_audio"): "pipeline",
+    ("GET", "/medical_charts/{chart_id}/pdf"): "export",
+    ("GET", "/voice_medical_charts/{chart_id}/pdf"): "export",
+}
+# 과부하 중에도 항상 응답해야 하는 모니터링/관리 엔드포인트
+EXEMPT_ENDPOINTS = {"/metrics", "/admission/stats", "/upstreams/stats", "/upload_queue/stats",
+                    "/metadata_rules/stats"}
+EXEMPT_PREFIXES = ("/admin/",)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, pool, reason, retry_after):
+        super().__init__(f"{pool} 풀 입장 거절: {reason}")
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionPool:
+    """동시 실행 수를 제한하는 우선순위 대기열.
+
+    자리가 없으면 우선순위 순(같으면 도착 순)으로 기다린다. 대기열이 가득 찼거나, 앞선 대기 요청 수와
+    평균 처리 시간으로 예측한 대기 시간이 요청의 마감 시각을 넘으면 기다리지 않고 바로 거절한다.
+    처리 시간은 우선순위별로 따로 평균을 내므로 긴 요청의 시간이 짧은 요청의 예측을 부풀리지 않는다.
+    """
+
+    def __init__(self, name, concurrency, max_queue, max_wait):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.queued = 0
+        # (우선순위, 순번, future). 취소된 항목은 꺼낼 때 건너뜀
+        self.waiters = []
+        self.sequence = itertools.count()
+        # 우선순위 -> 서비스 시간 이동 평균
+        self.service_times = {}
+        self.admitted = 0
+        self.shed = {'queue_full': 0, 'deadline': 0}
+        self._in_flight_gauge = ADMISSION_IN_FLIGHT.labels(name)
+        self._queue_gauge = ADMISSION_QUEUE_DEPTH.labels(name)
+        self._wait_histogram = ADMISSION_WAIT.labels(name)
+
+    def estimated_wait(self, ahead, priority):
+        # 앞선 요청이 concurrency개씩 처리된다고 보고 내 차례까지 걸리는 시간 (앞선 요청은 같거나 높은 우선순위)
+        service_time = self.service_times.get(priority)
+        if service_time is None:
+            return 0.0
+        return service_time * (ahead // self.concurrency + 1)
+
+    def _reject(self, reason, retry_after):
+        self.shed[reason] += 1
+        ADMISSION_SHED.labels(self.name, reason).inc()
+        raise AdmissionRejected(self.name, reason, retry_after)
+
+    def _update_gauges(self):
+        self._in_flight_gauge.set(self.active)
+        self._queue_gauge.set(self.queued)
+
+    async def acquire(self, priority, deadline):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        if self.active < self.concurrency and self.queued == 0:
+            self.active += 1
+            self.admitted += 1
+            self._update_gauges()
+            self._wait_histogram.observe(0.0)
+            return
+        if self.queued >= self.max_queue:
+            self._reject('queue_full', self.estimated_wait(self.queued, priority))
+        ahead = sum(1 for waiter in self.waiters if waiter[0] <= priority and not waiter[2].done())
+        estimate = self.estimated_wait(ahead, priority)
+        if start + estimate > deadline:
+            self._reject('deadline', estimate)
+
+        future = loop.create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), future))
+        self.queued += 1
+        self._update_gauges()
+        try:
+            await asyncio.wait({future}, timeout=max(deadline - start, 0))
+        except BaseException:
+            # 대기 중 요청이 취소됨 (클라이언트 연결 끊김 등). 이미 자리를 넘겨받았다면 돌려준다
+            self.queued -= 1
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+            self._update_gauges()
+            raise
+        self.queued -= 1
+        if not future.done():
+            future.cancel()
+            self._update_gauges()
+            self._reject('deadline', self.estimated_wait(ahead, priority))
+        self.admitted += 1
+        self._update_gauges()
+        self._wait_histogram.observe(loop.time() - start)
+
+    def release(self, service_time=None, priority=None):
+        if service_time is not None:
+            previous = self.service_times.get(priority)
+            self.service_times[priority] = service_time if previous is None else (
+                SERVICE_TIME_ALPHA * service_time + (1 - SERVICE_TIME_ALPHA) * previous)
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                # 자리를 대기 중인 요청에 그대로 넘김 (active 유지)
+                future.set_result(None)
+                return
+        self.active -= 1
+        self._update_gauges()
+
+    def stats(self):
+        return {
+            'concurrency': self.concurrency,
+            'active': self.active,
+            'queue_depth': self.queued,
+            'queue_capacity': self.max_queue,
+            'admitted': self.admitted,
+            'shed': dict(self.shed),
+            'service_time_seconds': {PRIORITY_NAMES[priority]: round(service_time, 4)
+                                     for priority, service_time in sorted(self.service_times.items())},
+        }
+
+
+class AdmissionTicket:
+    """입장한 요청이 가진 풀 자리들. 응답 본문까지 보낸 뒤 release()로 돌려준다."""
+
+    def __init__(self, pools, priority, loop):
+        self.pools = pools
+        self.priority = priority
+        self.loop = loop
+        self.start = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        service_time = time.perf_counter() - self.start
+        # 서비스 시간은 요청이 처음 입장한 풀(전용 풀이 있으면 전용 풀)에만 반영한다.
+        # 전체 풀에 파이프라인 시간을 넣으면 짧은 요청의 대기 예측이 부풀어 deadline으로 거절됨
+        for pool in reversed(self.pools):
+            pool.release(service_time if pool is self.pools[0] else None, self.priority)
+
+
+class AdmissionController:
+    def __init__(self):
+        self.global_pool = AdmissionPool("global", ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT)
+        self.pools = {
+            "pipeline": AdmissionPool("pipeline", ADMISSION_PIPELINE_CONCURRENCY, ADMISSION_PIPELINE_MAX_QUEUE,
+                                      ADMISSION_PIPELINE_MAX_WAIT),
+            "export": AdmissionPool("export", ADMISSION_EXPORT_CONCURRENCY, ADMISSION_EXPORT_MAX_QUEUE,
+                                    ADMISSION_EXPORT_MAX_WAIT),
+        }
+
+    @staticmethod
+    def priority(endpoint, method):
+        if (method, endpoint) in ENDPOINT_POOLS:
+            return PRIORITY_LOW
+        # 차트/처방전 수정과 단건·목록 조회처럼 짧은 요청은 무거운 요청보다 먼저 입장
+        if method in ("GET", "PUT", "PATCH", "DELETE"):
+            return PRIORITY_HIGH
+        return PRIORITY_NORMAL
+
+    async def admit(self, endpoint, method, timeout=None):
+        """요청을 입장시키고 AdmissionTicket을 반환한다. 거절하면 AdmissionRejected. 제한 대상이 아니면 None."""
+        if not ADMISSION_ENABLED or endpoint in EXEMPT_ENDPOINTS or endpoint.startswith(EXEMPT_PREFIXES):
+            return None
+        pool = self.pools.get(ENDPOINT_POOLS.get((method, endpoint)))
+        pools = [pool, self.global_pool] if pool is not None else [self.global_pool]
+        # 클라이언트가 X-Request-Timeout으로 더 짧은 마감을 주면 그 안에 시작할 수 없는 요청은 바로 거절
+        max_wait = pools[0].max_wait if timeout is None else min(timeout, pools[0].max_wait)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_wait
+        priority = self.priority(endpoint, method)
+        acquired = []
+        try:
+            # 전용 풀에서 먼저 기다려 무거운 요청이 전체 풀 자리를 차지한 채 대기하지 않게 함
+            for current in pools:
+                await current.acquire(priority, deadline)
+                acquired.append(current)
+        except AdmissionRejected as e:
+            for current in reversed(acquired):
+                current.release()
+            logger.warning(f"요청 거절 {method} {endpoint}: {e.pool} 풀 {e.reason}, {e.retry_after}초 후 재시도 안내")
+            raise
+        except BaseException:
+            for current in reversed(acquired):
+                current.release()
+            raise
+        return AdmissionTicket(acquired, priority, loop)
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in [("global", self.global_pool), *self.pools.items()]}
+
+
+def _release_soon(loop, ticket):
+    if not loop.is_closed():
+        loop.call_soon_threadsafe(ticket.release)
+
+
+def release_after_body(response, ticket):
+    """스트리밍 응답은 본문을 다 보낸 뒤에 자리를 돌려준다 (일괄 처리는 본문 스트리밍 중에 실행됨)."""
+    if ticket is None:
+        return response
+    body_iterator = response.body_iterator
+
+    async def release_when_sent():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            ticket.release()
+
+    wrapped = release_when_sent()
+    # 본문을 한 번도 읽지 않고 버려진 경우(전송 전 연결 끊김)에도 자리를 돌려줌
+    weakref.finalize(wrapped, _release_soon, ticket.loop, ticket)
+    response.body_iterator = wrapped
+    return response
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,145 @@
+"""차트/약품 문서 컬럼 압축 벤치마크.
+
+사전 없는 zlib와 학습한 사전을 쓰는 zlib의 압축률, 행 단위 인코딩/디코딩 시간,
+SQLite 파일 크기와 쓰기/읽기 시간을 비교한다.
+
+    python benchmarks/bench_compression.py --rows 5000
+    python benchmarks/bench_compression.py --db medical_data.db   # 실제 데이터로 측정
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compression  # noqa: E402
+from compression import COMPRESSED_COLUMNS, compress_bytes, decode_text, encode_text, train_dictionary  # noqa: E402
+
+SYMPTOMS = ["두통", "발열", "기침", "인후통", "복통", "설사", "어지러움", "근육통", "피로감", "소화불량"]
+DRUGS = ["아세트아미노펜", "이부프로펜", "아목시실린", "세티리진", "오메프라졸", "메트포르민", "암로디핀"]
+WARNINGS = [
+    "다음 환자에는 투여하지 말 것",
+    "이 약에 과민증 환자",
+    "임부 또는 임신하고 있을 가능성이 있는 여성",
+    "간장애 또는 신장애 환자에는 신중히 투여할 것",
+    "정해진 용법과 용량을 잘 지킬 것",
+    "어린이의 손이 닿지 않는 곳에 보관할 것",
+]
+
+
+def synthetic_chart(rng):
+    symptoms = rng.sample(SYMPTOMS, 3)
+    drugs = rng.sample(DRUGS, 2)
+    return "\n".join([
+        f"주관적 소견: 환자는 {rng.randint(1, 14)}일 전부터 {', '.join(symptoms)} 증상을 호소함.",
+        f"객관적 소견: 체온 {rng.uniform(36.0, 39.5):.1f}도, 맥박 {rng.randint(60, 110)}회/분, 혈압 "
+        f"{rng.randint(100, 150)}/{rng.randint(60, 95)}mmHg.",
+        f"평가: {symptoms[0]}을 주 증상으로 하는 상기도 감염 의심. 기저질환 {rng.choice(['없음', '고혈압', '당뇨'])}.",
+        f"계획: {drugs[0]} {rng.choice([250, 500, 650])}mg 1일 {rng.randint(2, 3)}회, "
+        f"{drugs[1]} 1일 1회 {rng.randint(3, 7)}일분 처방. 증상 악화 시 재내원 권고.",
+        "약사 상담: 복용 중 이상반응이 나타나면 즉시 복용을 중지하고 의사 또는 약사와 상의할 것.",
+        "영양사 상담: 충분한 수분 섭취와 자극적인 음식 섭취를 피할 것을 권고함.",
+    ])
+
+
+def synthetic_warning(rng):
+    lines = rng.sample(WARNINGS, 4)
+    return "\n".join(f"{index + 1}. {line}. {rng.choice(DRUGS)} 성분 함유 제제와 병용 시 주의."
+                     for index, line in enumerate(lines)) * rng.randint(2, 4)
+
+
+def load_samples(db_path, limit):
+    conn = sqlite3.connect(db_path)
+    conn.create_function("lc_decode", 1, decode_text)
+    samples = []
+    for table, columns in COMPRESSED_COLUMNS.items():
+        for column in columns:
+            rows = conn.execute(f'SELECT {column} FROM {table} WHERE {column} IS NOT NULL LIMIT ?', (limit,))
+            samples.extend(decode_text(row[0]) for row in rows)
+    conn.close()
+    return [sample for sample in samples if isinstance(sample, str) and sample]
+
+
+def measure_codec(samples, dictionary_id):
+    start = time.perf_counter()
+    encoded = [compress_bytes(sample.encode("utf-8"), dictionary_id) for sample in samples]
+    encode_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for value in encoded:
+        decode_text(value)
+    decode_seconds = time.perf_counter() - start
+    raw = sum(len(sample.encode("utf-8")) for sample in samples)
+    stored = sum(len(value) for value in encoded)
+    return {
+        'ratio': raw / stored,
+        'encode_us': encode_seconds / len(samples) * 1e6,
+        'decode_us': decode_seconds / len(samples) * 1e6,
+    }
+
+
+def measure_sqlite(samples, encode):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        conn = sqlite3.connect(path)
+        conn.create_function("lc_decode", 1, decode_text, deterministic=True)
+        conn.execute("CREATE TABLE charts (id INTEGER PRIMARY KEY, content TEXT)")
+        start = time.perf_counter()
+        conn.executemany("INSERT INTO charts (content) VALUES (?)",
+                         ((encode(sample),) for sample in samples))
+        conn.commit()
+        write_seconds = time.perf_counter() - start
+        conn.execute("VACUUM")
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        for (value,) in conn.execute("SELECT content FROM charts"):
+            decode_text(value)
+        read_seconds = time.perf_counter() - start
+        conn.close()
+    return {'size': size, 'write_ms': write_seconds * 1000, 'read_ms': read_seconds * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000, help="합성 데이터 행 수")
+    parser.add_argument("--db", help="샘플을 읽을 SQLite 파일 (생략하면 합성 데이터)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.db:
+        samples = load_samples(args.db, args.rows)
+    else:
+        samples = [synthetic_chart(rng) if index % 2 else synthetic_warning(rng) for index in range(args.rows)]
+    if not samples:
+        print("샘플이 없습니다")
+        return
+    rng.shuffle(samples)
+    # 학습용과 측정용을 나눠 사전이 측정 데이터를 외우지 않게 함
+    split = max(len(samples) // 5, 1)
+    training, measured = samples[:split], samples[split:] or samples
+
+    start = time.perf_counter()
+    dictionary = train_dictionary(training)
+    train_seconds = time.perf_counter() - start
+    compression.use_dictionaries({1: dictionary})
+
+    raw_bytes = sum(len(sample.encode("utf-8")) for sample in measured)
+    print(f"샘플 {len(measured)}행 (평균 {raw_bytes / len(measured):.0f} 바이트), "
+          f"사전 {len(dictionary)} 바이트 학습 {train_seconds * 1000:.0f}ms")
+    print(f"{'방식':<16}{'압축률':>8}{'인코딩(us/행)':>16}{'디코딩(us/행)':>16}")
+    for label, dictionary_id in (("zlib", 0), ("zlib+사전", 1)):
+        result = measure_codec(measured, dictionary_id)
+        print(f"{label:<16}{result['ratio']:>8.2f}{result['encode_us']:>16.1f}{result['decode_us']:>16.1f}")
+
+    print(f"\n{'SQLite':<16}{'파일(KB)':>10}{'쓰기(ms)':>10}{'읽기(ms)':>10}")
+    for label, encode in (("원본 TEXT", lambda text: text), ("압축(encode_text)", encode_text)):
+        result = measure_sqlite(measured, encode)
+        print(f"{label:<16}{result['size'] / 1024:>10.0f}{result['write_ms']:>10.1f}{result['read_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
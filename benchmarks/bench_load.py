@@ -0,0 +1,545 @@
+"""처방전/음성 파이프라인 전체 부하 테스트.
+
+로컬 외부 API 대역 서버(fake_upstreams.py)와 앱 서버(uvicorn)를 임시 작업 디렉터리로 띄운 뒤,
+/extract_prescription과 /transcribe_audio에 비동기로 요청을 보내 엔드포인트별 처리량과 p50/p95/p99를 잰다.
+측정 구간 앞뒤로 /metrics를 읽어 단계(stage)별 지연 시간 분위수와 캐시 적중률도 함께 보고한다.
+
+결과는 커밋별로 비교할 수 있도록 benchmarks/results/에 커밋 해시가 들어간 JSON으로 저장한다.
+
+    python benchmarks/bench_load.py --duration 60 --concurrency 8
+    python benchmarks/bench_load.py --rate 2 --mix extract_prescription=3,transcribe_audio=1
+    python benchmarks/bench_load.py --latency-scale 0.1 --duration 20 --compare latest
+    python benchmarks/bench_load.py --latency llm=pareto:2,1.5 --error-rate data_go_kr=0.02
+
+--concurrency는 응답을 받으면 바로 다음 요청을 보내는 고정 동시성(closed loop),
+--rate는 응답과 상관없이 초당 평균 rate건을 포아송 간격으로 보내는 방식(open loop)이다.
+"""
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import aiohttp
+from prometheus_client.parser import text_string_to_metric_families
+from reportlab.pdfgen import canvas
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+ENDPOINTS = {
+    "extract_prescription": "/extract_prescription",
+    "transcribe_audio": "/transcribe_audio",
+}
+PERCENTILES = (50, 95, 99)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_info():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {'commit': git("rev-parse", "--short", "HEAD"), 'subject': git("log", "-1", "--format=%s"),
+            'dirty': bool(status)}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def prescription_pdf(rng, pages=1):
+    """페이지마다 다른 문구가 들어간 PDF. OCR 페이지 캐시에 걸리지 않도록 매번 새로 만든다."""
+    buffer = io.BytesIO()
+    document = canvas.Canvas(buffer)
+    for page in range(pages):
+        document.drawString(72, 720, f"prescription {rng.getrandbits(64):016x} page {page + 1}")
+        document.showPage()
+    document.save()
+    return buffer.getvalue()
+
+
+class Payloads:
+    """요청 본문 생성기. repeat_ratio 비율만큼은 이미 보낸 파일을 다시 보낸다 (중복 업로드/캐시 경로)."""
+
+    def __init__(self, rng, pages, audio_bytes, repeat_ratio):
+        self.rng = rng
+        self.pages = pages
+        self.audio_bytes = audio_bytes
+        self.repeat_ratio = repeat_ratio
+        self.sent = defaultdict(list)
+
+    def next(self, endpoint):
+        sent = self.sent[endpoint]
+        if sent and self.rng.random() < self.repeat_ratio:
+            return self.rng.choice(sent)
+        if endpoint == "extract_prescription":
+            payload = ("prescription.pdf", prescription_pdf(self.rng, self.pages), "application/pdf")
+        else:
+            payload = ("consultation.m4a", self.rng.randbytes(self.audio_bytes), "audio/m4a")
+        if len(sent) < 100:
+            sent.append(payload)
+        return payload
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.measuring = False
+
+    def record(self, endpoint, status, elapsed):
+        if not self.measuring:
+            return
+        self.statuses[endpoint][str(status)] += 1
+        if status == 200:
+            self.latencies[endpoint].append(elapsed)
+
+    def summary(self, window):
+        result = {}
+        for endpoint in ENDPOINTS:
+            statuses = dict(self.statuses.get(endpoint, {}))
+            if not statuses:
+                continue
+            values = sorted(self.latencies.get(endpoint, []))
+            result[endpoint] = {
+                'requests': sum(statuses.values()),
+                'ok': len(values),
+                'statuses': statuses,
+                'throughput_rps': round(len(values) / window, 4),
+                'mean_s': round(sum(values) / len(values), 4) if values else None,
+                **{f"p{p}_s": round(percentile(values, p), 4) if values else None for p in PERCENTILES},
+                'max_s': round(values[-1], 4) if values else None,
+            }
+        return result
+
+
+async def send(session, base_url, endpoint, payload, timeout):
+    file_name, body, content_type = payload
+    form = aiohttp.FormData()
+    form.add_field("file", body, filename=file_name, content_type=content_type)
+    start = time.perf_counter()
+    try:
+        async with session.post(base_url + ENDPOINTS[endpoint], data=form, timeout=timeout) as response:
+            await response.read()
+            status = response.status
+    except asyncio.TimeoutError:
+        status = "timeout"
+    except aiohttp.ClientError:
+        status = "connection_error"
+    return status, time.perf_counter() - start
+
+
+async def run_load(args, base_url, recorder, on_measure_start):
+    rng = random.Random(args.seed)
+    payloads = Payloads(rng, args.pages, args.audio_kb * 1024, args.repeat_ratio)
+    endpoints, weights = zip(*args.mix.items())
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    measure_start = start + args.warmup
+    end = measure_start + args.duration
+
+    async def start_measuring():
+        await asyncio.sleep(args.warmup)
+        await on_measure_start()
+        recorder.measuring = True
+
+    async def one(session):
+        endpoint = rng.choices(endpoints, weights)[0]
+        status, elapsed = await send(session, base_url, endpoint, payloads.next(endpoint), timeout)
+        # 측정 구간이 끝난 뒤 돌아온 응답은 세지 않음
+        if loop.time() <= end:
+            recorder.record(endpoint, status, elapsed)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        measurer = asyncio.create_task(start_measuring())
+        if args.rate:
+            tasks = set()
+            while loop.time() < end:
+                if len(tasks) < args.max_in_flight:
+                    task = asyncio.create_task(one(session))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await asyncio.sleep(rng.expovariate(args.rate))
+            if tasks:
+                await asyncio.wait(tasks)
+        else:
+            async def worker():
+                while loop.time() < end:
+                    await one(session)
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        await measurer
+    return measure_start, end
+
+
+def read_metrics(text):
+    """/metrics 본문에서 단계별 히스토그램 버킷, 캐시 카운터, 업스트림 관련 카운터를 뽑는다."""
+    stages = defaultdict(lambda: defaultdict(float))
+    stage_sums = defaultdict(float)
+    caches = defaultdict(float)
+    counters = defaultdict(float)
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            labels = sample.labels
+            if sample.name == "livecare_stage_duration_seconds_bucket":
+                stages[(labels['stage'], labels['upstream'])][float(labels['le'])] += sample.value
+            elif sample.name == "livecare_stage_duration_seconds_sum":
+                stage_sums[(labels['stage'], labels['upstream'])] += sample.value
+            elif sample.name == "livecare_cache_requests_total":
+                caches[(labels['cache'], labels['result'])] += sample.value
+            elif sample.name in ("livecare_circuit_rejected_total", "livecare_upstream_hedges_total",
+                                 "livecare_deadline_exceeded_total", "livecare_admission_shed_total"):
+                key = ",".join(f"{name}={value}" for name, value in sorted(labels.items()))
+                counters[f"{sample.name}{{{key}}}"] += sample.value
+    return {'stages': stages, 'stage_sums': stage_sums, 'caches': caches, 'counters': counters}
+
+
+def bucket_percentile(buckets, p):
+    """누적 히스토그램 버킷에서 p 분위수를 버킷 안 선형 보간으로 추정한다."""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    if total <= 0:
+        return None
+    target = total * p / 100
+    previous_bound, previous_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= target:
+            if bound == float("inf"):
+                return previous_bound
+            fraction = (target - previous_count) / (count - previous_count) if count > previous_count else 1.0
+            return previous_bound + (bound - previous_bound) * fraction
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def metrics_delta(before, after, window):
+    stages = {}
+    for key, buckets in after['stages'].items():
+        base = before['stages'].get(key, {})
+        delta = {bound: count - base.get(bound, 0.0) for bound, count in buckets.items()}
+        count = delta.get(float("inf"), 0.0)
+        if count <= 0:
+            continue
+        stage, upstream = key
+        total = after['stage_sums'][key] - before['stage_sums'].get(key, 0.0)
+        stages[f"{stage}|{upstream}" if upstream else stage] = {
+            'count': int(count),
+            'rate_per_s': round(count / window, 4),
+            'mean_s': round(total / count, 4),
+            **{f"p{p}_s": round(bucket_percentile(delta, p), 4) for p in PERCENTILES},
+        }
+    caches = {}
+    for (cache, result), value in after['caches'].items():
+        caches.setdefault(cache, {'hit': 0, 'miss': 0})[result] = int(value - before['caches'].get((cache, result), 0))
+    for cache, counts in caches.items():
+        total = counts['hit'] + counts['miss']
+        counts['hit_ratio'] = round(counts['hit'] / total, 4) if total else None
+    counters = {name: int(value - before['counters'].get(name, 0.0)) for name, value in after['counters'].items()
+                if value - before['counters'].get(name, 0.0)}
+    return stages, caches, counters
+
+
+async def fetch_text(session, url):
+    async with session.get(url) as response:
+        return await response.text()
+
+
+async def wait_ready(url, process, timeout):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"서버가 시작하지 못했습니다 (종료 코드 {process.returncode}): {url}")
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=2)) as response:
+                    if response.status == 200:
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"서버 준비 대기 시간 초과: {url}")
+
+
+def app_environment(args, work_dir, fake_url):
+    env = dict(os.environ)
+    env.update({
+        # 실제 외부 API 대신 대역 서버 사용
+        'UPSTAGE_OCR_URL': f"{fake_url}/v1/document-ai/ocr",
+        'UPSTAGE_API_KEY': "bench",
+        'UPSTAGE_API_BASE': f"{fake_url}/v1/solar",
+        'OPENAI_BASE_URL': f"{fake_url}/v1",
+        'OPENAI_API_BASE': f"{fake_url}/v1",
+        'OPENAI_API_KEY': "bench",
+        'CLOVA_SPEECH_INVOKE_URL': fake_url,
+        'CLOVA_SPEECH_SECRET_KEY': "bench",
+        'DATA_GO_KR_BASE_URL': f"{fake_url}/1471000",
+        'OPEN_DATA_API_KEY': "bench",
+        'S3_ENDPOINT_URL': fake_url,
+        'NAVER_ACCESS_KEY': "bench",
+        'NAVER_SECRET_KEY': "bench",
+        'AWS_EC2_METADATA_DISABLED': "true",
+        # LangSmith로 추적을 보내지 않음
+        'LANGCHAIN_API_KEY': "",
+        'LANGCHAIN_TRACING_V2': "false",
+        'TRACE_EXPORTER': "none",
+        # 실행마다 빈 DB와 임시 디렉터리 사용 (저장소의 medical_data.db, logs/, tmp/를 건드리지 않음)
+        'DATABASE_PATH': os.path.join(work_dir, "bench.db"),
+        'LOG_DIR': os.path.join(work_dir, "logs"),
+        'LOG_LEVEL': "WARNING",
+        'UPLOAD_SPOOL_DIR': os.path.join(work_dir, "uploads"),
+        'JOB_SPOOL_DIR': os.path.join(work_dir, "jobs"),
+        'S3_UPLOAD_QUEUE_DIR': os.path.join(work_dir, "s3_queue"),
+        'CHART_PDF_CACHE_DIR': os.path.join(work_dir, "chart_pdf"),
+        'PROFILE_DIR': os.path.join(work_dir, "profiles"),
+    })
+    for assignment in args.app_env or []:
+        name, _, value = assignment.partition("=")
+        env[name] = value
+    return env
+
+
+def start_process(command, env, log_path):
+    log = open(log_path, "w", encoding="utf-8")
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT), log
+
+
+def stop_process(process, log):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    log.close()
+
+
+async def benchmark(args, work_dir):
+    fake_port, app_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+
+    fake_command = [sys.executable, os.path.join(BENCH_DIR, "fake_upstreams.py"), "--port", str(fake_port),
+                    "--latency-scale", str(args.latency_scale), "--unlabeled-ratio", str(args.unlabeled_ratio),
+                    "--seed", str(args.seed)]
+    for latency in args.latency or []:
+        fake_command += ["--latency", latency]
+    for error_rate in args.error_rate or []:
+        fake_command += ["--error-rate", error_rate]
+    app_command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+                   "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"]
+
+    fake, fake_log = start_process(fake_command, dict(os.environ), os.path.join(work_dir, "fake_upstreams.log"))
+    app = app_log = None
+    try:
+        await wait_ready(f"{fake_url}/_stats", fake, 30)
+        app, app_log = start_process(app_command, app_environment(args, work_dir, fake_url),
+                                     os.path.join(work_dir, "app.log"))
+        started = time.perf_counter()
+        await wait_ready(f"{app_url}/metrics", app, args.startup_timeout)
+        startup_seconds = time.perf_counter() - started
+        print(f"서버 준비 완료 ({startup_seconds:.1f}초), 워밍업 {args.warmup:.0f}초 + 측정 {args.duration:.0f}초")
+
+        recorder = Recorder()
+        snapshots = {}
+
+        async with aiohttp.ClientSession() as session:
+            async def on_measure_start():
+                snapshots['before'] = read_metrics(await fetch_text(session, f"{app_url}/metrics"))
+                await session.post(f"{fake_url}/_reset")
+
+            measure_start, end = await run_load(args, app_url, recorder, on_measure_start)
+            snapshots['after'] = read_metrics(await fetch_text(session, f"{app_url}/metrics"))
+            upstream_calls = json.loads(await fetch_text(session, f"{fake_url}/_stats"))
+    finally:
+        if app is not None:
+            stop_process(app, app_log)
+        stop_process(fake, fake_log)
+
+    window = end - measure_start
+    stages, caches, counters = metrics_delta(snapshots['before'], snapshots['after'], window)
+    return {
+        'startup_seconds': round(startup_seconds, 3),
+        'window_seconds': round(window, 3),
+        'endpoints': recorder.summary(window),
+        'stages': stages,
+        'caches': caches,
+        'resilience': counters,
+        'upstream_calls': upstream_calls,
+    }
+
+
+def config_of(args):
+    keys = ("duration", "warmup", "concurrency", "rate", "max_in_flight", "mix", "workers", "latency",
+            "latency_scale", "error_rate", "unlabeled_ratio", "repeat_ratio", "pages", "audio_kb", "seed", "app_env")
+    return {key: getattr(args, key) for key in keys}
+
+
+def print_report(result):
+    print(f"\n{'엔드포인트':<24}{'요청':>7}{'성공':>7}{'처리량(rps)':>13}{'p50(s)':>9}{'p95(s)':>9}{'p99(s)':>9}  상태")
+    for endpoint, stats in result['endpoints'].items():
+        def fmt(value):
+            return f"{value:>9.3f}" if value is not None else f"{'-':>9}"
+        print(f"{endpoint:<24}{stats['requests']:>7}{stats['ok']:>7}{stats['throughput_rps']:>13.3f}"
+              f"{fmt(stats['p50_s'])}{fmt(stats['p95_s'])}{fmt(stats['p99_s'])}  {stats['statuses']}")
+
+    print(f"\n{'단계|업스트림':<52}{'횟수':>7}{'평균(s)':>9}{'p50(s)':>9}{'p95(s)':>9}{'p99(s)':>9}")
+    for stage, stats in sorted(result['stages'].items(), key=lambda item: -item[1]['mean_s'] * item[1]['count']):
+        print(f"{stage[:51]:<52}{stats['count']:>7}{stats['mean_s']:>9.3f}{stats['p50_s']:>9.3f}"
+              f"{stats['p95_s']:>9.3f}{stats['p99_s']:>9.3f}")
+
+    if result['caches']:
+        print("\n캐시 적중률: " + ", ".join(f"{cache} {counts['hit_ratio']:.0%}" for cache, counts in
+                                     sorted(result['caches'].items()) if counts['hit_ratio'] is not None))
+    if result['resilience']:
+        print("거절/헤지/마감 초과: " + ", ".join(f"{name} {value}" for name, value in result['resilience'].items()))
+    calls = result['upstream_calls'].get('calls', {})
+    if calls:
+        print("업스트림 호출: " + ", ".join(f"{name} {count}" for name, count in sorted(calls.items())))
+
+
+def find_baseline(path, current_path):
+    if path != "latest":
+        return path
+    candidates = sorted(set(glob.glob(os.path.join(RESULTS_DIR, "*.json"))) - {current_path}, key=os.path.getmtime)
+    return candidates[-1] if candidates else None
+
+
+def print_comparison(result, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    base_commit = baseline['git']['commit']
+    print(f"\n비교 기준: {os.path.basename(baseline_path)} ({base_commit}: {baseline['git']['subject']})")
+    if baseline['config'] != result['config']:
+        different = sorted(key for key in result['config'] if baseline['config'].get(key) != result['config'][key])
+        print(f"  주의: 실행 설정이 다릅니다 ({', '.join(different)})")
+
+    def change(current, previous):
+        if current is None or previous is None:
+            return f"{'-':>22}"
+        ratio = (current / previous - 1) * 100 if previous else 0.0
+        return f"{previous:>8.3f} -> {current:>7.3f} {ratio:>+5.0f}%"
+
+    for endpoint, stats in result['endpoints'].items():
+        previous = baseline['endpoints'].get(endpoint)
+        if previous is None:
+            continue
+        print(f"  {endpoint}")
+        for key in ("throughput_rps", "p50_s", "p95_s", "p99_s"):
+            print(f"    {key:<16}{change(stats[key], previous[key])}")
+    regressions = []
+    for stage, stats in result['stages'].items():
+        previous = baseline['stages'].get(stage)
+        if previous and previous['p95_s'] and stats['p95_s'] > previous['p95_s'] * 1.2 and stats['p95_s'] > 0.05:
+            regressions.append(f"{stage} p95 {change(stats['p95_s'], previous['p95_s']).strip()}")
+    if regressions:
+        print("  p95가 20% 넘게 늘어난 단계:")
+        for line in regressions:
+            print(f"    {line}")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"알 수 없는 엔드포인트: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=60, help="측정 시간(초)")
+    parser.add_argument("--warmup", type=float, default=10, help="측정 전 워밍업 시간(초)")
+    parser.add_argument("--concurrency", type=int, default=8, help="고정 동시 요청 수 (closed loop)")
+    parser.add_argument("--rate", type=float, help="초당 평균 요청 수 (open loop, 지정하면 --concurrency 대신 사용)")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="--rate 사용 시 최대 동시 요청 수")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("extract_prescription=4,transcribe_audio=1"),
+                        help="엔드포인트별 요청 비중")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="uvicorn 워커 수 (2 이상이면 /metrics가 워커 하나의 값이라 단계별 수치는 참고용)")
+    parser.add_argument("--latency", action="append", metavar="업스트림=분포",
+                        help="대역 서버 지연 시간 분포 (fake_upstreams.py 참고)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="모든 업스트림 지연 시간 배율")
+    parser.add_argument("--error-rate", action="append", metavar="업스트림=비율", help="업스트림 503 응답 비율")
+    parser.add_argument("--unlabeled-ratio", type=float, default=0.2, help="LLM 메타데이터 추출로 넘어가는 처방전 비율")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="이미 보낸 파일을 다시 보내는 비율")
+    parser.add_argument("--pages", type=int, default=1, help="처방전 PDF 페이지 수")
+    parser.add_argument("--audio-kb", type=int, default=256, help="음성 파일 크기(KB)")
+    parser.add_argument("--request-timeout", type=float, default=300)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--app-env", action="append", metavar="이름=값", help="앱 서버에 추가로 줄 환경 변수")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--label", default="", help="결과 파일 이름에 붙일 이름")
+    parser.add_argument("--compare", metavar="결과파일|latest", help="이전 결과와 비교")
+    parser.add_argument("--no-save", action="store_true", help="결과 파일을 저장하지 않음")
+    parser.add_argument("--keep", action="store_true", help="작업 디렉터리(DB, 서버 로그)를 지우지 않음")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="livecare-bench-")
+    try:
+        measured = asyncio.run(benchmark(args, work_dir))
+    except BaseException:
+        # 실패하면 서버 로그를 볼 수 있도록 작업 디렉터리를 남김
+        print(f"서버 로그: {work_dir}")
+        raise
+    if not args.keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    git = git_info()
+    result = {
+        'git': git,
+        'timestamp': datetime.now().isoformat(timespec="seconds"),
+        'label': args.label,
+        'config': config_of(args),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        **measured,
+    }
+    print_report(result)
+
+    path = None
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = f"{datetime.now():%Y%m%d-%H%M%S}_{git['commit'] or 'nogit'}{'-dirty' if git['dirty'] else ''}"
+        path = os.path.join(RESULTS_DIR, f"{name}{'_' + args.label if args.label else ''}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n결과 저장: {os.path.relpath(path, ROOT)}")
+    if args.compare:
+        baseline = find_baseline(args.compare, path)
+        if baseline:
+            print_comparison(result, baseline)
+        else:
+            print("\n비교할 이전 결과가 없습니다")
+    if args.keep:
+        print(f"작업 디렉터리: {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
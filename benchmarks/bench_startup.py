@@ -0,0 +1,291 @@
+"""서버 시작 시간과 메모리 사용량 측정.
+
+`import main`에 걸리는 시간, 프로세스를 띄운 뒤 /metrics가 200을 돌려줄 때까지의 시간,
+준비 직후와 첫 요청 처리 뒤의 메모리(RSS/PSS, 마스터·워커·프로세스 풀 합계)를 잰다.
+단일 프로세스(uvicorn)와 serve.py(gunicorn preload + 워커 N개)를 함께 측정해 비교한다.
+외부 API는 bench_load.py와 같은 대역 서버(fake_upstreams.py)를 쓴다.
+
+결과는 benchmarks/results/startup/에 커밋 해시가 들어간 JSON으로 저장한다.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 5 --workers 4 --compare latest
+    python benchmarks/bench_startup.py --server uvicorn --repeat 3
+
+PSS는 워커끼리 공유하는 페이지(fork 전에 import한 모듈)를 나눠 센 값이라, 워커 수가 늘 때 실제로 늘어나는 메모리에 가깝다.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import aiohttp
+
+from bench_load import (BENCH_DIR, ROOT, Payloads, app_environment, free_port, git_info, send, start_process,
+                        stop_process, wait_ready)
+
+STARTUP_RESULTS_DIR = os.path.join(BENCH_DIR, "results", "startup")
+
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def read_memory(pid):
+    """프로세스 하나의 RSS/PSS(KB). smaps_rollup이 없으면 PSS는 None."""
+    rss = pss = None
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    rss = int(line.split()[1])
+                elif line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+    except OSError:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss = int(line.split()[1])
+        except OSError:
+            pass
+    return rss, pss
+
+
+def process_tree(root_pid):
+    """root_pid와 모든 자손 프로세스의 pid."""
+    children = {}
+    for stat_path in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat_path) as f:
+                # 프로세스 이름에 공백이나 괄호가 있을 수 있으므로 마지막 ')' 뒤부터 읽음
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat_path.split("/")[2]))
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def tree_memory(root_pid):
+    pids = process_tree(root_pid)
+    rss = pss = 0
+    for pid in pids:
+        process_rss, process_pss = read_memory(pid)
+        rss += process_rss or 0
+        pss = None if pss is None or process_pss is None else pss + process_pss
+    return {'processes': len(pids), 'rss_mb': round(rss / 1024, 1),
+            'pss_mb': round(pss / 1024, 1) if pss is not None else None}
+
+
+async def run_import(env):
+    """새 인터프리터에서 `import main` 시간(초)과 최대 RSS(MB)."""
+    script = IMPORT_SCRIPT + "; import resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    process = await asyncio.create_subprocess_exec(sys.executable, "-c", script, cwd=ROOT, env=env,
+                                                   stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"import main 실패 (종료 코드 {process.returncode})")
+    seconds, max_rss = stdout.decode().split()[-2:]
+    return float(seconds), int(max_rss) / 1024
+
+
+def server_command(server, port):
+    if server == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+                "--log-level", "warning", "--no-access-log"]
+    return [sys.executable, os.path.join(ROOT, "serve.py")]
+
+
+async def run_server(args, server, work_dir, fake_url, run):
+    port = free_port()
+    app_url = f"http://127.0.0.1:{port}"
+    env = app_environment(args, work_dir, fake_url)
+    env.update({'HOST': "127.0.0.1", 'PORT': str(port)})
+    if server == "serve":
+        env['WEB_CONCURRENCY'] = str(args.workers)
+        # serve.py가 시작할 때 비우고 만든다
+        env['PROMETHEUS_MULTIPROC_DIR'] = os.path.join(work_dir, f"prometheus_{run}")
+    else:
+        # uvicorn도 WEB_CONCURRENCY를 워커 수로 읽으므로 단일 프로세스로 고정
+        env.pop('WEB_CONCURRENCY', None)
+        env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    process, log = start_process(server_command(server, port), env,
+                                 os.path.join(work_dir, f"{server}_{run}.log"))
+    try:
+        started = time.perf_counter()
+        await wait_ready(f"{app_url}/metrics", process, args.startup_timeout)
+        ready_seconds = time.perf_counter() - started
+        # 다른 워커들이 부팅을 마치도록 잠시 기다린 뒤 측정
+        await asyncio.sleep(args.settle)
+        ready_memory = tree_memory(process.pid)
+
+        payloads = Payloads(random.Random(args.seed + run), 1, 64 * 1024, 0.0)
+        requests = args.requests or (args.workers if server == "serve" else 1)
+        async with aiohttp.ClientSession() as session:
+            results = await asyncio.gather(*(send(session, app_url, "extract_prescription",
+                                                  payloads.next("extract_prescription"), args.request_timeout)
+                                             for _ in range(requests)))
+        statuses = sorted({str(status) for status, _ in results})
+        await asyncio.sleep(args.settle)
+        served_memory = tree_memory(process.pid)
+    finally:
+        stop_process(process, log)
+    return {
+        'ready_seconds': round(ready_seconds, 3),
+        'first_request_seconds': round(max(elapsed for _, elapsed in results), 3),
+        'first_request_statuses': statuses,
+        'ready': ready_memory,
+        'after_first_requests': served_memory,
+    }
+
+
+def median_of(runs, *keys):
+    values = []
+    for run in runs:
+        value = run
+        for key in keys:
+            value = value[key]
+        if value is not None:
+            values.append(value)
+    return round(statistics.median(values), 3) if values else None
+
+
+SUMMARY_KEYS = {
+    'ready_seconds': ("ready_seconds",),
+    'first_request_seconds': ("first_request_seconds",),
+    'ready_rss_mb': ("ready", "rss_mb"),
+    'ready_pss_mb': ("ready", "pss_mb"),
+    'served_rss_mb': ("after_first_requests", "rss_mb"),
+    'served_pss_mb': ("after_first_requests", "pss_mb"),
+}
+
+
+async def benchmark(args, work_dir):
+    fake_port = free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fake_command = [sys.executable, os.path.join(BENCH_DIR, "fake_upstreams.py"), "--port", str(fake_port),
+                    "--latency-scale", "0.05", "--seed", str(args.seed)]
+    fake, fake_log = start_process(fake_command, dict(os.environ), os.path.join(work_dir, "fake_upstreams.log"))
+    try:
+        await wait_ready(f"{fake_url}/_stats", fake, 30)
+        env = app_environment(args, work_dir, fake_url)
+        imports = [await run_import(env) for _ in range(args.repeat)]
+        result = {'import_main': {'seconds': round(statistics.median(seconds for seconds, _ in imports), 3),
+                                  'max_rss_mb': round(statistics.median(rss for _, rss in imports), 1),
+                                  'runs': [round(seconds, 3) for seconds, _ in imports]},
+                  'servers': {}}
+        print(f"import main: {result['import_main']['seconds']:.3f}초, 최대 RSS {result['import_main']['max_rss_mb']:.0f}MB")
+
+        for server in args.server:
+            runs = []
+            for run in range(args.repeat):
+                runs.append(await run_server(args, server, work_dir, fake_url, run))
+            summary = {name: median_of(runs, *keys) for name, keys in SUMMARY_KEYS.items()}
+            summary['processes'] = runs[-1]['after_first_requests']['processes']
+            result['servers'][server] = {**summary, 'runs': runs}
+            print(f"{server}: 준비 {summary['ready_seconds']:.2f}초, 첫 요청 {summary['first_request_seconds']:.2f}초, "
+                  f"RSS {summary['ready_rss_mb']}MB -> {summary['served_rss_mb']}MB, "
+                  f"PSS {summary['ready_pss_mb']}MB -> {summary['served_pss_mb']}MB ({summary['processes']}개 프로세스)")
+    finally:
+        stop_process(fake, fake_log)
+    return result
+
+
+def find_baseline(path, current_path):
+    if path != "latest":
+        return path
+    candidates = sorted(set(glob.glob(os.path.join(STARTUP_RESULTS_DIR, "*.json"))) - {current_path},
+                        key=os.path.getmtime)
+    return candidates[-1] if candidates else None
+
+
+def print_comparison(result, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\n비교 기준: {os.path.basename(baseline_path)} ({baseline['git']['commit']}: {baseline['git']['subject']})")
+    if baseline['config'] != result['config']:
+        different = sorted(key for key in result['config'] if baseline['config'].get(key) != result['config'][key])
+        print(f"  주의: 실행 설정이 다릅니다 ({', '.join(different)})")
+
+    def change(current, previous):
+        if current is None or previous is None:
+            return f"{'-':>24}"
+        ratio = (current / previous - 1) * 100 if previous else 0.0
+        return f"{previous:>9.3f} -> {current:>8.3f} {ratio:>+5.0f}%"
+
+    print(f"  {'import main (s)':<28}{change(result['import_main']['seconds'], baseline['import_main']['seconds'])}")
+    for server, summary in result['servers'].items():
+        previous = baseline['servers'].get(server)
+        if previous is None:
+            continue
+        print(f"  {server}")
+        for key in SUMMARY_KEYS:
+            print(f"    {key:<26}{change(summary[key], previous.get(key))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", action="append", choices=("uvicorn", "serve"),
+                        help="측정할 실행 방식 (기본: 둘 다)")
+    parser.add_argument("--workers", type=int, default=2, help="serve.py 워커 수")
+    parser.add_argument("--repeat", type=int, default=3, help="반복 횟수 (중앙값 사용)")
+    parser.add_argument("--requests", type=int, help="준비 뒤 동시에 보낼 요청 수 (기본: 워커 수)")
+    parser.add_argument("--settle", type=float, default=1.0, help="메모리 측정 전 대기 시간(초)")
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--app-env", action="append", metavar="이름=값", help="앱 서버에 추가로 줄 환경 변수")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--label", default="", help="결과 파일 이름에 붙일 이름")
+    parser.add_argument("--compare", metavar="결과파일|latest", help="이전 결과와 비교")
+    parser.add_argument("--no-save", action="store_true", help="결과 파일을 저장하지 않음")
+    args = parser.parse_args()
+    args.server = args.server or ["uvicorn", "serve"]
+
+    work_dir = tempfile.mkdtemp(prefix="livecare-startup-")
+    try:
+        measured = asyncio.run(benchmark(args, work_dir))
+    except BaseException:
+        print(f"서버 로그: {work_dir}")
+        raise
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    git = git_info()
+    result = {
+        'git': git,
+        'timestamp': datetime.now().isoformat(timespec="seconds"),
+        'label': args.label,
+        'config': {key: getattr(args, key) for key in ("server", "workers", "repeat", "requests", "settle",
+                                                        "seed", "app_env")},
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        **measured,
+    }
+
+    path = None
+    if not args.no_save:
+        os.makedirs(STARTUP_RESULTS_DIR, exist_ok=True)
+        name = f"{datetime.now():%Y%m%d-%H%M%S}_{git['commit'] or 'nogit'}{'-dirty' if git['dirty'] else ''}"
+        path = os.path.join(STARTUP_RESULTS_DIR, f"{name}{'_' + args.label if args.label else ''}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n결과 저장: {os.path.relpath(path, ROOT)}")
+    if args.compare:
+        baseline = find_baseline(args.compare, path)
+        if baseline:
+            print_comparison(result, baseline)
+        else:
+            print("\n비교할 이전 결과가 없습니다")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""부하 테스트용 외부 API 대역 서버.
+
+Upstage OCR, Clova Speech, 공공데이터포털(낱알식별/의약품 허가정보), OpenAI/Upstage 채팅 API,
+S3(NCP Object Storage)를 포트 하나에서 흉내 낸다. 응답은 실제 API와 같은 형식의 고정 데이터(무작위 환자/약품)이고,
+업스트림별 지연 시간 분포와 오류(503) 비율을 정할 수 있다. 유료·호출 제한 API를 부르지 않고 부하 테스트를 하기 위한 것.
+
+    python benchmarks/fake_upstreams.py --port 18080 --latency ocr=lognormal:1.2,0.35 --error-rate data_go_kr=0.01
+
+bench_load.py가 자동으로 띄우므로 보통 직접 실행할 일은 없다. GET /_stats로 업스트림별 호출 수를 볼 수 있다.
+
+지연 시간 분포 형식:
+    fixed:초                 항상 같은 지연
+    uniform:최소,최대
+    lognormal:중앙값,sigma   대부분의 API 응답 시간 (긴 꼬리)
+    pareto:최소,alpha        꼬리가 더 두꺼운 분포 (alpha가 작을수록 느린 응답이 잦음)
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from collections import defaultdict
+
+from aiohttp import web
+
+UPSTREAMS = ("ocr", "stt", "data_go_kr", "llm", "s3")
+
+# 실제 서비스에서 관찰한 대략적인 응답 시간
+DEFAULT_LATENCY = {
+    "ocr": "lognormal:1.5,0.35",
+    "stt": "lognormal:3.0,0.3",
+    "data_go_kr": "lognormal:0.15,0.5",
+    "llm": "lognormal:4.0,0.4",
+    "s3": "lognormal:0.08,0.4",
+}
+
+SURNAMES = "김이박최정강조윤장임한오서신권황안송류홍"
+GIVEN_SYLLABLES = "민서지현우준영수진하은도윤성호경미정태희"
+
+# (품목명, 성분명, 분량, 단위)
+DRUGS = [
+    ("타이레놀정500밀리그램", "아세트아미노펜", "500", "밀리그램"),
+    ("아스피린프로텍트정100밀리그램", "아스피린", "100", "밀리그램"),
+    ("부루펜정200밀리그램", "이부프로펜", "200", "밀리그램"),
+    ("아목시실린캡슐500밀리그램", "아목시실린수화물", "500", "밀리그램"),
+    ("오구멘틴정375밀리그램", "아목시실린수화물", "250", "밀리그램"),
+    ("지르텍정10밀리그램", "세티리진염산염", "10", "밀리그램"),
+    ("클라리틴정10밀리그램", "로라타딘", "10", "밀리그램"),
+    ("오메프라졸캡슐20밀리그램", "오메프라졸", "20", "밀리그램"),
+    ("넥시움정40밀리그램", "에스오메프라졸마그네슘삼수화물", "40", "밀리그램"),
+    ("다이아벡스정500밀리그램", "메트포르민염산염", "500", "밀리그램"),
+    ("노바스크정5밀리그램", "암로디핀베실산염", "5", "밀리그램"),
+    ("리피토정10밀리그램", "아토르바스타틴칼슘삼수화물", "10", "밀리그램"),
+    ("크레스토정10밀리그램", "로수바스타틴칼슘", "10", "밀리그램"),
+    ("코자정50밀리그램", "로사르탄칼륨", "50", "밀리그램"),
+    ("자누비아정100밀리그램", "시타글립틴인산염수화물", "100", "밀리그램"),
+    ("무코스타정100밀리그램", "레바미피드", "100", "밀리그램"),
+    ("뮤테란캡슐200밀리그램", "아세틸시스테인", "200", "밀리그램"),
+    ("코대원정", "디히드로코데인타르타르산염", "5", "밀리그램"),
+    ("슈다페드정60밀리그램", "슈도에페드린염산염", "60", "밀리그램"),
+    ("록소닌정60밀리그램", "록소프로펜나트륨수화물", "60", "밀리그램"),
+    ("쎄레브렉스캡슐200밀리그램", "세레콕시브", "200", "밀리그램"),
+    ("스티렌정60밀리그램", "애엽95%에탄올연조엑스", "60", "밀리그램"),
+    ("가스모틴정5밀리그램", "모사프리드시트르산염수화물", "5", "밀리그램"),
+    ("씨잘정5밀리그램", "레보세티리진염산염", "5", "밀리그램"),
+]
+
+WARNING_SENTENCES = [
+    "이 약에 과민증 환자에는 투여하지 말 것",
+    "간장애 또는 신장애 환자에는 신중히 투여할 것",
+    "임부 또는 임신하고 있을 가능성이 있는 여성은 치료상의 유익성이 위험성을 상회한다고 판단되는 경우에만 투여할 것",
+    "정해진 용법과 용량을 잘 지킬 것",
+    "어린이의 손이 닿지 않는 곳에 보관할 것",
+    "복용 중 발진, 가려움, 구역, 구토 등이 나타나면 즉시 복용을 중지하고 의사 또는 약사와 상의할 것",
+]
+
+CONVERSATION = [
+    ("의사", "어디가 불편해서 오셨어요?"),
+    ("환자", "사흘 전부터 열이 나고 목이 많이 아파요."),
+    ("의사", "기침이나 가래도 있으세요?"),
+    ("환자", "기침은 조금 있고 가래는 거의 없어요."),
+    ("의사", "드시고 계신 약이나 알레르기 있는 약 있으세요?"),
+    ("환자", "혈압약을 먹고 있고 알레르기는 없어요."),
+    ("의사", "목이 많이 부어 있네요. 해열진통제와 소염제를 처방해 드릴게요."),
+    ("환자", "하루에 몇 번 먹으면 되나요?"),
+    ("의사", "하루 세 번 식후에 드시고 사흘 뒤에도 열이 나면 다시 오세요."),
+]
+
+
+class Latency:
+    """지연 시간 분포 하나. spec 형식은 모듈 docstring 참고."""
+
+    def __init__(self, spec, scale=1.0):
+        self.spec = spec
+        self.scale = scale
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(value) for value in params.split(",") if value]
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2, "pareto": 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"잘못된 지연 시간 분포: {spec}")
+
+    def sample(self, rng):
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "lognormal":
+            median, sigma = self.params
+            value = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        else:
+            minimum, alpha = self.params
+            value = minimum * rng.paretovariate(alpha)
+        return max(value, 0.0) * self.scale
+
+
+def random_name(rng):
+    return rng.choice(SURNAMES) + "".join(rng.choice(GIVEN_SYLLABLES) for _ in range(2))
+
+
+def random_rrn(rng):
+    year = rng.randint(30, 99)
+    return f"{year:02d}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}-{rng.choice('12')}******"
+
+
+def _word(index, text, x, y, width, height=24):
+    return {
+        'boundingBox': {'vertices': [{'x': x, 'y': y}, {'x': x + width, 'y': y},
+                                     {'x': x + width, 'y': y + height}, {'x': x, 'y': y + height}]},
+        'confidence': 0.97,
+        'id': index,
+        'text': text,
+    }
+
+
+def ocr_payload(rng, unlabeled=False, min_drugs=2, max_drugs=4):
+    """표준 처방전 서식의 Upstage OCR 응답. 단어 좌표가 있어 layout.extract_regions가 약품 표를 찾는다."""
+    name = random_name(rng)
+    drugs = rng.sample(DRUGS, rng.randint(min_drugs, max_drugs))
+    rows = [
+        [("처방전", 400)],
+        [("교부연월일", 80), (f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", 220)],
+        # unlabeled: 규칙 추출이 실패해 LLM 메타데이터 추출로 넘어가는 서식
+        [(name, 80), (random_rrn(rng), 220)] if unlabeled else
+        [("성명", 80), (name, 160), ("주민등록번호", 320), (random_rrn(rng), 480)],
+        [("처방", 80), ("의약품의", 150), ("명칭", 260), ("1회", 600), ("투약량", 650),
+         ("1일", 760), ("투여횟수", 810), ("총", 920), ("투약일수", 950)],
+    ]
+    for item_name, *_ in drugs:
+        rows.append([(item_name, 80), (str(rng.choice([1, 2])), 620), (str(rng.choice([2, 3])), 790),
+                     (str(rng.randint(3, 7)), 960)])
+    rows.append([("주사제", 80), ("처방내역", 160)])
+    rows.append([("의료기관", 80), ("라이브케어의원", 200)])
+
+    words = []
+    lines = []
+    for row_index, row in enumerate(rows):
+        y = 100 + row_index * 40
+        for text, x in row:
+            words.append(_word(len(words), text, x, y, 20 * len(text)))
+        lines.append(" ".join(text for text, _ in row))
+    text = "\n".join(lines)
+    return {
+        'apiVersion': '1.1',
+        'confidence': 0.97,
+        'metadata': {'pages': [{'height': 1600, 'page': 1, 'width': 1200}]},
+        'mimeType': 'multipart/form-data',
+        'modelVersion': 'ocr-2.2.1',
+        'numBilledPages': 1,
+        'pages': [{'confidence': 0.97, 'height': 1600, 'id': 0, 'text': text, 'width': 1200, 'words': words}],
+        'stored': False,
+        'text': text,
+    }
+
+
+def stt_payload(rng, repeat=3):
+    segments = []
+    start = 0
+    for _ in range(repeat):
+        for speaker, text in CONVERSATION:
+            duration = 600 + 90 * len(text) + rng.randint(0, 400)
+            segments.append({
+                'start': start,
+                'end': start + duration,
+                'text': text,
+                'confidence': round(rng.uniform(0.85, 0.99), 4),
+                'speaker': {'label': '1' if speaker == "의사" else '2', 'name': 'A' if speaker == "의사" else 'B'},
+            })
+            start += duration
+    return {
+        'result': 'COMPLETED',
+        'message': 'Succeeded',
+        'token': uuid.uuid4().hex,
+        'version': 'ncp_v2_v2.3.0',
+        'progress': 100,
+        'segments': segments,
+        'text': " ".join(segment['text'] for segment in segments),
+        'confidence': 0.93,
+        'speakers': [{'label': '1', 'name': 'A'}, {'label': '2', 'name': 'B'}],
+    }
+
+
+def pill_item(seq, item_name):
+    return {
+        'ITEM_SEQ': f"2000{seq:05d}", 'ITEM_NAME': item_name, 'ENTP_NAME': '(주)라이브제약',
+        'CHART': '흰색의 원형 필름코팅정', 'DRUG_SHAPE': '원형', 'COLOR_CLASS1': '하양',
+        'PRINT_FRONT': f"LC{seq}", 'LENG_LONG': '9.1', 'LENG_SHORT': '9.1', 'THICK': '4.2',
+        'CLASS_NAME': '해열.진통.소염제', 'ETC_OTC_NAME': '전문의약품', 'FORM_CODE_NAME': '필름코팅정',
+    }
+
+
+def permit_item(seq, drug, rng):
+    item_name, ingredient, amount, unit = drug
+    doc = "".join(f'<ARTICLE title="{index + 1}. 주의"><PARAGRAPH><![CDATA[{sentence}]]></PARAGRAPH></ARTICLE>'
+                  for index, sentence in enumerate(rng.sample(WARNING_SENTENCES, 4)))
+    return {
+        'ITEM_SEQ': f"2000{seq:05d}", 'ITEM_NAME': item_name, 'ENTP_NAME': '(주)라이브제약',
+        'ITEM_PERMIT_DATE': '20100101', 'ETC_OTC_CODE': '전문의약품', 'CHART': '흰색의 원형 필름코팅정',
+        'MATERIAL_NAME': f"총량 : 1정 중|성분명 : {ingredient}|분량 : {amount}|단위 : {unit}|규격 : KP|",
+        'STORAGE_METHOD': '기밀용기, 실온(1~30℃)보관', 'VALID_TERM': '제조일로부터 36 개월',
+        'PACK_UNIT': '30정/병', 'PERMIT_KIND_NAME': '허가', 'MAKE_MATERIAL_FLAG': '완제의약품',
+        'REEXAM_TARGET': None, 'REEXAM_DATE': None,
+        'EE_DOC_DATA': f'<DOC title="효능효과"><ARTICLE title=""><PARAGRAPH><![CDATA[{ingredient} 함유 제제의 효능]]></PARAGRAPH></ARTICLE></DOC>',
+        'UD_DOC_DATA': '<DOC title="용법용량"><ARTICLE title=""><PARAGRAPH><![CDATA[성인 1회 1정, 1일 3회 식후 복용]]></PARAGRAPH></ARTICLE></DOC>',
+        'PN_DOC_DATA': f'<DOC title="사용상의주의사항">{doc}</DOC>',
+        'NB_DOC_DATA': f'<DOC title="사용상의주의사항">{doc * 3}</DOC>',
+    }
+
+
+def data_go_kr_payload(items):
+    header = {'resultCode': '00', 'resultMsg': 'NORMAL SERVICE.'}
+    if not items:
+        # 실제 API처럼 결과가 없으면 items 없이 totalCount 0
+        return {'header': header, 'body': {'pageNo': 1, 'totalCount': 0, 'numOfRows': 30}}
+    return {'header': header, 'body': {'pageNo': 1, 'totalCount': len(items), 'numOfRows': 30, 'items': items}}
+
+
+def chat_content(kind, rng):
+    if kind == "extract_metadata":
+        return json.dumps({'name': random_name(rng), 'age': rng.randint(20, 90), 'gender': rng.choice(["남", "여"]),
+                           'birth_date': f"19{rng.randint(30, 99)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"},
+                          ensure_ascii=False)
+    if kind == "create_medical_chart":
+        return "\n".join(["## 주관적 소견", "3일 전부터 발열과 인후통 호소", "## 객관적 소견", "인후 발적, 체온 38.2도",
+                          "## 평가", "급성 인두염 의심", "## 계획", "해열진통제, 소염제 3일분 처방"] * 4)
+    if kind == "summarize_drug_info":
+        return " ".join(rng.sample(WARNING_SENTENCES, 4)) * 2
+    return "\n".join(f"## {index}. {title}\n" + " ".join(rng.sample(WARNING_SENTENCES, 3))
+                     for index, title in enumerate(["환자 요약", "약물 상호작용", "약사 상담", "영양사 상담",
+                                                    "간호 계획", "추적 관찰"], start=1)) * 2
+
+
+def classify_prompt(messages):
+    # langchain_handler가 쓰는 프롬프트 파일별 고유 문구로 어떤 호출인지 구분
+    text = " ".join(str(message.get('content', '')) for message in messages)
+    if "extracting metadata" in text:
+        return "extract_metadata"
+    if "medical chart" in text:
+        return "create_medical_chart"
+    if "summarize documents" in text:
+        return "summarize_drug_info"
+    return "create_multidisciplinary_care"
+
+
+class FakeUpstreams:
+    def __init__(self, latency, error_rate, seed=None, unlabeled_ratio=0.2, bucket="livecare"):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.unlabeled_ratio = unlabeled_ratio
+        self.bucket = bucket
+        self.objects = {}
+        self.multipart = {}
+        self.calls = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.busy_seconds = defaultdict(float)
+        self.in_flight = defaultdict(int)
+        self.max_in_flight = defaultdict(int)
+
+    async def simulate(self, upstream, route):
+        """지연 시간을 흉내 내고, 오류로 응답할 차례면 503 응답을 돌려준다."""
+        key = f"{upstream}:{route}"
+        self.calls[key] += 1
+        self.in_flight[upstream] += 1
+        self.max_in_flight[upstream] = max(self.max_in_flight[upstream], self.in_flight[upstream])
+        delay = self.latency[upstream].sample(self.rng)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.in_flight[upstream] -= 1
+            self.busy_seconds[upstream] += delay
+        if self.rng.random() < self.error_rate.get(upstream, 0.0):
+            self.errors[key] += 1
+            return web.json_response({'error': {'message': 'fake upstream error'}}, status=503)
+        return None
+
+    async def ocr(self, request):
+        await request.read()
+        error = await self.simulate("ocr", "document-ai/ocr")
+        if error is not None:
+            return error
+        return web.json_response(ocr_payload(self.rng, unlabeled=self.rng.random() < self.unlabeled_ratio))
+
+    async def stt(self, request):
+        await request.read()
+        error = await self.simulate("stt", "recognizer/upload")
+        if error is not None:
+            return error
+        return web.json_response(stt_payload(self.rng))
+
+    async def pill(self, request):
+        error = await self.simulate("data_go_kr", "pill")
+        if error is not None:
+            return error
+        # 실제 API처럼 품목명 부분 일치
+        query = request.query.get('item_name', '')
+        items = [pill_item(seq, drug[0]) for seq, drug in enumerate(DRUGS) if query and query in drug[0]]
+        return web.json_response(data_go_kr_payload(items))
+
+    async def permit(self, request):
+        error = await self.simulate("data_go_kr", "permit")
+        if error is not None:
+            return error
+        query = request.query.get('item_name', '')
+        items = [permit_item(seq, drug, self.rng) for seq, drug in enumerate(DRUGS) if query and query in drug[0]]
+        return web.json_response(data_go_kr_payload(items[:10]))
+
+    async def chat(self, request):
+        body = await request.json()
+        kind = classify_prompt(body.get('messages', []))
+        error = await self.simulate("llm", kind)
+        if error is not None:
+            return error
+        content = chat_content(kind, self.rng)
+        prompt_tokens = sum(len(str(message.get('content', ''))) for message in body.get('messages', [])) // 2
+        completion_tokens = len(content) // 2
+        return web.json_response({
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'gpt-4o-mini'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                         'logprobs': None, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        })
+
+    async def s3_object(self, request):
+        key = request.match_info['key']
+        if request.method == "HEAD":
+            error = await self.simulate("s3", "head")
+            if error is not None:
+                return error
+            if key not in self.objects:
+                return web.Response(status=404)
+            return web.Response(headers={'Content-Length': str(self.objects[key]), 'ETag': '"fake"'})
+        if request.method == "PUT":
+            body = await request.read()
+            error = await self.simulate("s3", "put")
+            if error is not None:
+                return error
+            upload_id = request.query.get('uploadId')
+            if upload_id is not None:
+                self.multipart.setdefault(upload_id, 0)
+                self.multipart[upload_id] += len(body)
+            else:
+                self.objects[key] = len(body)
+            return web.Response(headers={'ETag': f'"{uuid.uuid4().hex}"'})
+        # POST: 멀티파트 업로드 시작(?uploads)과 완료(?uploadId=)
+        await request.read()
+        error = await self.simulate("s3", "multipart")
+        if error is not None:
+            return error
+        if 'uploads' in request.query:
+            upload_id = uuid.uuid4().hex
+            self.multipart[upload_id] = 0
+            return web.Response(content_type="application/xml", text=(
+                f'<?xml version="1.0" encoding="UTF-8"?><InitiateMultipartUploadResult>'
+                f'<Bucket>{self.bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>'
+                f'</InitiateMultipartUploadResult>'))
+        self.objects[key] = self.multipart.pop(request.query.get('uploadId'), 0)
+        return web.Response(content_type="application/xml", text=(
+            f'<?xml version="1.0" encoding="UTF-8"?><CompleteMultipartUploadResult>'
+            f'<Bucket>{self.bucket}</Bucket><Key>{key}</Key><ETag>"fake"</ETag>'
+            f'</CompleteMultipartUploadResult>'))
+
+    async def stats(self, request):
+        return web.json_response({
+            'calls': dict(self.calls),
+            'errors': dict(self.errors),
+            'busy_seconds': {name: round(value, 3) for name, value in self.busy_seconds.items()},
+            'max_in_flight': dict(self.max_in_flight),
+            'objects': len(self.objects),
+        })
+
+    async def reset(self, request):
+        for counter in (self.calls, self.errors, self.busy_seconds, self.max_in_flight):
+            counter.clear()
+        return web.json_response({'reset': True})
+
+    def app(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/v1/document-ai/ocr", self.ocr)
+        app.router.add_post("/recognizer/upload", self.stt)
+        app.router.add_get("/1471000/MdcinGrnIdntfcInfoService01/getMdcinGrnIdntfcInfoList01", self.pill)
+        app.router.add_get("/1471000/DrugPrdtPrmsnInfoService06/{operation}", self.permit)
+        # OpenAI(OPENAI_BASE_URL)와 Upstage(UPSTAGE_API_BASE) 채팅 API 모두 같은 형식
+        app.router.add_post("/v1/chat/completions", self.chat)
+        app.router.add_post("/v1/solar/chat/completions", self.chat)
+        app.router.add_get("/_stats", self.stats)
+        app.router.add_post("/_reset", self.reset)
+        app.router.add_route("*", f"/{self.bucket}/{{key:.+}}", self.s3_object)
+        return app
+
+
+def parse_assignments(values, convert):
+    """["ocr=lognormal:1,0.3", ...] -> {"ocr": convert("lognormal:1,0.3")}"""
+    result = {}
+    for value in values or []:
+        name, _, spec = value.partition("=")
+        if name not in UPSTREAMS:
+            raise ValueError(f"알 수 없는 업스트림: {name} (가능한 값: {', '.join(UPSTREAMS)})")
+        result[name] = convert(spec)
+    return result
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", action="append", metavar="업스트림=분포",
+                        help=f"업스트림별 지연 시간 분포 (기본: {', '.join(f'{k}={v}' for k, v in DEFAULT_LATENCY.items())})")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="모든 지연 시간에 곱할 배율 (빠른 확인용 0.1 등)")
+    parser.add_argument("--error-rate", action="append", metavar="업스트림=비율", help="503으로 응답할 비율")
+    parser.add_argument("--unlabeled-ratio", type=float, default=0.2,
+                        help="환자 정보 라벨이 없어 LLM 메타데이터 추출로 넘어가는 처방전 비율")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    specs = {**DEFAULT_LATENCY, **parse_assignments(args.latency, str)}
+    latency = {name: Latency(spec, args.latency_scale) for name, spec in specs.items()}
+    error_rate = parse_assignments(args.error_rate, float)
+    fakes = FakeUpstreams(latency, error_rate, seed=args.seed, unlabeled_ratio=args.unlabeled_ratio)
+    web.run_app(fakes.app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+from metrics import record_cache
+
+# reportlab은 렌더링 프로세스에서만 쓰므로 함수 안에서 import (API 프로세스 시작 시간 단축)
+
+CHART_PDF_CACHE_DIR = os.getenv("CHART_PDF_CACHE_DIR", "tmp/chart_pdf")
+# 캐시 PDF에는 환자 정보가 들어 있으므로 렌더링 후 이 시간(초)이 지나면 지운다
+CHART_PDF_CACHE_MAX_AGE = int(os.getenv("CHART_PDF_CACHE_MAX_AGE", 24 * 60 * 60))
+CHART_PDF_CACHE_MAX_BYTES = int(os.getenv("CHART_PDF_CACHE_MAX_BYTES", 500 * 1024 * 1024))
+CHART_EXPORT_WORKERS = int(os.getenv("CHART_EXPORT_WORKERS", 2))
+# reportlab 내장 한글 CID 폰트 (별도 폰트 파일 불필요)
+CHART_PDF_FONT = os.getenv("CHART_PDF_FONT", "HYSMyeongJo-Medium")
+
+CHART_TITLES = {
+    "medical_charts": "의료 차트",
+    "voice_medical_charts": "음성 진료 차트",
+}
+
+FONT_SIZE = 10
+TITLE_FONT_SIZE = 16
+LINE_HEIGHT = FONT_SIZE * 1.6
+# 20mm (포인트 단위)
+MARGIN = 20 * 72 / 25.4
+
+_executor = None
+# 같은 차트를 동시에 요청하면 한 번만 렌더링
+_rendering = {}
+
+
+def _init_worker():
+    # 워커 프로세스마다 한 번만 폰트 등록
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    pdfmetrics.registerFont(UnicodeCIDFont(CHART_PDF_FONT))
+
+
+def start_export_pool():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=CHART_EXPORT_WORKERS, initializer=_init_worker,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        logger.info(f"차트 PDF 렌더링 프로세스 풀 시작: {CHART_EXPORT_WORKERS}개")
+        prune_chart_pdf_cache()
+    return _executor
+
+
+def stop_export_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        logger.info("차트 PDF 렌더링 프로세스 풀 종료")
+
+
+def render_chart_pdf(path, title, chart_id, patient_id, version, content):
+    """차트 본문을 A4 PDF로 그려 path에 쓴다. 프로세스 풀에서 실행된다.
+
+    결과는 버전별로 캐시되므로 출력 시각 같은 값은 넣지 않는다 (같은 버전이면 같은 PDF).
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfgen import canvas
+    width, height = A4
+    text_width = width - 2 * MARGIN
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        # invariant: 생성 시각 등 메타데이터를 고정해 같은 입력이면 같은 파일이 되게 함
+        pdf = canvas.Canvas(tmp_path, pagesize=A4, invariant=1)
+        pdf.setTitle(f"{title} #{chart_id}")
+
+        def new_page(page_number):
+            pdf.setFont(CHART_PDF_FONT, FONT_SIZE - 2)
+            pdf.drawRightString(width - MARGIN, MARGIN / 2, f"{title} #{chart_id} - {page_number}")
+            pdf.setFont(CHART_PDF_FONT, FONT_SIZE)
+            return height - MARGIN
+
+        page_number = 1
+        y = new_page(page_number)
+        pdf.setFont(CHART_PDF_FONT, TITLE_FONT_SIZE)
+        pdf.drawString(MARGIN, y - TITLE_FONT_SIZE, f"{title} #{chart_id}")
+        y -= TITLE_FONT_SIZE * 2
+        pdf.setFont(CHART_PDF_FONT, FONT_SIZE)
+        pdf.drawString(MARGIN, y, f"환자 ID: {patient_id}    차트 버전: {version}")
+        y -= LINE_HEIGHT * 1.5
+
+        for paragraph in (content or "").splitlines():
+            lines = simpleSplit(paragraph, CHART_PDF_FONT, FONT_SIZE, text_width) or [""]
+            for line in lines:
+                if y < MARGIN + LINE_HEIGHT:
+                    pdf.showPage()
+                    page_number += 1
+                    y = new_page(page_number)
+                pdf.drawString(MARGIN, y, line)
+                y -= LINE_HEIGHT
+        pdf.showPage()
+        pdf.save()
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return path
+
+
+def chart_pdf_path(chart_table, chart_id, version):
+    """차트 id와 버전으로 캐시 경로를 만든다. 차트를 수정하면 버전이 올라 경로도 바뀐다."""
+    return os.path.join(CHART_PDF_CACHE_DIR, f"{chart_table}-{chart_id}-v{version}.pdf")
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return 1
+    except FileNotFoundError:
+        return 0
+
+
+def prune_chart_pdf_cache(keep=None):
+    """보관 기간이 지난 PDF를 지우고, 전체 크기가 한도를 넘으면 오래된 것부터 지운다.
+
+    keep(방금 렌더링한 경로)을 주면 같은 차트의 이전 버전 PDF도 지운다. 지운 파일 수를 반환한다.
+    """
+    try:
+        entries = list(os.scandir(CHART_PDF_CACHE_DIR))
+    except FileNotFoundError:
+        return 0
+    # "{table}-{id}-v" 까지가 같으면 같은 차트
+    prefix = os.path.basename(keep).rsplit("-v", 1)[0] + "-v" if keep else None
+    now = time.time()
+    removed = 0
+    kept = []
+    for entry in entries:
+        if not entry.name.endswith(".pdf") or entry.path == keep:
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if (prefix and entry.name.startswith(prefix)) or now - stat.st_mtime > CHART_PDF_CACHE_MAX_AGE:
+            removed += _remove(entry.path)
+        else:
+            kept.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in kept)
+    if keep and os.path.exists(keep):
+        total += os.path.getsize(keep)
+    for _, size, path in sorted(kept):
+        if total <= CHART_PDF_CACHE_MAX_BYTES:
+            break
+        removed += _remove(path)
+        total -= size
+    if removed:
+        logger.info(f"차트 PDF 캐시 정리: {removed}개 삭제")
+    return removed
+
+
+async def _render(chart_table, chart, path):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(start_export_pool(), render_chart_pdf, path, CHART_TITLES[chart_table],
+                               chart['id'], chart['patient_id'], chart['version'], chart['content'])
+    await asyncio.to_thread(prune_chart_pdf_cache, path)
+    return path
+
+
+async def export_chart_pdf(chart_table, chart):
+    """차트를 PDF로 렌더링해 캐시 파일 경로를 반환한다. 캐시에 있으면 바로 반환한다."""
+    path = chart_pdf_path(chart_table, chart['id'], chart['version'])
+    cached = os.path.exists(path)
+    record_cache("chart_pdf", cached)
+    if cached:
+        logger.info(f"차트 PDF 캐시 적중: {path}")
+        return path
+
+    future = _rendering.get(path)
+    if future is None:
+        os.makedirs(CHART_PDF_CACHE_DIR, exist_ok=True)
+        future = asyncio.ensure_future(_render(chart_table, chart, path))
+        _rendering[path] = future
+        future.add_done_callback(lambda _: _rendering.pop(path, None))
+        logger.info(f"차트 PDF 렌더링 시작: {chart_table} #{chart['id']}")
+    return await asyncio.shield(future)
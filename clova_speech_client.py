@@ -1,12 +1,16 @@
-import requests
 import json
 from dotenv import load_dotenv
 import os
 from loguru import logger
+from log_config import log_payload
 
 # 환경 변수 로드
 load_dotenv()
 
+# 연결 제한 시간과 응답 대기 제한 시간(초). 동기 전사라 응답까지 오래 걸릴 수 있음
+CLOVA_SPEECH_CONNECT_TIMEOUT = float(os.getenv('CLOVA_SPEECH_CONNECT_TIMEOUT', 10))
+CLOVA_SPEECH_TIMEOUT = float(os.getenv('CLOVA_SPEECH_TIMEOUT', 300))
+
 class ClovaSpeechClient:
     def __init__(self):
         self.invoke_url = os.getenv('CLOVA_SPEECH_INVOKE_URL')
@@ -26,16 +30,20 @@ class ClovaSpeechClient:
             'diarization': diarization,
             'sed': sed,
         }
+        # requests는 첫 전사 요청 때 import (서버 시작 시간 단축)
+        import requests
         headers = {
             'Accept': 'application/json;UTF-8',
             'X-CLOVASPEECH-API-KEY': self.secret
         }
-        files = {
-            'media': open(file, 'rb'),
-            'params': (None, json.dumps(request_body, ensure_ascii=False).encode('UTF-8'), 'application/json')
-        }
         try:
-            response = requests.post(headers=headers, url=self.invoke_url + '/recognizer/upload', files=files)
+            with open(file, 'rb') as media:
+                files = {
+                    'media': media,
+                    'params': (None, json.dumps(request_body, ensure_ascii=False).encode('UTF-8'), 'application/json')
+                }
+                response = requests.post(headers=headers, url=self.invoke_url + '/recognizer/upload', files=files,
+                                         timeout=(CLOVA_SPEECH_CONNECT_TIMEOUT, CLOVA_SPEECH_TIMEOUT))
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -46,7 +54,9 @@ def transcribe_audio(file_contents):
     client = ClovaSpeechClient()
     try:
         result = client.req_upload(file_contents, completion='sync')
-        logger.info(f"Clova Speech API 요청 성공: {result}")
+        logger.info(f"Clova Speech API 요청 성공: 전사 {len(result.get('text') or '')}자, "
+                    f"구간 {len(result.get('segments') or [])}개")
+        log_payload("Clova Speech API 응답", result)
         return result
     except Exception as e:
         logger.error(f"음성 파일 전사 중 오류 발생: {str(e)}")
@@ -0,0 +1,28 @@
+import argparse
+import asyncio
+from loguru import logger
+from compression import collect_samples, migrate, train_dictionary
+from database import create_connection_async, create_tables, insert_compression_dictionary
+
+
+async def run(command):
+    async with create_connection_async() as conn:
+        # 테이블 생성과 함께 저장된 사전을 읽어 둔다
+        await create_tables(conn)
+        if command in ("train", "all"):
+            samples = await collect_samples(conn)
+            dictionary = train_dictionary(samples)
+            dictionary_id = await insert_compression_dictionary(conn, dictionary, len(samples))
+            logger.info(f"압축 사전 {dictionary_id}번 저장: 샘플 {len(samples)}개, {len(dictionary)} 바이트")
+        if command in ("migrate", "all"):
+            report = await migrate(conn)
+            for column, result in report.items():
+                logger.info(f"{column}: {result}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="차트/약품 문서 컬럼 압축 사전 학습 및 기존 행 마이그레이션")
+    parser.add_argument("command", choices=("train", "migrate", "all"),
+                        help="train: 현재 데이터로 새 사전 학습 / migrate: 기존 행을 현재 사전으로 압축 / all: 둘 다")
+    args = parser.parse_args()
+    asyncio.run(run(args.command))
@@ -0,0 +1,164 @@
+import os
+import re
+import struct
+import zlib
+from collections import Counter
+from loguru import logger
+
+# 압축 저장 형식: MAGIC + 사전 id(2바이트) + raw deflate 본문. 압축하지 않은 값은 TEXT 그대로 둔다.
+MAGIC = b"\x1fLC"
+HEADER = struct.Struct(">H")
+# 이보다 짧은 텍스트는 압축 이득이 작아 그대로 저장
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 256))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", 6))
+# zlib 사전은 최대 32KB(창 크기)까지만 쓰인다
+DICTIONARY_SIZE = 32 * 1024
+
+# 압축해서 저장하는 컬럼
+COMPRESSED_COLUMNS = {
+    "medical_charts": ("content",),
+    "voice_medical_charts": ("content",),
+    "drug_info": ("효능효과", "용법용량", "주의사항"),
+}
+
+# 사전 id -> 사전 바이트 (0은 사전 없음)
+_dictionaries = {0: b""}
+_active_dictionary_id = 0
+# 프로세스에 없는 사전을 DB에서 읽는 함수 (database.py에서 설정)
+_dictionary_loader = None
+
+
+def set_dictionary_loader(loader):
+    global _dictionary_loader
+    _dictionary_loader = loader
+
+
+def use_dictionaries(dictionaries):
+    """DB에서 읽은 {id: 사전}을 등록하고 가장 최근 사전을 새 쓰기에 사용한다."""
+    global _active_dictionary_id
+    _dictionaries.update(dictionaries)
+    _active_dictionary_id = max(_dictionaries)
+    if _active_dictionary_id:
+        logger.info(f"압축 사전 {_active_dictionary_id}번 사용 ({len(_dictionaries[_active_dictionary_id])} 바이트)")
+
+
+def _dictionary(dictionary_id):
+    dictionary = _dictionaries.get(dictionary_id)
+    if dictionary is None and _dictionary_loader is not None:
+        # 다른 프로세스(마이그레이션 명령 등)가 만든 사전
+        dictionary = _dictionary_loader(dictionary_id)
+        if dictionary is not None:
+            _dictionaries[dictionary_id] = dictionary
+    if dictionary is None:
+        raise ValueError(f"압축 사전 {dictionary_id}번을 찾을 수 없습니다")
+    return dictionary
+
+
+def compress_bytes(data, dictionary_id=None):
+    dictionary_id = _active_dictionary_id if dictionary_id is None else dictionary_id
+    dictionary = _dictionary(dictionary_id)
+    if dictionary:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, dictionary)
+    else:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+    return MAGIC + HEADER.pack(dictionary_id) + compressor.compress(data) + compressor.flush()
+
+
+def encode_text(text):
+    """저장할 텍스트를 압축한다. 짧거나 압축 이득이 없으면 텍스트 그대로 반환한다."""
+    if not isinstance(text, str):
+        return text
+    data = text.encode("utf-8")
+    if len(data) < COMPRESSION_MIN_BYTES:
+        return text
+    compressed = compress_bytes(data)
+    return compressed if len(compressed) < len(data) else text
+
+
+def is_compressed(value):
+    return isinstance(value, bytes) and value[:len(MAGIC)] == MAGIC
+
+
+def decode_text(value):
+    """encode_text로 저장한 값을 텍스트로 되돌린다. 압축하지 않은 값은 그대로 반환한다."""
+    if not is_compressed(value):
+        return value
+    (dictionary_id,) = HEADER.unpack_from(value, len(MAGIC))
+    dictionary = _dictionary(dictionary_id)
+    decompressor = zlib.decompressobj(-15, zdict=dictionary) if dictionary else zlib.decompressobj(-15)
+    body = value[len(MAGIC) + HEADER.size:]
+    return (decompressor.decompress(body) + decompressor.flush()).decode("utf-8")
+
+
+def train_dictionary(samples, size=DICTIONARY_SIZE):
+    """샘플 텍스트들에 자주 반복되는 줄/문장/구절로 zlib 사전을 만든다.
+
+    여러 문서에 나오는 조각일수록(등장 횟수 x 길이) 우선하고, 가까운 거리 참조가 더 싸므로
+    가장 유용한 조각을 사전의 끝에 둔다.
+    """
+    fragments = Counter()
+    for sample in samples:
+        if not sample:
+            continue
+        # 한 문서 안의 반복은 일반 압축으로 충분하므로 문서마다 한 번만 센다
+        pieces = set(piece.strip() for piece in re.split(r"[\n.。!?]|(?<=[:：])", sample))
+        pieces.update(word for word in sample.split() if len(word) >= 4)
+        fragments.update(piece for piece in pieces if len(piece) >= 4)
+
+    scored = sorted(((count * len(piece.encode("utf-8")), piece) for piece, count in fragments.items() if count >= 2),
+                    reverse=True)
+    selected, total = [], 0
+    for _, piece in scored:
+        encoded = piece.encode("utf-8") + b"\n"
+        if total + len(encoded) > size:
+            continue
+        selected.append(encoded)
+        total += len(encoded)
+    return b"".join(reversed(selected))
+
+
+async def migrate(conn, batch_size=500):
+    """기존 행의 압축 대상 컬럼을 현재 사전으로 다시 저장한다. 컬럼별 (원본, 저장) 바이트 합계를 반환한다."""
+    report = {}
+    for table, columns in COMPRESSED_COLUMNS.items():
+        key = "drug_id" if table == "drug_info" else "id"
+        for column in columns:
+            last_key, raw_bytes, stored_bytes, rows_changed = -1, 0, 0, 0
+            while True:
+                async with conn.execute(f'SELECT {key}, {column} FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?',
+                                        (last_key, batch_size)) as cursor:
+                    rows = await cursor.fetchall()
+                if not rows:
+                    break
+                updates = []
+                for row_key, value in rows:
+                    text = decode_text(value)
+                    if text is None:
+                        continue
+                    encoded = encode_text(text)
+                    raw_bytes += len(text.encode("utf-8")) if isinstance(text, str) else len(text)
+                    stored_bytes += len(encoded.encode("utf-8")) if isinstance(encoded, str) else len(encoded)
+                    if encoded != value:
+                        updates.append((encoded, row_key))
+                if updates:
+                    await conn.executemany(f'UPDATE {table} SET {column} = ? WHERE {key} = ?', updates)
+                    await conn.commit()
+                    rows_changed += len(updates)
+                last_key = rows[-1][0]
+            report[f"{table}.{column}"] = {'raw_bytes': raw_bytes, 'stored_bytes': stored_bytes,
+                                           'rows_changed': rows_changed,
+                                           'ratio': round(raw_bytes / stored_bytes, 2) if stored_bytes else None}
+            logger.info(f"압축 마이그레이션 {table}.{column}: {rows_changed}행 변경, "
+                        f"{raw_bytes} -> {stored_bytes} 바이트")
+    return report
+
+
+async def collect_samples(conn, limit=2000):
+    samples = []
+    for table, columns in COMPRESSED_COLUMNS.items():
+        for column in columns:
+            async with conn.execute(f'SELECT {column} FROM {table} WHERE {column} IS NOT NULL '
+                                    f'ORDER BY RANDOM() LIMIT ?', (limit,)) as cursor:
+                samples.extend(decode_text(row[0]) for row in await cursor.fetchall())
+    return [sample for sample in samples if isinstance(sample, str)]
+
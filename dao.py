@@ -0,0 +1,123 @@
+import json
+from collections.abc import Mapping
+from loguru import logger
+from compression import COMPRESSED_COLUMNS, decode_text
+
+
+class Record(Mapping):
+    """조회 결과 한 행. 컬럼 이름으로 접근하며 JSON/압축 컬럼은 처음 읽을 때 한 번만 푼다."""
+
+    __slots__ = ('_values', '_json_columns', '_compressed_columns', '_decoded')
+
+    def __init__(self, values, json_columns=(), compressed_columns=()):
+        self._values = values
+        self._json_columns = json_columns
+        self._compressed_columns = compressed_columns
+        self._decoded = {}
+
+    def __getitem__(self, column):
+        if column in self._decoded:
+            return self._decoded[column]
+        if column in self._json_columns and column in self._values:
+            self._decoded[column] = self._parse_json(column, self._values[column])
+            return self._decoded[column]
+        if column in self._compressed_columns and column in self._values:
+            self._decoded[column] = decode_text(self._values[column])
+            return self._decoded[column]
+        return self._values[column]
+
+    @staticmethod
+    def _parse_json(column, raw):
+        if not raw:
+            return {}
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            logger.warning(f"{column} 파싱 오류: {raw}")
+            return {}
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def to_dict(self):
+        # 프롬프트나 JSON 응답에 넘길 때 사용 (JSON/압축 컬럼도 모두 풂)
+        return {column: self[column] for column in self._values}
+
+    def __repr__(self):
+        return f"Record({self._values!r})"
+
+
+class TableDAO:
+    """테이블 하나에 대한 조회 계층.
+
+    요청한 컬럼만 SELECT하고, 행은 cursor.description의 컬럼 이름으로 매핑한다.
+    테이블 컬럼 목록(PRAGMA table_info)과 프로젝션별 SQL은 프로세스 단위로 캐시한다.
+    """
+
+    table = None
+    json_columns = ()
+
+    # 테이블 -> 컬럼 튜플
+    _column_cache = {}
+    # (테이블, 컬럼 튜플, 조건 컬럼) -> SQL
+    _sql_cache = {}
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def columns(self):
+        columns = self._column_cache.get(self.table)
+        if columns is None:
+            async with self.conn.execute(f'PRAGMA table_info({self.table})') as cursor:
+                columns = tuple(row[1] for row in await cursor.fetchall())
+            self._column_cache[self.table] = columns
+        return columns
+
+    async def _select_sql(self, columns, where_column):
+        table_columns = await self.columns()
+        selected = tuple(columns) if columns else table_columns
+        key = (self.table, selected, where_column)
+        sql = self._sql_cache.get(key)
+        if sql is None:
+            unknown = [column for column in selected + (where_column,) if column not in table_columns]
+            if unknown:
+                raise ValueError(f"{self.table}에 없는 컬럼: {unknown}")
+            sql = f'SELECT {", ".join(selected)} FROM {self.table} WHERE {where_column} = ?'
+            self._sql_cache[key] = sql
+        return sql
+
+    def _to_record(self, cursor, row):
+        names = [description[0] for description in cursor.description]
+        return Record(dict(zip(names, row)), self.json_columns, COMPRESSED_COLUMNS.get(self.table, ()))
+
+    async def get_one(self, where_column, value, columns=None):
+        sql = await self._select_sql(columns, where_column)
+        async with self.conn.execute(sql + ' LIMIT 1', (value,)) as cursor:
+            row = await cursor.fetchone()
+            return self._to_record(cursor, row) if row else None
+
+    async def get_many(self, where_column, value, columns=None, limit=100):
+        sql = await self._select_sql(columns, where_column)
+        async with self.conn.execute(sql + ' LIMIT ?', (value, limit)) as cursor:
+            rows = await cursor.fetchall()
+            return [self._to_record(cursor, row) for row in rows]
+
+
+class DrugInfoDAO(TableDAO):
+    table = "drug_info"
+    json_columns = ("주성분",)
+
+    # 진료 계획 생성에 쓰이는 요약 컬럼 (큰 본문 컬럼 제외)
+    SUMMARY_COLUMNS = ("품목명", "주성분", "요약_보고서")
+
+    async def get_by_name(self, 품목명, columns=None):
+        return await self.get_one("품목명", 품목명, columns)
+
+    async def get_by_id(self, drug_id, columns=None):
+        return await self.get_one("drug_id", drug_id, columns)
+
+    async def get_summary_by_name(self, 품목명):
+        return await self.get_by_name(품목명, self.SUMMARY_COLUMNS)
@@ -1,14 +1,30 @@
+import hashlib
 import json
+import os
+import re
 import aiosqlite
 import sqlite3
 import json
 from contextlib import contextmanager, asynccontextmanager
 from loguru import logger
+from dao import DrugInfoDAO
+from compression import (
+    COMPRESSED_COLUMNS,
+    decode_text,
+    encode_text,
+    set_dictionary_loader,
+    use_dictionaries
+)
+
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'medical_data.db')
+# OCR 페이지 캐시에는 처방전 원문이 들어 있으므로 보관 기간과 최대 행 수를 둔다
+OCR_CACHE_TTL_HOURS = int(os.getenv('OCR_CACHE_TTL_HOURS', 7 * 24))
+OCR_CACHE_MAX_ROWS = int(os.getenv('OCR_CACHE_MAX_ROWS', 10000))
 
 @contextmanager
 def create_connection_sync():
     try:
-        conn = sqlite3.connect('medical_data.db')
+        conn = sqlite3.connect(DATABASE_PATH)
         yield conn
     except Exception as e:
         logger.error(f"데이터베이스 연결 오류 (동기): {e}")
@@ -19,7 +35,7 @@ def create_connection_sync():
 @asynccontextmanager
 async def create_connection_async():
     try:
-        conn = await aiosqlite.connect('medical_data.db')
+        conn = await aiosqlite.connect(DATABASE_PATH)
         logger.info("데이터베이스 연결 성공")
         yield conn
     except Exception as e:
@@ -32,8 +48,31 @@ async def create_connection_async():
         except Exception as e:
             logger.error(f"데이터베이스 연결 종료 실패: {str(e)}")
 
+def _load_dictionary_sync(dictionary_id):
+    # 다른 프로세스가 학습한 압축 사전을 읽는다 (조회 중인 연결과 별개로 읽도록 별도 연결 사용)
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        row = conn.execute('SELECT dictionary FROM compression_dicts WHERE id = ?', (dictionary_id,)).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+set_dictionary_loader(_load_dictionary_sync)
+
+# 수정 시 version을 확인하고 1씩 올리는 테이블
+VERSIONED_TABLES = ("medical_charts", "voice_medical_charts", "prescriptions")
+
+async def _ensure_column(conn, table, column, definition):
+    async with conn.execute(f'PRAGMA table_info({table})') as cursor:
+        columns = [row[1] for row in await cursor.fetchall()]
+    if column not in columns:
+        await conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        logger.info(f"컬럼 추가: {table}.{column}")
+
 async def create_tables(conn):
     try:
+        # 작업 큐 워커와 API가 동시에 쓰므로 WAL 모드 사용
+        await conn.execute('PRAGMA journal_mode=WAL')
         await conn.executescript('''
             CREATE TABLE IF NOT EXISTS patients
             (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -64,6 +103,8 @@ async def create_tables(conn):
              전문_일반 TEXT,
              재심사대상 TEXT);
 
+            CREATE INDEX IF NOT EXISTS idx_drug_info_name ON drug_info (품목명);
+
             CREATE TABLE IF NOT EXISTS medical_charts
             (id INTEGER PRIMARY KEY AUTOINCREMENT,
              patient_id INTEGER,
@@ -72,10 +113,113 @@ async def create_tables(conn):
             CREATE TABLE IF NOT EXISTS voice_medical_charts
             (id INTEGER PRIMARY KEY AUTOINCREMENT,
              patient_id INTEGER,
-             content TEXT);                                 
+             content TEXT);
+
+            CREATE TABLE IF NOT EXISTS prescriptions
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             file_hash TEXT,
+             patient_name TEXT,
+             patient_age TEXT,
+             prescription_date TEXT,
+             medication_name TEXT,
+             medication_dosage TEXT,  -- JSON
+             prescription_days INTEGER,
+             version INTEGER NOT NULL DEFAULT 1);
+
+            CREATE INDEX IF NOT EXISTS idx_prescriptions_file_hash ON prescriptions (file_hash);
+
+            -- 환자별 차트 목록 조회 (patient_id로 거른 뒤 id 커서로 페이지 이동)
+            CREATE INDEX IF NOT EXISTS idx_medical_charts_patient ON medical_charts (patient_id, id);
+            CREATE INDEX IF NOT EXISTS idx_voice_medical_charts_patient ON voice_medical_charts (patient_id, id);
+
+            -- 처방전별 환자 복용 약품 (patients.medications JSON의 정규화 버전)
+            CREATE TABLE IF NOT EXISTS patient_medications
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             patient_id INTEGER NOT NULL,
+             item_name TEXT NOT NULL,
+             prescribed_at TEXT DEFAULT CURRENT_TIMESTAMP);
+
+            -- 환자별 복용 이력 (최신순 id 커서)
+            CREATE INDEX IF NOT EXISTS idx_patient_medications_patient ON patient_medications (patient_id, id);
+            -- 약품별 환자 역조회 (인덱스만으로 집계)
+            CREATE INDEX IF NOT EXISTS idx_patient_medications_item ON patient_medications (item_name, patient_id, prescribed_at);
+
+            -- S3에 저장된 콘텐츠 주소 객체 (키는 파일 해시에서 파생)
+            CREATE TABLE IF NOT EXISTS stored_objects
+            (object_key TEXT PRIMARY KEY,
+             file_hash TEXT NOT NULL,
+             file_size INTEGER,
+             content_type TEXT,
+             original_name TEXT,
+             created_at TEXT DEFAULT CURRENT_TIMESTAMP);
+
+            -- 요청/차트와 객체 키의 매핑
+            CREATE TABLE IF NOT EXISTS object_links
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             object_key TEXT NOT NULL,
+             request_id TEXT,
+             chart_table TEXT,
+             chart_id INTEGER,
+             created_at TEXT DEFAULT CURRENT_TIMESTAMP);
+
+            CREATE INDEX IF NOT EXISTS idx_object_links_chart ON object_links (chart_table, chart_id);
+            CREATE INDEX IF NOT EXISTS idx_object_links_request ON object_links (request_id);
+
+            -- 백그라운드 작업 큐 (stage: 다음에 실행할 단계, state: 단계별 결과 체크포인트)
+            CREATE TABLE IF NOT EXISTS jobs
+            (id TEXT PRIMARY KEY,
+             kind TEXT NOT NULL,
+             status TEXT NOT NULL,
+             stage TEXT,
+             payload TEXT,
+             state TEXT,
+             attempts INTEGER NOT NULL DEFAULT 0,
+             error TEXT,
+             available_at REAL NOT NULL,
+             lease_until REAL,
+             created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+             updated_at TEXT DEFAULT CURRENT_TIMESTAMP);
+
+            CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (kind, status, available_at);
+
+            -- 문서 컬럼 압축용 zlib 사전 (가장 큰 id를 새 쓰기에 사용)
+            CREATE TABLE IF NOT EXISTS compression_dicts
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             dictionary BLOB NOT NULL,
+             sample_count INTEGER,
+             created_at TEXT DEFAULT CURRENT_TIMESTAMP);
+
+            -- 페이지 내용 해시별 OCR 결과 캐시
+            CREATE TABLE IF NOT EXISTS ocr_page_cache
+            (page_hash TEXT PRIMARY KEY,
+             result TEXT NOT NULL,
+             created_at TEXT DEFAULT CURRENT_TIMESTAMP);
+            CREATE INDEX IF NOT EXISTS idx_ocr_page_cache_created ON ocr_page_cache (created_at);
         ''')
+        # 기존 DB 마이그레이션: 낙관적 동시성 제어용 버전 컬럼
+        for table in VERSIONED_TABLES:
+            await _ensure_column(conn, table, 'version', 'INTEGER NOT NULL DEFAULT 1')
+        # 환자 중복 방지용 식별 키 (이름|생년월일|성별 해시)
+        await _ensure_column(conn, 'patients', 'birth_date', 'TEXT')
+        await _ensure_column(conn, 'patients', 'identity_key', 'TEXT')
+        await conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_patients_identity ON patients (identity_key)')
+        # 작업을 가져간 워커 식별용 임대 토큰 (임대가 만료돼 다른 워커가 가져가면 이전 워커의 쓰기를 막음)
+        await _ensure_column(conn, 'jobs', 'lease_token', 'TEXT')
+        # 작업이 저장한 환자 (환자 단계를 다시 실행해도 환자/약품 이력을 중복 저장하지 않음)
+        await _ensure_column(conn, 'jobs', 'patient_id', 'INTEGER')
+        # 기존 JSON 약품 목록을 한 번만 patient_medications로 옮김
+        await conn.execute('''
+            INSERT INTO patient_medications (patient_id, item_name)
+            SELECT patients.id, medication.value
+            FROM patients, json_each(patients.medications) AS medication
+            WHERE json_valid(patients.medications)
+              AND NOT EXISTS (SELECT 1 FROM patient_medications)
+            ORDER BY patients.id
+        ''')
+        await load_compression_dictionaries(conn)
+        await ensure_search_indexes(conn)
         await conn.commit()
-        logger.info("테이블 생성 완료: patients, drug_info, medical_charts")
+        logger.info("테이블 생성 완료: patients, drug_info, medical_charts, voice_medical_charts, prescriptions, patient_medications, stored_objects, object_links, jobs, compression_dicts, ocr_page_cache, 검색 인덱스")
     except Exception as e:
         logger.error(f"테이블 생성 오류: {e}")
 
@@ -135,112 +279,116 @@ def get_medical_chart_by_hash(conn, file_hash):
         logger.error(f"의료 차트 조회 오류: {e}")
         return None
 
-async def get_drug_info_by_name(conn, 품목명):
-    sql = 'SELECT * FROM drug_info WHERE 품목명 = ?'
+async def get_drug_info_by_name(conn, 품목명, columns=None):
+    # 컬럼 위치가 아니라 이름으로 매핑 (columns를 주면 해당 컬럼만 조회)
     try:
-        async with conn.execute(sql, (품목명,)) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                주성분 = row[2]
-                try:
-                    주성분_parsed = json.loads(주성분) if 주성분 else []
-                except json.JSONDecodeError:
-                    logger.warning(f"주성분 파싱 오류: {주성분}")
-                    주성분_parsed = []
-                
-                return {
-                    'id': row[0],
-                    '품목명': row[1],
-                    '주성분': 주성분_parsed,
-                    '요약_보고서': row[3],
-                    '성상': row[4],
-                    '효능효과': row[5],
-                    '용법용량': row[6],
-                    '주의사항': row[7],
-                    '저장방법': row[8],
-                    '유효기간': row[9],
-                    '재심사기간': row[10],
-                    '포장단위': row[11],
-                    '허가종류': row[12],
-                    '제조_수입': row[13],
-                    '업체명': row[14],
-                    '품목일련번호': row[15],
-                    '허가일자': row[16],
-                    '전문_일반': row[17],
-                    '재심사대상': row[18]
-                }
-        return None
+        record = await DrugInfoDAO(conn).get_by_name(품목명, columns)
+        return record.to_dict() if record else None
     except Exception as e:
         logger.error(f"약품 정보 조회 오류: {e}")
         return None
 
-async def get_drug_info_by_id(conn, drug_id):
-    sql = 'SELECT * FROM drug_info WHERE drug_id = ?'
+async def get_drug_info_by_id(conn, drug_id, columns=None):
     try:
-        async with conn.execute(sql, (drug_id,)) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                return {
-                    'drug_id': row[0],
-                    'patient_id': row[1],
-                    '품목명': row[2],
-                    '주성분': json.loads(row[3]),
-                    '요약_보고서': row[4],
-                    '성상': row[5],
-                    '효능효과': row[6],
-                    '용법용량': row[7],
-                    '주의사항': row[8],
-                    '저장방법': row[9],
-                    '유효기간': row[10],
-                    '재심사기간': row[11],
-                    '포장단위': row[12],
-                    '허가종류': row[13],
-                    '제조_수입': row[14],
-                    '업체명': row[15],
-                    '품목일련번호': row[16],
-                    '허가일자': row[17],
-                    '전문_일반': row[18],
-                    '재심사대상': row[19]
-                }
-        return None
+        record = await DrugInfoDAO(conn).get_by_id(drug_id, columns)
+        return record.to_dict() if record else None
     except Exception as e:
         logger.error(f"약품 정보 조회 오류: {e}")
         return None
 
-def update_medical_chart(conn, id, chart_content):
-    sql = '''UPDATE medical_charts
-             SET content = ?
-             WHERE id = ?'''
+async def update_medical_chart(conn, id, chart_content, expected_version, chart_table="medical_charts"):
+    """expected_version이 현재 버전과 같을 때만 내용을 바꾸고 버전을 올린다.
+
+    검색 인덱스를 고치려면 이전 평문이 필요한데 RETURNING은 바뀐 값만 돌려주므로, 이전 내용 조회와
+    버전 확인 UPDATE를 BEGIN IMMEDIATE 트랜잭션 하나로 묶어 그 사이에 다른 쓰기가 끼어들지 못하게 한다.
+    성공하면 새 버전, 차트가 없거나 버전이 다르면 None을 반환한다 (get_version으로 구분).
+    """
+    if chart_table not in CHART_TABLES:
+        raise ValueError(f"알 수 없는 차트 테이블: {chart_table}")
+    sql = f'''UPDATE {chart_table}
+              SET content = ?, version = version + 1
+              WHERE id = ? AND version = ?
+              RETURNING version'''
     try:
-        c = conn.cursor()
-        c.execute(sql, (chart_content, id))
-        conn.commit()
-        if c.rowcount == 0:
-            logger.warning(f"ID {id}에 해당하는 의료 차트가 없습니다.")
-            return False
-        logger.info(f"ID {id}의 의료 차트 내용이 성공적으로 업데이트되었습니다.")
-        return True
-    except Error as e:
+        if not conn.in_transaction:
+            await conn.execute('BEGIN IMMEDIATE')
+        async with conn.execute(f'SELECT content FROM {chart_table} WHERE id = ? AND version = ?',
+                                (id, expected_version)) as cursor:
+            old = await cursor.fetchone()
+        async with conn.execute(sql, (encode_text(chart_content), id, expected_version)) as cursor:
+            row = await cursor.fetchone()
+        if row is not None and old is not None:
+            await index_document(conn, chart_table, id, new={'content': chart_content},
+                                 old={'content': decode_text(old[0])})
+        await conn.commit()
+        if row is None:
+            logger.warning(f"ID {id}의 의료 차트를 수정하지 못했습니다 (없거나 버전 {expected_version} 불일치)")
+            return None
+        logger.info(f"ID {id}의 의료 차트 내용이 성공적으로 업데이트되었습니다. 버전 {row[0]}")
+        return row[0]
+    except Exception as e:
         logger.error(f"의료 차트 내용 업데이트 오류: {e}")
-        return False
+        if conn.in_transaction:
+            await conn.rollback()
+        raise
+
+async def update_prescription(conn, id, prescription, expected_version):
+    """처방전을 버전 확인 후 수정한다. 반환값은 update_medical_chart와 같다."""
+    sql = '''UPDATE prescriptions
+             SET patient_name = ?, patient_age = ?, prescription_date = ?, medication_name = ?,
+                 medication_dosage = ?, prescription_days = ?, version = version + 1
+             WHERE id = ? AND version = ?
+             RETURNING version'''
+    try:
+        async with conn.execute(sql, (
+            prescription.Name,
+            prescription.age,
+            prescription.prescription_date,
+            ', '.join(prescription.medication_name),
+            json.dumps(prescription.medication_dosage, ensure_ascii=False),
+            prescription.prescription_days,
+            id,
+            expected_version
+        )) as cursor:
+            row = await cursor.fetchone()
+        await conn.commit()
+        if row is None:
+            logger.warning(f"ID {id}의 처방전을 수정하지 못했습니다 (없거나 버전 {expected_version} 불일치)")
+            return None
+        logger.info(f"ID {id}의 처방전이 성공적으로 업데이트되었습니다. 버전 {row[0]}")
+        return row[0]
+    except Exception as e:
+        logger.error(f"처방전 업데이트 오류: {e}")
+        await conn.rollback()
+        raise
+
+async def get_version(conn, table, id):
+    """현재 버전. 행이 없으면 None. 수정이 실패했을 때 없음(404)과 충돌(409)을 구분하는 데 쓴다."""
+    if table not in VERSIONED_TABLES:
+        raise ValueError(f"알 수 없는 테이블: {table}")
+    async with conn.execute(f'SELECT version FROM {table} WHERE id = ?', (id,)) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else None
 
 def update_drug_info(conn, id, drug_info):
     sql = '''UPDATE drug_info
              SET drug_id=?, 품목명=?, 주성분=?, 요약_보고서=?, 성상=?, 효능효과=?, 용법용량=?, 주의사항=?,
                  저장방법=?, 유효기간=?, 재심사기간=?, 포장단위=?, 허가종류=?, 제조_수입=?,
                  업체명=?, 품목일련번호=?, 허가일자=?, 전문_일반=?, 재심사대상=?
-             WHERE id=?'''
+             WHERE drug_id=?'''
     try:
         c = conn.cursor()
+        columns = SEARCH_INDEXES["drug_info"]["columns"]
+        old = c.execute(f'SELECT drug_id, {", ".join(columns)} FROM drug_info WHERE drug_id=?', (id,)).fetchone()
         c.execute(sql, (
             drug_info.drug_id,
             drug_info.품목명,
             json.dumps(drug_info.주성분),
             drug_info.요약_보고서,
             drug_info.성상,
-            drug_info.효능효과,
-            drug_info.용법용량,
-            drug_info.주의사항,
+            encode_text(drug_info.효능효과),
+            encode_text(drug_info.용법용량),
+            encode_text(drug_info.주의사항),
             drug_info.저장방법,
             drug_info.유효기간,
             drug_info.재심사기간,
@@ -254,13 +402,23 @@ def update_drug_info(conn, id, drug_info):
             drug_info.재심사대상,
             id
         ))
+        # 아래 색인 갱신 문장이 rowcount를 덮어쓰므로 UPDATE 결과를 먼저 저장
+        updated = c.rowcount
+        if updated and old is not None:
+            # drug_id(rowid)도 바뀔 수 있으므로 이전 값은 이전 rowid로 지운다
+            for statement, params in _index_statements("drug_info", old[0],
+                                                       old=dict(zip(columns, map(decode_text, old[1:])))):
+                c.execute(statement, params)
+            for statement, params in _index_statements("drug_info", drug_info.drug_id,
+                                                       new=_search_values(drug_info)):
+                c.execute(statement, params)
         conn.commit()
-        if c.rowcount == 0:
+        if updated == 0:
             logger.warning(f"ID {id}에 해당하는 약품 정보가 없습니다.")
             return False
         logger.info(f"ID {id}의 약품 정보가 성공적으로 업데이트되었습니다.")
         return True
-    except Error as e:
+    except sqlite3.Error as e:
         logger.error(f"약품 정보 업데이트 오류: {e}")
         return False
 
@@ -276,13 +434,13 @@ async def insert_drug_info(conn, structured_data):
         주성분_dict = {k: v.__dict__ for k, v in structured_data.주성분.items()}
         주성분_json = json.dumps(주성분_dict)
         
-        await conn.execute(sql, (
+        cursor = await conn.execute(sql, (
             structured_data.품목명,
             structured_data.성상,
             주성분_json,  # 주성분 정보를 JSON으로 직렬화
-            structured_data.효능효과,
-            structured_data.용법용량,
-            structured_data.주의사항,
+            encode_text(structured_data.효능효과),
+            encode_text(structured_data.용법용량),
+            encode_text(structured_data.주의사항),
             structured_data.저장방법,
             structured_data.유효기간,
             structured_data.재심사기간,
@@ -296,6 +454,7 @@ async def insert_drug_info(conn, structured_data):
             structured_data.재심사대상,
             structured_data.요약_보고서
         ))
+        await index_document(conn, "drug_info", cursor.lastrowid, new=_search_values(structured_data))
         await conn.commit()
         logger.info(f"새로운 약품 정보가 성공적으로 저장되었습니다: {structured_data.품목명}")
         return True
@@ -305,19 +464,94 @@ async def insert_drug_info(conn, structured_data):
             await conn.rollback()
         return False
 
+NOT_FOUND = "Not Found"
+
+# LLM은 성별을 여러 표기로 돌려주므로 규칙 추출과 같은 표기(남성/여성)로 맞춘 뒤 식별 키를 만든다
+GENDER_NAMES = {"남": "남성", "남성": "남성", "남자": "남성", "m": "남성", "male": "남성",
+                "여": "여성", "여성": "여성", "여자": "여성", "f": "여성", "female": "여성"}
+
+def patient_identity_key(patient):
+    """이름, 생년월일, 성별이 모두 있을 때만 식별 키를 만든다. 이름과 나이만으로는 같은 사람으로 보지 않는다."""
+    gender = GENDER_NAMES.get(str(patient.gender).strip().lower()) if patient.gender else None
+    values = [patient.name, patient.birth_date, gender]
+    if any(value in (None, "", NOT_FOUND) for value in values):
+        return None
+    return hashlib.sha256("|".join(str(value).strip() for value in values).encode("utf-8")).hexdigest()
+
 async def insert_patient(conn, patient):
-    sql = '''INSERT INTO patients (name, age, gender, medications)
-             VALUES (?, ?, ?, ?)'''
+    """환자를 저장하고 이번 처방전의 약품을 patient_medications에 기록한다.
+
+    식별 키가 같은 환자가 이미 있으면 새 행을 만들지 않고 기존 행을 갱신해 그 id를 반환한다.
+    """
     try:
-        medications_json = json.dumps(patient.medications) if patient.medications else None
-        cursor = await conn.execute(sql, (patient.name, patient.age, patient.gender, medications_json))
+        patient_id = await _write_patient(conn, patient)
         await conn.commit()
-        return cursor.lastrowid
+        return patient_id
     except Exception as e:
         logger.error(f"환자 데이터 삽입 오류: {e}")
         await conn.rollback()
         raise
 
+async def _write_patient(conn, patient):
+    sql = '''INSERT INTO patients (name, age, gender, medications, birth_date, identity_key)
+             VALUES (?, ?, ?, ?, ?, ?)
+             ON CONFLICT (identity_key) DO UPDATE
+             SET age = excluded.age, medications = excluded.medications
+             RETURNING id'''
+    medications_json = json.dumps(patient.medications, ensure_ascii=False) if patient.medications else None
+    async with conn.execute(sql, (patient.name, patient.age, patient.gender, medications_json,
+                                  patient.birth_date, patient_identity_key(patient))) as cursor:
+        patient_id = (await cursor.fetchone())[0]
+    if patient.medications:
+        await conn.executemany(
+            'INSERT INTO patient_medications (patient_id, item_name) VALUES (?, ?)',
+            [(patient_id, item_name) for item_name in dict.fromkeys(patient.medications)])
+    return patient_id
+
+async def insert_patient_for_job(conn, job_id, patient):
+    """작업 하나에 환자 저장을 한 번만 한다. (환자 ID, 새로 저장했는지)를 반환한다.
+
+    환자 저장과 jobs.patient_id 기록을 한 트랜잭션으로 처리하므로, 저장 뒤 체크포인트 전에 워커가 중단돼
+    단계를 다시 실행하면 이미 저장한 환자 id를 돌려준다 (환자 행과 patient_medications 중복 방지).
+    """
+    async with conn.execute('SELECT patient_id FROM jobs WHERE id = ?', (job_id,)) as cursor:
+        row = await cursor.fetchone()
+    if row is not None and row[0] is not None:
+        return row[0], False
+    try:
+        patient_id = await _write_patient(conn, patient)
+        await conn.execute('UPDATE jobs SET patient_id = ? WHERE id = ?', (patient_id, job_id))
+        await conn.commit()
+        return patient_id, True
+    except Exception as e:
+        logger.error(f"환자 데이터 삽입 오류: {e}")
+        if conn.in_transaction:
+            await conn.rollback()
+        raise
+
+async def get_medication_history(conn, patient_id, before=None, limit=50):
+    """환자의 약품 복용 이력을 최신순으로 조회한다. before는 이전 페이지 마지막 항목의 id."""
+    sql = '''SELECT id, item_name, prescribed_at FROM patient_medications
+             WHERE patient_id = ? AND id < ?
+             ORDER BY id DESC LIMIT ?'''
+    async with conn.execute(sql, (patient_id, before if before is not None else 2 ** 63 - 1, limit + 1)) as cursor:
+        rows = await cursor.fetchall()
+    items = [{'id': row[0], 'item_name': row[1], 'prescribed_at': row[2]} for row in rows[:limit]]
+    next_before = items[-1]['id'] if len(rows) > limit else None
+    return items, next_before
+
+async def get_patients_by_medication(conn, item_name, after=None, limit=50):
+    """약품을 처방받은 환자를 patient_id 순으로 조회한다. after는 이전 페이지 마지막 patient_id."""
+    sql = '''SELECT patient_id, COUNT(*), MIN(prescribed_at), MAX(prescribed_at) FROM patient_medications
+             WHERE item_name = ? AND patient_id > ?
+             GROUP BY patient_id ORDER BY patient_id LIMIT ?'''
+    async with conn.execute(sql, (item_name, after if after is not None else -1, limit + 1)) as cursor:
+        rows = await cursor.fetchall()
+    items = [{'patient_id': row[0], 'prescriptions': row[1], 'first_prescribed_at': row[2],
+              'last_prescribed_at': row[3]} for row in rows[:limit]]
+    next_after = items[-1]['patient_id'] if len(rows) > limit else None
+    return items, next_after
+
 async def get_patient_by_id(conn, patient_id):
     sql = '''SELECT id, name, age, gender, medications
              FROM patients WHERE id = ?'''
@@ -341,7 +575,8 @@ async def insert_medical_chart_from_prescription(conn, patient_id, content):
     sql = '''INSERT INTO medical_charts (patient_id, content)
              VALUES (?, ?)'''
     try:
-        cursor = await conn.execute(sql, (patient_id, content))
+        cursor = await conn.execute(sql, (patient_id, encode_text(content)))
+        await index_document(conn, "medical_charts", cursor.lastrowid, new={'content': content})
         await conn.commit()
         logger.info(f"환자 ID {patient_id}의 의료 차트가 성공적으로 저장되었습니다.")
         return cursor.lastrowid
@@ -349,14 +584,516 @@ async def insert_medical_chart_from_prescription(conn, patient_id, content):
         logger.error(f"의료 차트 저장 오류: {e}")
         raise
 
+async def insert_medical_chart_for_job(conn, job_id, object_key, patient_id, content):
+    """작업 하나에 차트 하나만 만든다. (차트 ID, 새로 만들었는지)를 반환한다.
+
+    차트 저장과 객체 연결(object_links.request_id = 작업 ID)을 한 트랜잭션으로 처리하므로,
+    저장 뒤 체크포인트 전에 워커가 중단돼 단계를 다시 실행하면 이미 저장된 차트를 돌려준다.
+    """
+    async with conn.execute('''SELECT chart_id FROM object_links
+                               WHERE request_id = ? AND chart_table = 'medical_charts' ORDER BY id LIMIT 1''',
+                            (job_id,)) as cursor:
+        row = await cursor.fetchone()
+    if row is not None:
+        return row[0], False
+    try:
+        cursor = await conn.execute('INSERT INTO medical_charts (patient_id, content) VALUES (?, ?)',
+                                    (patient_id, encode_text(content)))
+        chart_id = cursor.lastrowid
+        await index_document(conn, "medical_charts", chart_id, new={'content': content})
+        await conn.execute('''INSERT INTO object_links (object_key, request_id, chart_table, chart_id)
+                              VALUES (?, ?, 'medical_charts', ?)''', (object_key, job_id, chart_id))
+        await conn.commit()
+        logger.info(f"환자 ID {patient_id}의 의료 차트가 성공적으로 저장되었습니다. (작업 {job_id})")
+        return chart_id, True
+    except Exception as e:
+        logger.error(f"의료 차트 저장 오류: {e}")
+        if conn.in_transaction:
+            await conn.rollback()
+        raise
+
 async def insert_voice_medical_chart(conn, patient_id, content):
     sql = '''INSERT INTO voice_medical_charts (patient_id, content)
              VALUES (?, ?)'''
     try:
-        cursor = await conn.execute(sql, (patient_id, content))
+        cursor = await conn.execute(sql, (patient_id, encode_text(content)))
+        await index_document(conn, "voice_medical_charts", cursor.lastrowid, new={'content': content})
         await conn.commit()
         logger.info(f"환자 ID {patient_id}의 음성 진료 차트가 성공적으로 저장되었습니다.")
         return cursor.lastrowid
     except Exception as e:
         logger.error(f"음성 진료 차트 저장 오류: {e}")
-        raise
\ No newline at end of file
+        raise
+
+# 차트 조회 API에서 허용하는 테이블 (테이블 이름은 파라미터로 바인딩할 수 없으므로 화이트리스트로 검사)
+CHART_TABLES = ("medical_charts", "voice_medical_charts")
+
+async def get_chart(conn, chart_table, chart_id):
+    if chart_table not in CHART_TABLES:
+        raise ValueError(f"알 수 없는 차트 테이블: {chart_table}")
+    sql = f'SELECT id, patient_id, content, version FROM {chart_table} WHERE id = ?'
+    try:
+        async with conn.execute(sql, (chart_id,)) as cursor:
+            row = await cursor.fetchone()
+            if row:
+                return {'id': row[0], 'patient_id': row[1], 'content': decode_text(row[2]), 'version': row[3]}
+        return None
+    except Exception as e:
+        logger.error(f"차트 조회 오류: {e}")
+        return None
+
+# 조회 API에서 선택할 수 있는 테이블별 컬럼
+TABLE_COLUMNS = {
+    "patients": ("id", "name", "age", "gender", "birth_date", "medications"),
+    "medical_charts": ("id", "patient_id", "content", "version"),
+    "voice_medical_charts": ("id", "patient_id", "content", "version"),
+}
+# 목록 조회 기본 컬럼 (차트 본문은 fields로 요청할 때만 포함)
+LIST_DEFAULT_FIELDS = {
+    "patients": TABLE_COLUMNS["patients"],
+    "medical_charts": ("id", "patient_id", "version"),
+    "voice_medical_charts": ("id", "patient_id", "version"),
+}
+
+def _projection(table, fields):
+    if table not in TABLE_COLUMNS:
+        raise ValueError(f"알 수 없는 테이블: {table}")
+    unknown = [field for field in fields if field not in TABLE_COLUMNS[table]]
+    if unknown:
+        raise ValueError(f"선택할 수 없는 컬럼: {unknown}")
+    # 커서로 쓰이는 id는 항상 포함
+    return ("id",) + tuple(field for field in dict.fromkeys(fields) if field != "id")
+
+def _row_to_dict(columns, row, table=None):
+    item = dict(zip(columns, row))
+    # 압축 컬럼은 선택된 경우에만 풀기 때문에 본문 없는 목록 조회에는 비용이 없다
+    for column in COMPRESSED_COLUMNS.get(table, ()):
+        if column in item:
+            item[column] = decode_text(item[column])
+    if item.get('medications'):
+        item['medications'] = json.loads(item['medications'])
+    return item
+
+async def list_rows(conn, table, after=None, limit=20, patient_id=None, fields=None):
+    """id 커서(after) 기준으로 다음 페이지를 조회한다. (행 목록, 다음 커서)를 반환하며 마지막 페이지면 커서는 None."""
+    columns = _projection(table, fields or LIST_DEFAULT_FIELDS[table])
+    conditions, params = [], []
+    if after is not None:
+        conditions.append("id > ?")
+        params.append(after)
+    if patient_id is not None and table != "patients":
+        conditions.append("patient_id = ?")
+        params.append(patient_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    # 다음 페이지 존재 여부를 알기 위해 하나 더 읽음
+    sql = f'SELECT {", ".join(columns)} FROM {table} {where} ORDER BY id LIMIT ?'
+    async with conn.execute(sql, (*params, limit + 1)) as cursor:
+        rows = await cursor.fetchall()
+    items = [_row_to_dict(columns, row, table) for row in rows[:limit]]
+    next_after = items[-1]['id'] if len(rows) > limit else None
+    return items, next_after
+
+async def get_row(conn, table, row_id, fields=None):
+    columns = _projection(table, fields or TABLE_COLUMNS[table])
+    sql = f'SELECT {", ".join(columns)} FROM {table} WHERE id = ?'
+    async with conn.execute(sql, (row_id,)) as cursor:
+        row = await cursor.fetchone()
+    return _row_to_dict(columns, row, table) if row else None
+
+async def insert_stored_object(conn, object_key, file_hash, file_size, content_type, original_name):
+    # 같은 키는 같은 내용이므로 이미 있으면 무시
+    sql = '''INSERT OR IGNORE INTO stored_objects (object_key, file_hash, file_size, content_type, original_name)
+             VALUES (?, ?, ?, ?, ?)'''
+    try:
+        await conn.execute(sql, (object_key, file_hash, file_size, content_type, original_name))
+        await conn.commit()
+    except Exception as e:
+        logger.error(f"저장 객체 메타데이터 삽입 오류: {e}")
+        raise
+
+async def link_stored_object(conn, object_key, request_id, chart_table=None, chart_id=None):
+    sql = '''INSERT INTO object_links (object_key, request_id, chart_table, chart_id)
+             VALUES (?, ?, ?, ?)'''
+    try:
+        cursor = await conn.execute(sql, (object_key, request_id, chart_table, chart_id))
+        await conn.commit()
+        return cursor.lastrowid
+    except Exception as e:
+        logger.error(f"객체 매핑 저장 오류: {e}")
+        raise
+
+async def get_object_keys_for_chart(conn, chart_table, chart_id):
+    sql = '''SELECT object_key, request_id, created_at FROM object_links
+             WHERE chart_table = ? AND chart_id = ? ORDER BY id'''
+    try:
+        async with conn.execute(sql, (chart_table, chart_id)) as cursor:
+            rows = await cursor.fetchall()
+            return [{'object_key': row[0], 'request_id': row[1], 'created_at': row[2]} for row in rows]
+    except Exception as e:
+        logger.error(f"차트 객체 조회 오류: {e}")
+        return []
+
+
+def _job_row_to_dict(row):
+    return {
+        'id': row[0],
+        'kind': row[1],
+        'status': row[2],
+        'stage': row[3],
+        'payload': json.loads(row[4]) if row[4] else {},
+        'state': json.loads(row[5]) if row[5] else {},
+        'attempts': row[6],
+        'error': row[7],
+        'created_at': row[8],
+        'updated_at': row[9],
+        'lease_token': row[10]
+    }
+
+_JOB_COLUMNS = 'id, kind, status, stage, payload, state, attempts, error, created_at, updated_at, lease_token'
+
+def _dump_job_json(value):
+    return json.dumps(value, ensure_ascii=False,
+                      default=lambda o: o.model_dump() if hasattr(o, 'model_dump') else str(o))
+
+async def insert_job(conn, job_id, kind, stage, payload, available_at):
+    sql = '''INSERT INTO jobs (id, kind, status, stage, payload, state, available_at)
+             VALUES (?, ?, 'queued', ?, ?, '{}', ?)'''
+    try:
+        await conn.execute(sql, (job_id, kind, stage, _dump_job_json(payload), available_at))
+        await conn.commit()
+        return job_id
+    except Exception as e:
+        logger.error(f"작업 등록 오류: {e}")
+        raise
+
+async def claim_next_job(conn, kind, now, lease_until, lease_token, max_attempts):
+    # 임대가 만료된 작업은 워커가 단계 도중에 죽은 것(OOM, 강제 종료 등)이므로 시도 횟수에 넣는다.
+    # 작업 자체가 워커를 죽이는 경우 끝없이 다시 가져가지 않도록 한도에 이르면 실패로 끝낸다
+    fail_sql = '''UPDATE jobs SET status = 'failed', attempts = attempts + 1, lease_until = NULL, lease_token = NULL,
+                                  error = COALESCE(stage, '') || ': 작업 임대 만료 (워커 중단)',
+                                  updated_at = CURRENT_TIMESTAMP
+                  WHERE kind = ? AND status = 'running' AND lease_until < ? AND attempts + 1 >= ?
+                  RETURNING id'''
+    # 대기 중이거나 임대 시간이 만료된 작업 하나를 원자적으로 가져온다 (SET 식의 status는 바뀌기 전 값)
+    sql = f'''UPDATE jobs SET status = 'running', lease_until = ?, lease_token = ?, updated_at = CURRENT_TIMESTAMP,
+                             attempts = attempts + CASE WHEN status = 'running' THEN 1 ELSE 0 END
+             WHERE id = (SELECT id FROM jobs
+                         WHERE kind = ?
+                           AND ((status = 'queued' AND available_at <= ?)
+                                OR (status = 'running' AND lease_until < ?))
+                         ORDER BY available_at LIMIT 1)
+             RETURNING {_JOB_COLUMNS}'''
+    try:
+        async with conn.execute(fail_sql, (kind, now, max_attempts)) as cursor:
+            for (job_id,) in await cursor.fetchall():
+                logger.error(f"작업 실패: {job_id} 임대 만료가 반복됨 ({max_attempts}회 시도)")
+        async with conn.execute(sql, (lease_until, lease_token, kind, now, now)) as cursor:
+            row = await cursor.fetchone()
+        await conn.commit()
+        return _job_row_to_dict(row) if row else None
+    except Exception as e:
+        logger.error(f"작업 가져오기 오류: {e}")
+        if conn.in_transaction:
+            await conn.rollback()
+        return None
+
+# 아래 함수들은 임대 토큰이 같을 때만 작업을 바꾸고, 바꿨는지를 반환한다.
+# False면 임대가 만료돼 다른 워커가 작업을 가져간 것이므로 이 워커는 작업에서 손을 떼야 한다.
+
+async def extend_job_lease(conn, job_id, lease_token, lease_until):
+    cursor = await conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running' AND lease_token = ?",
+                                (lease_until, job_id, lease_token))
+    await conn.commit()
+    return cursor.rowcount > 0
+
+async def checkpoint_job(conn, job_id, lease_token, next_stage, state, lease_until):
+    # 단계 완료 시 결과를 저장하고 다음 단계로 넘어간다 (재시작 시 여기서부터 재개)
+    sql = '''UPDATE jobs SET stage = ?, state = ?, attempts = 0, error = NULL, lease_until = ?,
+                             updated_at = CURRENT_TIMESTAMP
+             WHERE id = ? AND lease_token = ?'''
+    cursor = await conn.execute(sql, (next_stage, _dump_job_json(state), lease_until, job_id, lease_token))
+    await conn.commit()
+    return cursor.rowcount > 0
+
+async def finish_job(conn, job_id, lease_token, status, error=None):
+    sql = '''UPDATE jobs SET status = ?, error = ?, lease_until = NULL, lease_token = NULL,
+                             updated_at = CURRENT_TIMESTAMP
+             WHERE id = ? AND lease_token = ?'''
+    cursor = await conn.execute(sql, (status, error, job_id, lease_token))
+    await conn.commit()
+    return cursor.rowcount > 0
+
+async def retry_job(conn, job_id, lease_token, attempts, error, available_at):
+    sql = '''UPDATE jobs SET status = 'queued', attempts = ?, error = ?, available_at = ?, lease_until = NULL,
+                             lease_token = NULL, updated_at = CURRENT_TIMESTAMP
+             WHERE id = ? AND lease_token = ?'''
+    cursor = await conn.execute(sql, (attempts, error, available_at, job_id, lease_token))
+    await conn.commit()
+    return cursor.rowcount > 0
+
+async def get_job(conn, job_id):
+    sql = f'SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?'
+    try:
+        async with conn.execute(sql, (job_id,)) as cursor:
+            row = await cursor.fetchone()
+            return _job_row_to_dict(row) if row else None
+    except Exception as e:
+        logger.error(f"작업 조회 오류: {e}")
+        return None
+
+
+def _ocr_cache_cutoff():
+    return f'-{OCR_CACHE_TTL_HOURS} hours'
+
+async def get_ocr_page_cache(conn, page_hash):
+    sql = "SELECT result FROM ocr_page_cache WHERE page_hash = ? AND created_at >= datetime('now', ?)"
+    try:
+        async with conn.execute(sql, (page_hash, _ocr_cache_cutoff())) as cursor:
+            row = await cursor.fetchone()
+            return json.loads(row[0]) if row else None
+    except Exception as e:
+        logger.error(f"OCR 캐시 조회 오류: {e}")
+        return None
+
+async def insert_ocr_page_cache(conn, page_hash, result_json):
+    sql = 'INSERT OR REPLACE INTO ocr_page_cache (page_hash, result) VALUES (?, ?)'
+    try:
+        await conn.execute(sql, (page_hash, result_json))
+        await prune_ocr_page_cache(conn)
+        await conn.commit()
+    except Exception as e:
+        # 캐시 저장 실패는 OCR 결과에 영향을 주지 않음
+        logger.error(f"OCR 캐시 저장 오류: {e}")
+
+async def prune_ocr_page_cache(conn):
+    """보관 기간이 지난 OCR 결과를 지우고, 최대 행 수를 넘으면 오래된 것부터 지운다. 커밋은 호출자가 한다."""
+    cursor = await conn.execute("DELETE FROM ocr_page_cache WHERE created_at < datetime('now', ?)",
+                                (_ocr_cache_cutoff(),))
+    removed = cursor.rowcount
+    cursor = await conn.execute('''
+        DELETE FROM ocr_page_cache WHERE page_hash IN (
+            SELECT page_hash FROM ocr_page_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)
+    ''', (OCR_CACHE_MAX_ROWS,))
+    return removed + cursor.rowcount
+
+
+# 전문 검색 인덱스 (FTS5). 한국어는 띄어쓰기 단위 토큰화가 잘 맞지 않아 trigram 토크나이저로
+# 부분 문자열을 색인한다. 본문은 원본 테이블에만 두는 contentless 테이블이다.
+# 원본 컬럼 일부가 압축 저장되므로 트리거(SQL)로는 평문을 알 수 없어, 이 모듈의 쓰기 함수가 평문으로 직접 갱신한다.
+# 다른 도구(sqlite3 CLI, 마이그레이션 스크립트)로 원본을 고쳤다면 search_index.py로 다시 색인한다.
+# trigram은 3글자 미만 검색어(두통, 설사 등)를 찾지 못하므로 같은 본문을 두 글자 단위로 쪼개 넣은 인덱스(bigram)를 함께 둔다.
+SEARCH_INDEXES = {
+    "drug_info": {
+        "fts": "drug_info_fts",
+        "bigram": "drug_info_bigram",
+        "key": "drug_id",
+        "columns": ("품목명", "효능효과", "주의사항", "요약_보고서"),
+        "title": "품목명",
+        # bm25 컬럼 가중치 (품목명 일치를 가장 높게)
+        "weights": (10.0, 1.0, 1.0, 2.0),
+    },
+    "medical_charts": {
+        "fts": "medical_charts_fts",
+        "bigram": "medical_charts_bigram",
+        "key": "id",
+        "columns": ("content",),
+        "title": None,
+        "weights": (1.0,),
+    },
+    "voice_medical_charts": {
+        "fts": "voice_medical_charts_fts",
+        "bigram": "voice_medical_charts_bigram",
+        "key": "id",
+        "columns": ("content",),
+        "title": None,
+        "weights": (1.0,),
+    },
+}
+# 이보다 짧은 검색어는 trigram 대신 bigram 인덱스에서 찾는다
+SEARCH_MIN_TERM_LENGTH = 3
+_WORD = re.compile(r"\w+")
+
+def _bigram_text(text):
+    """bigram 인덱스에 넣을 문자열. 단어마다 연속한 두 글자와 마지막 한 글자를 공백으로 나열한다 ("발열" -> "발열 열").
+
+    두 글자 검색어는 토큰과 그대로, 한 글자 검색어는 접두어(열*)로 찾는다.
+    """
+    if not text:
+        return text
+    tokens = []
+    for word in _WORD.findall(text):
+        tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        tokens.append(word[-1])
+    return " ".join(tokens)
+
+def _search_index_ddl(spec):
+    fts = spec["fts"]
+    column_list = ", ".join(spec["columns"])
+    # 예전 버전이 만든 동기화 트리거는 SQL 함수(lc_decode)가 등록된 연결에서만 동작하므로 지운다
+    return f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, content='', tokenize='trigram');
+        CREATE VIRTUAL TABLE IF NOT EXISTS {spec["bigram"]} USING fts5({column_list}, content='', tokenize='unicode61');
+
+        DROP TRIGGER IF EXISTS {fts}_insert;
+        DROP TRIGGER IF EXISTS {fts}_delete;
+        DROP TRIGGER IF EXISTS {fts}_update;
+    '''
+
+def _search_values(drug_info):
+    """약품 정보 객체에서 검색 인덱스에 넣을 평문 값."""
+    return {column: getattr(drug_info, column, None) for column in SEARCH_INDEXES["drug_info"]["columns"]}
+
+def _index_statements(table, rowid, new=None, old=None):
+    """문서 하나의 검색 인덱스 갱신 SQL 목록. old는 전에 색인한 평문 값(수정/삭제), new는 새 평문 값(추가/수정)."""
+    spec = SEARCH_INDEXES[table]
+    columns = spec["columns"]
+    column_list = ", ".join(columns)
+    placeholders = ", ".join("?" * len(columns))
+    statements = []
+    for fts, convert in ((spec["fts"], None), (spec["bigram"], _bigram_text)):
+        if old is not None:
+            # contentless 테이블은 삭제할 때 색인했던 값을 그대로 넘겨야 한다
+            values = [old.get(column) for column in columns]
+            statements.append((f"INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', ?, {placeholders})",
+                               (rowid, *(map(convert, values) if convert else values))))
+        if new is not None:
+            values = [new.get(column) for column in columns]
+            statements.append((f"INSERT INTO {fts} (rowid, {column_list}) VALUES (?, {placeholders})",
+                               (rowid, *(map(convert, values) if convert else values))))
+    return statements
+
+async def index_document(conn, table, rowid, new=None, old=None):
+    """원본 행을 쓴 트랜잭션 안에서 검색 인덱스를 갱신한다 (커밋은 호출한 쪽에서)."""
+    for sql, params in _index_statements(table, rowid, new, old):
+        await conn.execute(sql, params)
+
+async def ensure_search_indexes(conn):
+    for table, spec in SEARCH_INDEXES.items():
+        async with conn.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN (?, ?)",
+                                (spec["fts"], spec["bigram"])) as cursor:
+            exists = (await cursor.fetchone())[0] == 2
+        await conn.executescript(_search_index_ddl(spec))
+        if not exists:
+            # 처음 만들 때 기존 행을 색인해 두어야 이후 수정할 때 이전 값을 올바르게 지울 수 있다
+            await rebuild_search_index(conn, table)
+
+async def rebuild_search_index(conn, table, batch_size=1000):
+    """검색 인덱스를 비우고 원본 테이블의 모든 행을 다시 색인한다. 색인한 행 수를 반환한다."""
+    spec = SEARCH_INDEXES[table]
+    key, columns = spec["key"], spec["columns"]
+    column_list = ", ".join(columns)
+    for fts in (spec["fts"], spec["bigram"]):
+        await conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('delete-all')")
+    last_key, indexed = -1, 0
+    while True:
+        async with conn.execute(f'SELECT {key}, {column_list} FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?',
+                                (last_key, batch_size)) as cursor:
+            rows = await cursor.fetchall()
+        if not rows:
+            break
+        # 두 인덱스에 넣을 행을 문장별로 모아 한 번에 넣는다
+        batches = {}
+        for row in rows:
+            for sql, params in _index_statements(table, row[0], new=dict(zip(columns, map(decode_text, row[1:])))):
+                batches.setdefault(sql, []).append(params)
+        for sql, params in batches.items():
+            await conn.executemany(sql, params)
+        last_key = rows[-1][0]
+        indexed += len(rows)
+    await conn.commit()
+    logger.info(f"검색 인덱스 재구축 완료: {table} {indexed}건")
+    return indexed
+
+def _quote(term):
+    # 따옴표로 감싸 FTS5 연산자로 해석되지 않게 함
+    return '"' + term.replace('"', '""') + '"'
+
+def build_match_query(query):
+    """사용자 검색어를 FTS5 MATCH 식으로 바꾼다. 공백으로 나눈 각 검색어를 모두 포함하는 문서를 찾는다.
+
+    (trigram 인덱스 식, bigram 인덱스 식, 검색어 목록)을 반환한다. 해당하는 검색어가 없는 식은 None.
+    """
+    terms = query.split()
+    if not terms:
+        raise ValueError("검색어가 비어 있습니다")
+    long_terms = [term for term in terms if len(term) >= SEARCH_MIN_TERM_LENGTH]
+    # 짧은 검색어는 bigram 인덱스와 같은 방식으로 나눈다 (두 글자는 토큰, 한 글자는 접두어)
+    pieces = [piece for term in terms if len(term) < SEARCH_MIN_TERM_LENGTH for piece in _WORD.findall(term)]
+    if not long_terms and not pieces:
+        raise ValueError("검색할 수 있는 글자가 없습니다")
+    trigram = " ".join(map(_quote, long_terms)) or None
+    bigram = " ".join(_quote(piece) if len(piece) > 1 else _quote(piece) + "*" for piece in pieces) or None
+    return trigram, bigram, terms
+
+def _snippet(text, terms, width=60):
+    if not text:
+        return ""
+    positions = [text.find(term) for term in terms if term in text]
+    if not positions:
+        return text[:width * 2]
+    start = max(min(positions) - width, 0)
+    return ("…" if start > 0 else "") + text[start:start + width * 2] + ("…" if start + width * 2 < len(text) else "")
+
+async def search_documents(conn, query, scopes=None, limit=20, offset=0):
+    """검색 인덱스에서 bm25 점수순으로 문서를 찾는다. (결과 목록, 다음 offset)을 반환한다.
+
+    query는 build_match_query의 결과 (검색어 검증은 연결을 열기 전에 한다).
+    """
+    trigram, bigram, terms = query
+    scopes = scopes or list(SEARCH_INDEXES)
+    selects, params = [], []
+    for table in scopes:
+        spec = SEARCH_INDEXES[table]
+        weights = ", ".join(str(weight) for weight in spec["weights"])
+        # 긴 검색어가 있으면 trigram 점수로 정렬하고, 짧은 검색어는 bigram 인덱스에 있는 문서로 거른다
+        fts = spec["fts"] if trigram else spec["bigram"]
+        sql = f"SELECT '{table}' AS source, rowid, bm25({fts}, {weights}) AS score FROM {fts} WHERE {fts} MATCH ?"
+        params.append(trigram or bigram)
+        if trigram and bigram:
+            sql += f" AND rowid IN (SELECT rowid FROM {spec['bigram']} WHERE {spec['bigram']} MATCH ?)"
+            params.append(bigram)
+        selects.append(sql)
+    sql = " UNION ALL ".join(selects) + " ORDER BY score LIMIT ? OFFSET ?"
+    async with conn.execute(sql, (*params, limit + 1, offset)) as cursor:
+        hits = await cursor.fetchall()
+
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    # 결과 문서의 본문은 원본 테이블에서 한 번에 읽어 미리보기를 만든다
+    documents = {}
+    for table in {source for source, _, _ in hits}:
+        spec = SEARCH_INDEXES[table]
+        ids = [rowid for source, rowid, _ in hits if source == table]
+        sql = (f'SELECT {spec["key"]}, {", ".join(spec["columns"])} FROM {table} '
+               f'WHERE {spec["key"]} IN ({", ".join("?" * len(ids))})')
+        async with conn.execute(sql, ids) as cursor:
+            for row in await cursor.fetchall():
+                documents[(table, row[0])] = dict(zip(spec["columns"], (decode_text(value) for value in row[1:])))
+
+    items = []
+    for source, rowid, score in hits:
+        spec = SEARCH_INDEXES[source]
+        document = documents.get((source, rowid), {})
+        matched = next((column for column in spec["columns"]
+                        if any(term in (document.get(column) or "") for term in terms)), spec["columns"][0])
+        items.append({
+            'source': source,
+            'id': rowid,
+            'title': document.get(spec["title"]) if spec["title"] else f"{source} #{rowid}",
+            'matched_column': matched,
+            'snippet': _snippet(document.get(matched), terms),
+            'score': round(-score, 4)
+        })
+    return items, (offset + limit if has_more else None)
+
+
+async def load_compression_dictionaries(conn):
+    async with conn.execute('SELECT id, dictionary FROM compression_dicts') as cursor:
+        use_dictionaries({row[0]: row[1] for row in await cursor.fetchall()})
+
+async def insert_compression_dictionary(conn, dictionary, sample_count):
+    cursor = await conn.execute('INSERT INTO compression_dicts (dictionary, sample_count) VALUES (?, ?)',
+                                (dictionary, sample_count))
+    await conn.commit()
+    use_dictionaries({cursor.lastrowid: dictionary})
+    return cursor.lastrowid
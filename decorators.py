@@ -1,14 +1,26 @@
-import time
 from functools import wraps
 from loguru import logger
+from metrics import timed
+from tracing import span
 
-def async_timing_decorator(func):
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = await func(*args, **kwargs)
-        end_time = time.time()
-        execution_time = end_time - start_time
-        logger.info(f"{func.__name__} 실행 시간: {execution_time:.2f}초")
-        return result
-    return wrapper
\ No newline at end of file
+def async_timing_decorator(func=None, *, stage=None, upstream="", log=True):
+    """실행 시간을 로그로 남기고 단계별 지연 시간/실행 중 수/예외 수 메트릭과 트레이스 스팬을 기록한다.
+
+    @async_timing_decorator 또는 @async_timing_decorator(upstream="llm")처럼 쓴다.
+    upstream은 외부 API 호출 구분(ocr, stt, llm, data_go_kr), log=False면 로그 없이 메트릭만 기록한다.
+    """
+    def decorate(func):
+        name = stage or func.__qualname__
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with timed(name, upstream) as timer, span(name, upstream):
+                result = await func(*args, **kwargs)
+            if log:
+                logger.info(f"{func.__name__} 실행 시간: {timer.elapsed:.3f}초")
+            return result
+        return wrapper
+
+    if func is not None:
+        return decorate(func)
+    return decorate
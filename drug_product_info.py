@@ -6,29 +6,39 @@ import asyncio
 import re
 import xml.etree.ElementTree as ET
 import html
-from langchain_handler import LangChainHandler
-from database import insert_drug_info, get_drug_info_by_name, update_drug_info
+from langchain_handler import get_langchain_handler
+from database import insert_drug_info, update_drug_info
+from dao import DrugInfoDAO
 from models import StructuredDrugInfo
 from loguru import logger
+from metrics import record_cache
+from tracing import set_attribute
+from resilience import get_upstream, raise_for_upstream_status, UpstreamError
 
 class DrugProductInfo:
     def __init__(self):
         load_dotenv()
         
         self.API_KEY = os.getenv('OPEN_DATA_API_KEY')
-        self.BASE_URL = "http://apis.data.go.kr/1471000/DrugPrdtPrmsnInfoService06"
+        self.BASE_URL = f"{os.getenv('DATA_GO_KR_BASE_URL', 'http://apis.data.go.kr/1471000')}/DrugPrdtPrmsnInfoService06"
         self.API_ENDPOINT = "getDrugPrdtPrmsnDtlInq05"
         
-        self.lang_chain_handler = LangChainHandler()
+        self.lang_chain_handler = get_langchain_handler()
         self.session = None
+        # 여러 요청이 같은 인스턴스를 동시에 쓰므로 마지막 사용자가 나갈 때만 세션을 닫는다
+        self.session_users = 0
 
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        self.session_users += 1
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
+        self.session_users -= 1
+        if self.session_users == 0 and self.session:
             await self.session.close()
+            self.session = None
 
     @staticmethod
     def clean_doc_content(content):
@@ -51,7 +61,9 @@ class DrugProductInfo:
         
         return result
 
+    @async_timing_decorator(upstream="data_go_kr", log=False)
     async def fetch_api_data(self, item_name):
+        set_attribute("item_name", item_name)
         url = f"{self.BASE_URL}/{self.API_ENDPOINT}"
         params = {
             'serviceKey': self.API_KEY,
@@ -61,11 +73,20 @@ class DrugProductInfo:
             'item_name': item_name
         }
 
-        async with self.session.get(url, params=params) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                return None
+        async def request():
+            async with self.session.get(url, params=params) as response:
+                raise_for_upstream_status("data_go_kr", response.status)
+                if response.status == 200:
+                    return await response.json()
+                else:
+                    return None
+
+        try:
+            # 멱등 조회이므로 p95 안에 응답이 없으면 헤지 요청을 보냄
+            return await get_upstream("data_go_kr").call(request, hedge=True)
+        except UpstreamError as e:
+            logger.warning(f"의약품 허가정보 조회 실패: {item_name} - {e}")
+            return None
 
     async def parse_drug_info(self, api_result, conn):
         drug_info = api_result[0]  # API 결과의 첫 번째 항목 사용
@@ -96,9 +117,12 @@ class DrugProductInfo:
         logger.info(f"structured_data 주성분: {structured_data.주성분}")
 
         # 데이터베이스에 저장
-        existing_drug = await get_drug_info_by_name(conn, structured_data.품목명)
+        # 이미 저장된 약품은 요약 컬럼만 읽음 (효능효과/용법용량/주의사항 등 큰 본문 제외)
+        existing_drug = await DrugInfoDAO(conn).get_summary_by_name(structured_data.품목명)
+        # 적중하지 않으면 LLM 요약이 필요
+        record_cache("drug_info_db", existing_drug is not None)
         if existing_drug:
-            simplified_data = existing_drug
+            simplified_data = existing_drug.to_dict()
             return simplified_data
         
         # 주요 이상반응 데이터 요약
@@ -142,6 +166,7 @@ class DrugProductInfo:
 
     @async_timing_decorator
     async def get_drug_product_info(self, item_name, conn):
+        set_attribute("item_name", item_name)
         data = await self.fetch_api_data(item_name)
         
         if data and 'body' in data and 'items' in data['body']:
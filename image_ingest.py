@@ -0,0 +1,107 @@
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+
+# PIL/reportlab은 이미지 처리 프로세스에서만 쓰므로 각 함수 안에서 import (API 프로세스 시작 시간 단축)
+
+# OCR에 충분한 해상도: 긴 변 기준 최대 픽셀 수
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", 2400))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", 80))
+# PDF 페이지 크기 계산에 쓰는 해상도
+IMAGE_PDF_DPI = int(os.getenv("IMAGE_PDF_DPI", 200))
+# 배경과 이 값 이상 차이 나는 픽셀을 문서 영역으로 본다
+IMAGE_CROP_THRESHOLD = int(os.getenv("IMAGE_CROP_THRESHOLD", 40))
+# 이미지 처리 프로세스 수
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", min(4, os.cpu_count() or 1)))
+
+_executor = None
+
+
+def start_image_pool():
+    global _executor
+    if _executor is None:
+        # 이벤트 루프 스레드가 있는 프로세스를 fork하지 않도록 spawn 사용
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        logger.info(f"이미지 처리 프로세스 풀 시작: {IMAGE_WORKERS}개")
+    return _executor
+
+
+def stop_image_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        logger.info("이미지 처리 프로세스 풀 종료")
+
+
+def _open_image(source):
+    from PIL import Image
+    if isinstance(source, (bytes, bytearray)):
+        return Image.open(io.BytesIO(source))
+    return Image.open(source)
+
+
+def _autocrop(image):
+    """모서리 색을 배경으로 보고, 배경과 충분히 다른 영역만 남긴다."""
+    from PIL import Image, ImageChops
+    gray = image.convert("L")
+    corners = [gray.getpixel(point) for point in
+               ((0, 0), (gray.width - 1, 0), (0, gray.height - 1), (gray.width - 1, gray.height - 1))]
+    background = Image.new("L", gray.size, sorted(corners)[len(corners) // 2])
+    diff = ImageChops.difference(gray, background).point(lambda value: 255 if value >= IMAGE_CROP_THRESHOLD else 0)
+    bbox = diff.getbbox()
+    if not bbox:
+        return image
+    left, top, right, bottom = bbox
+    # 잘라낸 영역이 너무 작으면 잘못 찾은 것으로 보고 원본 유지
+    if (right - left) * (bottom - top) < image.width * image.height * 0.25:
+        return image
+    margin = int(max(image.size) * 0.01)
+    return image.crop((max(left - margin, 0), max(top - margin, 0),
+                       min(right + margin, image.width), min(bottom + margin, image.height)))
+
+
+def prepare_image(source):
+    """사진 한 장을 OCR용 JPEG로 만든다: EXIF 회전 보정 -> 여백 자르기 -> 축소 -> JPEG 압축.
+
+    source는 bytes 또는 파일 경로. (JPEG bytes, 너비, 높이)를 반환한다.
+    """
+    from PIL import Image, ImageOps
+    with _open_image(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image = _autocrop(image)
+        image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+        return buffer.getvalue(), image.width, image.height
+
+
+def images_to_pdf(sources):
+    """사진들을 한 장씩 페이지로 하는 PDF를 만든다. 프로세스 풀에서 실행된다."""
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    input_bytes = 0
+    for source in sources:
+        input_bytes += len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+        jpeg, width, height = prepare_image(source)
+        page_width, page_height = width * 72 / IMAGE_PDF_DPI, height * 72 / IMAGE_PDF_DPI
+        pdf.setPageSize((page_width, page_height))
+        pdf.drawImage(ImageReader(io.BytesIO(jpeg)), 0, 0, width=page_width, height=page_height)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue(), input_bytes
+
+
+async def build_pdf_from_images(sources):
+    """이벤트 루프를 막지 않도록 프로세스 풀에서 사진들을 PDF로 변환한다."""
+    loop = asyncio.get_running_loop()
+    pdf_bytes, input_bytes = await loop.run_in_executor(start_image_pool(), images_to_pdf, sources)
+    logger.info(f"사진 {len(sources)}장 PDF 변환 완료: {input_bytes} -> {len(pdf_bytes)} 바이트")
+    return pdf_bytes
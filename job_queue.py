@@ -0,0 +1,182 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+from loguru import logger
+from tracing import start_trace, span
+from database import (
+    create_connection_async,
+    insert_job,
+    claim_next_job,
+    extend_job_lease,
+    checkpoint_job,
+    finish_job,
+    retry_job,
+    get_job
+)
+
+
+class JobQueue:
+    """SQLite(jobs 테이블)에 영속화되는 단계별 작업 큐.
+
+    stages는 (단계 이름, 코루틴 함수) 목록이다. 각 함수는 (job, state, conn)을 받아
+    state에 합칠 dict를 반환한다. 단계가 끝날 때마다 state를 체크포인트하므로
+    프로세스가 죽어도 임대 시간이 지나면 다른 워커가 마지막 완료 단계 다음부터 이어서 실행한다.
+    """
+
+    def __init__(self, kind, stages, result_keys=(), num_workers=None, max_attempts=None, lease_seconds=None,
+                 poll_interval=None, backoff_base=None):
+        self.kind = kind
+        # 완료된 작업의 상태 조회 시 state에서 결과로 돌려줄 키
+        self.result_keys = tuple(result_keys)
+        self.stages = list(stages)
+        self.stage_names = [name for name, _ in self.stages]
+        self.num_workers = num_workers or int(os.getenv('JOB_WORKERS', 2))
+        self.max_attempts = max_attempts or int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+        self.lease_seconds = lease_seconds or float(os.getenv('JOB_LEASE_SECONDS', 120))
+        self.poll_interval = poll_interval or float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+        self.backoff_base = backoff_base or float(os.getenv('JOB_BACKOFF_BASE', 2.0))
+
+        self.workers = []
+        self.wakeup = None
+        self.stopping = False
+
+    async def start(self):
+        self.stopping = False
+        self.wakeup = asyncio.Event()
+        self.workers = [asyncio.create_task(self._worker(i), name=f"{self.kind}-job-worker-{i}")
+                        for i in range(self.num_workers)]
+        logger.info(f"작업 큐 시작: {self.kind}, 워커 {self.num_workers}개")
+
+    async def stop(self, timeout=None):
+        # 진행 중인 단계가 끝나길 기다리고, 시간 초과 시 취소 (임대 만료 후 재개됨)
+        timeout = timeout if timeout is not None else float(os.getenv('JOB_STOP_TIMEOUT', 30.0))
+        self.stopping = True
+        if self.wakeup:
+            self.wakeup.set()
+        if not self.workers:
+            return
+        done, pending = await asyncio.wait(self.workers, timeout=timeout)
+        for worker in pending:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        logger.info(f"작업 큐 종료: {self.kind}")
+
+    async def submit(self, payload, conn=None) -> str:
+        job_id = uuid.uuid4().hex
+        if conn is None:
+            async with create_connection_async() as conn:
+                await insert_job(conn, job_id, self.kind, self.stage_names[0], payload, time.time())
+        else:
+            await insert_job(conn, job_id, self.kind, self.stage_names[0], payload, time.time())
+        if self.wakeup:
+            self.wakeup.set()
+        logger.info(f"작업 등록: {self.kind} {job_id}")
+        return job_id
+
+    async def get_status(self, job_id, conn):
+        job = await get_job(conn, job_id)
+        if job is None or job['kind'] != self.kind:
+            return None
+        if job['status'] == 'succeeded':
+            completed = len(self.stage_names)
+        elif job['stage'] in self.stage_names:
+            completed = self.stage_names.index(job['stage'])
+        else:
+            completed = 0
+        status = {
+            'job_id': job['id'],
+            'status': job['status'],
+            'stage': job['stage'] if job['status'] != 'succeeded' else None,
+            'completed_stages': self.stage_names[:completed],
+            'progress': round(completed / len(self.stage_names), 2),
+            'attempts': job['attempts'],
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
+        }
+        if job['status'] == 'succeeded':
+            status['result'] = {key: job['state'].get(key) for key in self.result_keys}
+        return status
+
+    async def _worker(self, worker_id):
+        async with create_connection_async() as conn:
+            while not self.stopping:
+                # 임대 토큰: 임대가 만료돼 다른 워커가 같은 작업을 가져가면 이 워커의 체크포인트/완료 기록은 무시된다
+                job = await claim_next_job(conn, self.kind, time.time(), time.time() + self.lease_seconds,
+                                           uuid.uuid4().hex, self.max_attempts)
+                if job is None:
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                try:
+                    with start_trace(f"job {self.kind}", job_id=job['id'], attempt=job['attempts'] + 1):
+                        await self._run_job(job, conn)
+                except Exception as e:
+                    logger.error(f"작업 워커 {worker_id} 오류: {job['id']} - {e}")
+
+    async def _heartbeat(self, job_id, lease_token):
+        # 단계가 쓰는 연결로 커밋하면 단계의 쓰기가 중간에 커밋되므로 별도 연결 사용
+        async with create_connection_async() as conn:
+            while True:
+                await asyncio.sleep(self.lease_seconds / 3)
+                try:
+                    extended = await extend_job_lease(conn, job_id, lease_token, time.time() + self.lease_seconds)
+                except Exception as e:
+                    logger.warning(f"작업 임대 연장 실패: {job_id} - {e}")
+                    continue
+                if not extended:
+                    logger.warning(f"작업 임대를 잃었습니다 (다른 워커가 가져감): {job_id}")
+                    return
+
+    async def _run_job(self, job, conn):
+        heartbeat = asyncio.create_task(self._heartbeat(job['id'], job['lease_token']))
+        try:
+            await self._run_stages(job, conn)
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+
+    async def _run_stages(self, job, conn):
+        token = job['lease_token']
+        state = job['state']
+        start_index = self.stage_names.index(job['stage']) if job['stage'] in self.stage_names else 0
+        if start_index > 0 or job['attempts'] > 0:
+            logger.info(f"작업 재개: {job['id']} 단계 {job['stage']} (시도 {job['attempts'] + 1})")
+
+        for index in range(start_index, len(self.stages)):
+            name, stage_func = self.stages[index]
+            try:
+                logger.info(f"작업 단계 시작: {job['id']} {name}")
+                with span(f"{self.kind}.{name}"):
+                    updates = await stage_func(job, state, conn)
+            except Exception as e:
+                attempts = job['attempts'] + 1
+                error = f"{name}: {e}"
+                if attempts >= self.max_attempts:
+                    logger.error(f"작업 실패: {job['id']} {error} ({attempts}회 시도)")
+                    owned = await finish_job(conn, job['id'], token, 'failed', error)
+                else:
+                    delay = self.backoff_base * (2 ** (attempts - 1)) * (1 + random.random())
+                    logger.warning(f"작업 단계 재시도 예정: {job['id']} {error} ({delay:.1f}초 후)")
+                    owned = await retry_job(conn, job['id'], token, attempts, error, time.time() + delay)
+                if not owned:
+                    logger.warning(f"작업 임대를 잃어 결과를 기록하지 않았습니다: {job['id']} {name}")
+                return
+
+            state.update(updates or {})
+            job['attempts'] = 0
+            next_stage = self.stage_names[index + 1] if index + 1 < len(self.stages) else None
+            if not await checkpoint_job(conn, job['id'], token, next_stage, state, time.time() + self.lease_seconds):
+                logger.warning(f"작업 임대를 잃어 중단합니다: {job['id']} {name} 이후")
+                return
+
+        if not await finish_job(conn, job['id'], token, 'succeeded'):
+            logger.warning(f"작업 임대를 잃어 완료를 기록하지 않았습니다: {job['id']}")
+            return
+        logger.info(f"작업 완료: {job['id']}")
@@ -1,50 +1,86 @@
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
-from langchain.schema import StrOutputParser
-from langchain_upstage import ChatUpstage
-from langchain_openai import ChatOpenAI
 from loguru import logger
+from decorators import async_timing_decorator
+from log_config import log_payload
+from resilience import get_upstream
+
+# langchain/openai 모듈 import와 채팅 클라이언트 생성은 수 초가 걸리므로 처음 쓸 때 한다.
+# 여러 워커를 fork하는 운영 서버(serve.py)는 preload_modules()로 마스터에서 모듈만 미리 import해 공유한다.
 
 class LangChainHandler:
     def __init__(self):
-        self.upstage_model = ChatUpstage(model="solar-1-mini-chat")
-        self.gpt4o_mini_model = ChatOpenAI(model="gpt-4o-mini")
-        self.gpt4o_model = ChatOpenAI(model="gpt-4o")
+        # 모델 이름 -> 채팅 클라이언트, 프롬프트 이름 -> 체인
+        self._models = {}
+        self._chains = {}
+
+    def _model(self, name):
+        model = self._models.get(name)
+        if model is None:
+            if name.startswith("solar"):
+                from langchain_upstage import ChatUpstage
+                model = ChatUpstage(model=name)
+            else:
+                from langchain_openai import ChatOpenAI
+                model = ChatOpenAI(model=name)
+            self._models[name] = model
+        return model
+
+    @property
+    def upstage_model(self):
+        return self._model("solar-1-mini-chat")
+
+    @property
+    def gpt4o_mini_model(self):
+        return self._model("gpt-4o-mini")
 
+    @property
+    def gpt4o_model(self):
+        return self._model("gpt-4o")
+
+    def _chain(self, prompt_name, json_output=False):
+        # 체인은 상태가 없으므로 프롬프트별로 한 번만 만들어 재사용
+        chain = self._chains.get(prompt_name)
+        if chain is None:
+            from langchain_core.prompts import ChatPromptTemplate
+            from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+            prompt = ChatPromptTemplate.from_template(self.load_prompt(prompt_name))
+            parser = JsonOutputParser() if json_output else StrOutputParser()
+            chain = self._chains[prompt_name] = prompt | self.gpt4o_mini_model | parser
+        return chain
+
+    @async_timing_decorator(upstream="llm")
     async def extract_metadata(self, text, pill_info, temperature=0.0):
-        base_prompt = self.load_prompt("extract_metadata_0.0.6")
-        prompt = ChatPromptTemplate.from_template(base_prompt)
-        chain = prompt | self.gpt4o_mini_model | JsonOutputParser()
-        response = await chain.ainvoke({"text": text})
+        chain = self._chain("extract_metadata_0.0.6", json_output=True)
+        response = await self._invoke(chain, {"text": text})
         return response
 
+    @async_timing_decorator(upstream="llm")
     async def create_medical_chart(self, text, temperature=0.0):
         logger.info("의료 차트 생성 시작")
-        base_prompt = self.load_prompt("create_medical_chart_0.0.0")
-        prompt = ChatPromptTemplate.from_template(base_prompt)
-        chain = prompt | self.gpt4o_mini_model | StrOutputParser()
-        response = await chain.ainvoke({"CONVERSATION_TRANSCRIPT": text})
-        logger.info(f"response_create_medical_chart: {response}")
+        chain = self._chain("create_medical_chart_0.0.0")
+        response = await self._invoke(chain, {"CONVERSATION_TRANSCRIPT": text})
+        log_payload("response_create_medical_chart", response)
         return response
 
+    @async_timing_decorator(upstream="llm")
     async def summarize_drug_info(self, drug_info, reference_data, temperature=0.0):
         logger.info("약물 정보 요약 시작")
-        base_prompt = self.load_prompt("summarize_drug_info_0.0.6")
-        prompt = ChatPromptTemplate.from_template(base_prompt)
-        chain = prompt | self.gpt4o_mini_model | StrOutputParser()
-        response = await chain.ainvoke({"DOCUMENT": drug_info, "REFERENCE_DATA": reference_data})
-        logger.info(f"response_summarize_drug_info: {response}")
+        chain = self._chain("summarize_drug_info_0.0.6")
+        response = await self._invoke(chain, {"DOCUMENT": drug_info, "REFERENCE_DATA": reference_data})
+        log_payload("response_summarize_drug_info", response)
         return response
 
+    @async_timing_decorator(upstream="llm")
     async def create_multidisciplinary_care(self, patient_info, drug_info, temperature=0.0):
         logger.info("다학제 진료 계획 생성 시작")
-        base_prompt = self.load_prompt("create_multidisciplinary_care_0.1.3")
-        prompt = ChatPromptTemplate.from_template(base_prompt)
-        chain = prompt | self.gpt4o_mini_model | StrOutputParser()
-        response = await chain.ainvoke({"PATIENT_INFO": patient_info, "DRUG_INFO": drug_info})
-        logger.info(f"response_create_multidisciplinary_care: {response}")
+        chain = self._chain("create_multidisciplinary_care_0.1.3")
+        response = await self._invoke(chain, {"PATIENT_INFO": patient_info, "DRUG_INFO": drug_info})
+        log_payload("response_create_multidisciplinary_care", response)
         return response
 
+    async def _invoke(self, chain, inputs):
+        # LLM 호출은 비용이 크고 결과가 매번 달라 헤지하지 않고 제한 시간과 서킷 브레이커만 적용
+        return await get_upstream("llm").call(lambda: chain.ainvoke(inputs))
+
     def load_prompt(self, file_name):
         root_path = "prompts/"
         full_path = root_path + file_name + ".xml"
@@ -54,4 +90,27 @@ class LangChainHandler:
             return data
         except Exception as e:
             logger.error(f"프롬프트 로딩 중 오류 발생: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+
+_handler = None
+
+
+def get_langchain_handler():
+    """프로세스에서 공유하는 LangChainHandler. 클라이언트와 체인을 요청마다 새로 만들지 않는다."""
+    global _handler
+    if _handler is None:
+        _handler = LangChainHandler()
+    return _handler
+
+
+def preload_modules():
+    """langchain/openai 모듈만 미리 import한다 (클라이언트는 만들지 않음).
+
+    fork 전 마스터에서 호출하면 워커들이 import된 모듈 메모리를 공유하고 첫 LLM 호출이 빨라진다.
+    HTTP 클라이언트(연결 풀)는 fork 뒤 워커에서 만들어야 하므로 여기서 만들지 않는다.
+    """
+    import langchain_core.prompts  # noqa: F401
+    import langchain_core.output_parsers  # noqa: F401
+    import langchain_openai  # noqa: F401
+    import langchain_upstage  # noqa: F401
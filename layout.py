@@ -0,0 +1,167 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from loguru import logger
+
+# 약품 표 머리글의 "약품명" 열 키워드 (공백 제거 후 비교)
+MEDICATION_NAME_HEADERS = ("처방의약품의명칭", "의약품의명칭", "의약품명칭", "약품명칭", "약품명", "의약품명", "명칭")
+# 약품 표 머리글의 나머지 열 키워드
+MEDICATION_COLUMN_HEADERS = ("1회투약량", "투약량", "1회투여량", "투여량", "1일투여횟수", "투여횟수", "횟수",
+                             "총투약일수", "투약일수", "일수", "용법")
+# 약품 표가 끝났음을 나타내는 키워드
+MEDICATION_END_MARKERS = ("주사제처방내역", "주사제", "사용기간", "조제시참고사항", "조제내역", "의료기관",
+                          "처방의료인", "본인부담", "조제약사", "조제기관", "약제비", "수납", "합계", "발행기관")
+# 환자 정보 블록 키워드
+PATIENT_MARKERS = ("성명", "환자명", "수진자", "주민등록번호", "주민번호", "생년월일", "성별", "나이", "연령")
+
+
+@dataclass
+class Line:
+    page: int
+    words: List[Dict[str, Any]]
+    top: float
+    bottom: float
+
+    @property
+    def text(self):
+        return " ".join(word['text'] for word in self.words)
+
+    @property
+    def compact(self):
+        return re.sub(r"\s+", "", self.text)
+
+
+@dataclass
+class LayoutRegions:
+    medication_text: str
+    patient_text: str
+    found_medication: bool = False
+    found_patient: bool = False
+    stats: Dict[str, int] = field(default_factory=dict)
+
+
+def _box(word):
+    vertices = word.get('boundingBox', {}).get('vertices') or []
+    xs = [vertex.get('x', 0) for vertex in vertices]
+    ys = [vertex.get('y', 0) for vertex in vertices]
+    if not xs or not ys:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def group_lines(page_index, words) -> List[Line]:
+    """단어 박스를 세로 중심이 가까운 것끼리 묶어 줄로 만든다."""
+    boxed = []
+    for word in words:
+        box = _box(word)
+        if box and word.get('text'):
+            boxed.append({'text': word['text'], 'x0': box[0], 'y0': box[1], 'x1': box[2], 'y1': box[3]})
+    if not boxed:
+        return []
+    heights = sorted(word['y1'] - word['y0'] for word in boxed)
+    tolerance = max(heights[len(heights) // 2] * 0.5, 1)
+
+    lines = []
+    for word in sorted(boxed, key=lambda w: (w['y0'] + w['y1']) / 2):
+        center = (word['y0'] + word['y1']) / 2
+        if lines and abs(center - (lines[-1].top + lines[-1].bottom) / 2) <= tolerance:
+            line = lines[-1]
+            line.words.append(word)
+            line.top = min(line.top, word['y0'])
+            line.bottom = max(line.bottom, word['y1'])
+        else:
+            lines.append(Line(page_index, [word], word['y0'], word['y1']))
+    for line in lines:
+        line.words.sort(key=lambda w: w['x0'])
+    return lines
+
+
+def _find_medication_header(lines) -> Optional[int]:
+    best_index, best_score = None, 0
+    for index, line in enumerate(lines):
+        compact = line.compact
+        has_name = any(header in compact for header in MEDICATION_NAME_HEADERS)
+        columns = sum(1 for header in MEDICATION_COLUMN_HEADERS if header in compact)
+        score = (2 if has_name else 0) + columns
+        if has_name and score > best_score:
+            best_index, best_score = index, score
+    return best_index if best_score >= 3 else None
+
+
+def _name_column_bounds(header_line):
+    """머리글 줄에서 약품명 열의 오른쪽 경계(다음 열 머리글의 시작 x)를 찾는다."""
+    name_x = None
+    for word in header_line.words:
+        compact = re.sub(r"\s+", "", word['text'])
+        if name_x is None and any(header in compact or compact in header for header in MEDICATION_NAME_HEADERS
+                                  if len(compact) >= 2):
+            name_x = word['x0']
+        elif (name_x is not None and len(compact) >= 2
+              and not any(compact in header for header in MEDICATION_NAME_HEADERS)
+              and any(header in compact or compact in header for header in MEDICATION_COLUMN_HEADERS)):
+            return word['x0']
+    return None
+
+
+def _medication_lines(lines, header_index):
+    header = lines[header_index]
+    right_bound = _name_column_bounds(header)
+    region = []
+    for line in lines[header_index + 1:]:
+        if line.page != header.page:
+            break
+        if any(marker in line.compact for marker in MEDICATION_END_MARKERS):
+            break
+        words = line.words
+        if right_bound is not None:
+            # 약품명 열에 걸친 단어만 남겨 투약량/횟수/일수 숫자를 제외
+            words = [word for word in words if word['x0'] < right_bound]
+        if words:
+            region.append(" ".join(word['text'] for word in words))
+    return region
+
+
+def _patient_lines(lines, stop_index=None):
+    region = []
+    selected = set()
+    for index, line in enumerate(lines[:stop_index]):
+        if any(marker in line.compact for marker in PATIENT_MARKERS):
+            # 값이 머리글 아래 줄에 오는 표 서식을 위해 다음 줄도 포함
+            for candidate in (index, index + 1):
+                if candidate < len(lines) and candidate not in selected and (stop_index is None or candidate < stop_index):
+                    selected.add(candidate)
+                    region.append(lines[candidate].text)
+    return region
+
+
+def extract_regions(ocr_result: Dict[str, Any]) -> LayoutRegions:
+    """OCR 응답의 단어 좌표로 약품 표와 환자 정보 블록을 찾아 해당 영역의 텍스트만 돌려준다.
+
+    영역을 찾지 못하면 해당 텍스트는 전체 텍스트로 대체한다.
+    """
+    full_text = ocr_result.get('text', '')
+    lines = []
+    for page_index, page in enumerate(ocr_result.get('pages', []) or []):
+        lines.extend(group_lines(page_index, page.get('words', []) or []))
+
+    header_index = _find_medication_header(lines) if lines else None
+    medication_lines = _medication_lines(lines, header_index) if header_index is not None else []
+    patient_lines = _patient_lines(lines, header_index) if lines else []
+
+    regions = LayoutRegions(
+        medication_text="\n".join(medication_lines) if medication_lines else full_text,
+        patient_text="\n".join(patient_lines) if patient_lines else full_text,
+        found_medication=bool(medication_lines),
+        found_patient=bool(patient_lines),
+        stats={
+            'lines': len(lines),
+            'full_chars': len(full_text),
+            'medication_chars': sum(len(line) for line in medication_lines),
+            'patient_chars': sum(len(line) for line in patient_lines),
+        }
+    )
+    logger.info(f"레이아웃 분석: 약품 표 {'발견' if regions.found_medication else '미발견'}, "
+                f"환자 정보 {'발견' if regions.found_patient else '미발견'}, "
+                f"텍스트 {regions.stats['full_chars']} -> 약품 {len(regions.medication_text)} / "
+                f"환자 {len(regions.patient_text)} 문자")
+    return regions
@@ -0,0 +1,119 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+from collections import OrderedDict
+from loguru import logger
+from metadata_rules import NAME_PATTERN
+from tracing import current_trace_id
+
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE_LEVEL = os.getenv("LOG_FILE_LEVEL", "DEBUG")
+# 파일 로그를 한 줄에 JSON 하나로 기록 (0이면 텍스트)
+LOG_JSON = os.getenv("LOG_JSON", "1") == "1"
+# 환자 이름/주민등록번호/전화번호 가리기
+LOG_REDACT = os.getenv("LOG_REDACT", "1") == "1"
+# 로그 메시지 한 건의 최대 길이
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", 4000))
+# log_payload: 이보다 긴 본문은 LOG_PAYLOAD_SAMPLE_RATE 비율로만 내용을 남기고 나머지는 길이만 기록
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", 1000))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 0.05))
+# 예외 traceback에 변수 값을 찍지 않음 (환자 정보가 그대로 남음)
+LOG_DIAGNOSE = os.getenv("LOG_DIAGNOSE", "0") == "1"
+# 로그에서 가릴 최근 환자 이름 수
+LOG_REDACT_NAME_CACHE = int(os.getenv("LOG_REDACT_NAME_CACHE", 1000))
+
+MASK = "***"
+RRN_MASK = "******-*******"
+# 생년월일 6자리 + 뒷자리 7자리 (하이픈 생략, 뒷자리 마스킹 허용)
+RRN_PATTERN = re.compile(r"(?<!\d)\d{2}(?:0[1-9]|1[0-2])(?:0[1-9]|[12]\d|3[01])\s*-?\s*[1-8][\d*Xx●]{6}(?![\d*])")
+PHONE_PATTERN = re.compile(r"(?<!\d)01[016789]\s*-?\s*\d{3,4}\s*-?\s*\d{4}(?!\d)")
+# dict/모델 repr과 JSON의 이름 필드: {'name': '홍길동'}, name='홍길동', "성명": "홍길동"
+NAME_FIELD_PATTERN = re.compile(r"""((?<![\w])['"]?(?:name|patient_name|이름|성명|환자명)['"]?\s*[:=]\s*)(['"])(.*?)\2""")
+HANGUL_WORD_PATTERN = re.compile(r"[가-힣]{2,}")
+
+# 최근 추출한 환자 이름 (라벨 없이 LLM 응답 등에 나오는 이름도 가리기 위해)
+_patient_names = OrderedDict()
+_patient_names_lock = threading.Lock()
+
+
+def remember_patient_name(name):
+    if not isinstance(name, str) or not 2 <= len(name) <= 5 or not HANGUL_WORD_PATTERN.fullmatch(name):
+        return
+    with _patient_names_lock:
+        _patient_names[name] = True
+        _patient_names.move_to_end(name)
+        while len(_patient_names) > LOG_REDACT_NAME_CACHE:
+            _patient_names.popitem(last=False)
+
+
+def _known_names_in(text):
+    # 조사가 붙은 단어("홍길동님은")도 찾도록 한글 단어의 앞 2~5글자를 이름 목록과 비교
+    found = set()
+    for word in HANGUL_WORD_PATTERN.findall(text):
+        for length in range(2, min(len(word), 5) + 1):
+            if word[:length] in _patient_names:
+                found.add(word[:length])
+    return found
+
+
+def _mask_label(match):
+    start, end = match.span(1)
+    return match.group(0)[:start - match.start()] + MASK + match.group(0)[end - match.start():]
+
+
+def redact(text):
+    """로그 문자열에서 주민등록번호, 휴대폰 번호, 환자 이름을 가린다."""
+    text = RRN_PATTERN.sub(RRN_MASK, text)
+    text = PHONE_PATTERN.sub(MASK, text)
+    text = NAME_FIELD_PATTERN.sub(lambda match: f"{match.group(1)}{match.group(2)}{MASK}{match.group(2)}", text)
+    text = NAME_PATTERN.sub(_mask_label, text)
+    if _patient_names:
+        for name in _known_names_in(text):
+            text = text.replace(name, MASK)
+    return text
+
+
+def _truncate(text, limit):
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]} …({len(text) - limit}자 생략)"
+
+
+def _patch_record(record):
+    # 싱크에 넘기기 전에 모든 메시지에 적용 (싱크별 포맷/직렬화보다 먼저 실행됨)
+    message = record["message"]
+    if LOG_REDACT:
+        message = redact(message)
+    record["message"] = _truncate(message, LOG_MAX_MESSAGE_CHARS)
+    trace_id = current_trace_id()
+    if trace_id:
+        record["extra"]["trace_id"] = trace_id
+
+
+def log_payload(label, payload, level="DEBUG"):
+    """LLM/STT 응답처럼 큰 본문을 로그로 남긴다. 긴 본문은 일부만 샘플링하고 길이 제한을 둔다."""
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str)
+    log = logger.opt(depth=1)
+    if len(text) > LOG_PAYLOAD_MAX_CHARS and random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        log.log(level, f"{label}: {len(text)}자 (본문 생략)")
+        return
+    log.log(level, f"{label}: {_truncate(text, LOG_PAYLOAD_MAX_CHARS)}")
+
+
+def configure_logging():
+    """로그 싱크 설정. 쓰기는 백그라운드 스레드에서 처리해(enqueue) 이벤트 루프를 막지 않는다."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    logger.remove()  # 기본 핸들러 제거
+    logger.configure(patcher=_patch_record)
+    logger.add(sys.stderr, format="{time} {level} {message}", level=LOG_LEVEL, enqueue=True,
+               backtrace=False, diagnose=LOG_DIAGNOSE)
+    if LOG_JSON:
+        logger.add(f"{LOG_DIR}/app.jsonl", rotation="500 MB", retention="10 days", level=LOG_FILE_LEVEL,
+                   serialize=True, enqueue=True, diagnose=LOG_DIAGNOSE)
+    else:
+        logger.add(f"{LOG_DIR}/app.log", rotation="500 MB", retention="10 days", level=LOG_FILE_LEVEL,
+                   enqueue=True, diagnose=LOG_DIAGNOSE)
@@ -1,47 +1,80 @@
 import asyncio
 import hashlib
 from clova_speech_client import transcribe_audio
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, HTTPException, Response, Request, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import Any, List, Dict, Union, Optional
-import requests
+from typing import Any, Optional
 import json
-from langchain_handler import LangChainHandler
+from langchain_handler import get_langchain_handler
 from langchain_teddynote import logging
 from dotenv import load_dotenv
 import os
 from loguru import logger
-import sys
-import time
-from functools import wraps, partial
-import aiohttp
 import time
+import uuid
 from database import (
     create_tables,
-    insert_drug_info,
-    insert_voice_medical_chart,
-    get_medical_chart_by_hash,
-    insert_medical_chart_from_prescription,
     insert_voice_medical_chart,
-    update_medical_chart, create_connection_async,
-    create_connection_sync
+    update_medical_chart, update_prescription, get_version, create_connection_async,
+    insert_stored_object,
+    link_stored_object,
+    get_chart,
+    list_rows,
+    get_row,
+    get_medication_history,
+    get_patients_by_medication,
+    search_documents,
+    build_match_query,
+    SEARCH_INDEXES
 )
-from open_data_grain import OpenDataGrain
 from prescription_handler import PrescriptionHandler
+from metadata_rules import rule_hit_stats
+from prescription_jobs import create_prescription_job_queue, spool_job_file
 from models import PrescriptionData
 from decorators import async_timing_decorator
-from ocr import document_ocr  # 이 import 문을 파일 상단에 추가해주세요
-from s3 import upload_file_to_s3
+from metrics import current_endpoint, timed, register_stats, HTTP_DURATION, HTTP_IN_FLIGHT
+from log_config import configure_logging
+from admission import admission_controller, release_after_body, AdmissionRejected
+from resilience import (
+    get_upstream,
+    upstream_stats,
+    deadline_scope,
+    CircuitOpenError,
+    UpstreamTimeout,
+    DeadlineExceeded,
+)
+from tracing import start_trace, end_after_body, span, trace_exporter, TRACE_SERVER_TIMING
+from profiler import (
+    ADMIN_TOKEN,
+    PROFILER_MAX_SECONDS,
+    is_admin_token,
+    install_task_tracking,
+    profile_process,
+    profile_request,
+    profile_path,
+    save_profile
+)
+from prometheus_client import generate_latest, multiprocess, CollectorRegistry, CONTENT_TYPE_LATEST
+from starlette.routing import Match
+from ocr import close_session as close_ocr_session
+from s3 import content_address_key
+from upload_service import upload_service
+from upload_ingest import (
+    ingest_multipart,
+    multipart_request_body,
+    SpooledUpload,
+    UPLOAD_SIZE_LIMITS,
+    MAX_PRESCRIPTION_UPLOAD_BYTES,
+    MAX_AUDIO_UPLOAD_BYTES,
+    MAX_IMAGE_UPLOAD_BYTES
+)
+
+from image_ingest import build_pdf_from_images, start_image_pool, stop_image_pool
+from chart_export import export_chart_pdf, start_export_pool, stop_export_pool
 
 from contextlib import asynccontextmanager
-from PIL import Image
-import io
-import math
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
-from reportlab.lib.utils import ImageReader
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -50,11 +83,27 @@ async def lifespan(app: FastAPI):
     async with create_connection_async() as conn:
         await create_tables(conn)
         logger.info("DB 테이블 생성 완료")
+    await trace_exporter.start()
+    if ADMIN_TOKEN:
+        # X-Profile 헤더로 요청 하나만 프로파일링할 수 있도록 태스크 소속을 기록
+        install_task_tracking()
+    await upload_service.start()
+    await prescription_job_queue.start()
+    start_image_pool()
+    start_export_pool()
     
     yield
     
-    # 종료 시 실행 (필요한 경우)
+    # 종료 시 실행: 진행 중인 작업과 남은 S3 업로드를 모두 처리한 뒤 종료
+    await prescription_job_queue.stop()
+    await upload_service.stop()
+    await asyncio.to_thread(stop_image_pool)
+    await asyncio.to_thread(stop_export_pool)
+    await close_ocr_session()
+    await trace_exporter.stop()
     logger.info("애플리케이션 종료")
+    # 큐에 남은 로그를 모두 쓴 뒤 종료
+    await logger.complete()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -74,74 +123,395 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 'logs' 디렉토리 확인 및 생성
-log_dir = "logs"
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-    logger.info(f"'{log_dir}' 디렉토리가 생성되었습니다.")
+@app.middleware("http")
+async def limit_upload_size(request, call_next):
+    # 본문을 받기 전에 Content-Length로 엔드포인트별 크기 제한을 먼저 검사
+    limit = UPLOAD_SIZE_LIMITS.get(request.url.path)
+    content_length = request.headers.get("content-length")
+    if limit and content_length and content_length.isdigit() and int(content_length) > limit:
+        return JSONResponse(status_code=413,
+                            content={"detail": f"업로드 파일이 최대 크기({limit // (1024 * 1024)}MB)를 초과했습니다"})
+    return await call_next(request)
+
+def _route_template(request):
+    # id가 들어간 실제 경로 대신 라우트 경로 템플릿을 레이블로 사용 (레이블 수 제한)
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+async def _call_with_profile(request, call_next, profile_id):
+    # 이 요청의 태스크가 이벤트 루프에서 실행된 시간만 샘플링해 /admin/profiles/{id}로 받을 수 있게 저장
+    with profile_request(profile_id) as (profile_id, sampler):
+        response = await call_next(request)
+    await asyncio.to_thread(save_profile, profile_id, sampler)
+    logger.info(f"요청 프로파일 저장: {profile_id} ({request.url.path}, 샘플 {sum(sampler.counts.values())}개)")
+    response.headers["X-Profile-ID"] = profile_id
+    return response
+
+def _request_timeout(request):
+    value = request.headers.get("x-request-timeout")
+    try:
+        return max(float(value), 0.0) if value else None
+    except ValueError:
+        return None
+
+async def _admitted_call(request, call_next, endpoint, root):
+    # 엔드포인트별 동시 실행 한도와 우선순위 대기열. 마감 안에 시작할 수 없으면 429로 바로 거절
+    timeout = _request_timeout(request)
+    try:
+        with span("admission"):
+            ticket = await admission_controller.admit(endpoint, request.method, timeout)
+    except AdmissionRejected as e:
+        return JSONResponse(status_code=429, headers={"Retry-After": str(e.retry_after)},
+                            content={"detail": "요청이 많아 처리할 수 없습니다. 잠시 후 다시 시도해 주세요", "reason": e.reason})
+    try:
+        # 남은 마감 시간을 업스트림 호출 제한 시간에 반영 (대기열에서 보낸 시간 포함)
+        with deadline_scope(timeout):
+            if request.headers.get("x-profile") == "1" and is_admin_token(request.headers.get("x-admin-token")):
+                response = await _call_with_profile(request, call_next, root.trace.trace_id if root else None)
+            else:
+                response = await call_next(request)
+    except BaseException:
+        if ticket is not None:
+            ticket.release()
+        raise
+    return release_after_body(response, ticket)
+
+@app.middleware("http")
+async def instrument_request(request, call_next):
+    # 요청별 메트릭과 트레이스 루트 스팬 (하위 태스크는 컨텍스트를 복사해 같은 트레이스에 스팬을 남김)
+    endpoint = _route_template(request)
+    token = current_endpoint.set(endpoint)
+    in_flight = HTTP_IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    start_time = time.perf_counter()
+    status = 500
+    try:
+        with start_trace(f"{request.method} {endpoint}", endpoint=endpoint, method=request.method) as root:
+            response = await _admitted_call(request, call_next, endpoint, root)
+            status = response.status_code
+            if root is not None:
+                root.attributes['status'] = status
+                response.headers["X-Trace-ID"] = root.trace.trace_id
+                if TRACE_SERVER_TIMING:
+                    response.headers["Server-Timing"] = root.trace.server_timing(root)
+                # 루트 스팬은 본문까지 다 보낸 뒤에 닫아 스트리밍 중 생긴 스팬도 함께 내보냄
+                response = end_after_body(response, root)
+        return response
+    finally:
+        in_flight.dec()
+        HTTP_DURATION.labels(endpoint, request.method, str(status)).observe(time.perf_counter() - start_time)
+        current_endpoint.reset(token)
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request, exc):
+    # 업스트림 장애 중에는 기다리지 않고 바로 503으로 응답
+    return JSONResponse(status_code=503, headers={"Retry-After": str(exc.retry_after)},
+                        content={"detail": f"외부 서비스({exc.upstream})를 일시적으로 사용할 수 없습니다"})
 
-# 로거 설정
-logger.remove()  # 기본 핸들러 제거
-logger.add(sys.stderr, format="{time} {level} {message}", level="INFO")
-logger.add(f"{log_dir}/app.log", rotation="500 MB", retention="10 days", level="DEBUG")
+@app.exception_handler(UpstreamTimeout)
+@app.exception_handler(DeadlineExceeded)
+async def upstream_timeout_handler(request, exc):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
-def calculate_file_hash(file_binary):
-    return hashlib.md5(file_binary).hexdigest()
+# 로거 설정 (백그라운드 쓰기, 환자 정보 가리기, 파일은 JSON)
+configure_logging()
 
-langchain_handler = LangChainHandler()
+# 일괄 처방전 처리 설정
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 8))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 50))
+# 사진 처방전 한 건에 올릴 수 있는 최대 사진 수
+IMAGE_MAX_FILES = int(os.getenv("IMAGE_MAX_FILES", 10))
+
+# 목록 조회 페이지 크기
+LIST_DEFAULT_LIMIT = int(os.getenv("LIST_DEFAULT_LIMIT", 20))
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", 100))
+
+langchain_handler = get_langchain_handler()
 prescription_handler = PrescriptionHandler()
+prescription_job_queue = create_prescription_job_queue(prescription_handler, langchain_handler)
+
+# 기존 통계 값을 /metrics에서도 내보냄
+register_stats("livecare_s3_upload_jobs", upload_service.stats,
+               counters=tuple(upload_service.counters), description="S3 업로드 서비스")
 
 
-@app.post("/extract_prescription", response_model=Any)
+@app.post("/extract_prescription", response_model=Any, openapi_extra=multipart_request_body("file"))
 @async_timing_decorator
-async def extract_prescription(file: UploadFile = File(...)):
-    logger.info(f"처방전 추출 시작: 파일명 {file.filename}")
-    
-    async def process_ocr_result(ocr_result):
-        async with create_connection_async() as conn:
-            patient_result = await prescription_handler.process_new_prescription(ocr_result, conn)
-            logger.debug(f"환자 데이터 추출 완료: {patient_result}")
-            detailed_info = await prescription_handler.get_detailed_drug_info(patient_result, conn)
-            logger.debug(f"상세 약품 정보 추출 완료: {detailed_info}")
-            return patient_result, detailed_info
-
-    async with aiohttp.ClientSession() as session:
-        file_content = await file.read()
-        
-        # 현재 시간을 문자열로 추가하여 고유한 파일 이름 생성
-        timestamp = int(time.time())
-        unique_filename = f"{timestamp}.pdf"
-        
-        # S3에 파일 업로드 (비동기적으로 실행하고 결과를 기다리지 않음)
-        asyncio.create_task(upload_file_to_s3(file_content, unique_filename))
-        
-        ocr_result = await document_ocr(file_content)
-        logger.debug(f"OCR 처리 완료")
-        logger.debug(f"OCR 텍스트 길이: {len(ocr_result.get('text', ''))}")
+async def extract_prescription(request: Request, response: Response):
+    request_id = uuid.uuid4().hex
+    response.headers["X-Request-ID"] = request_id
+
+    # 요청 본문을 받는 대로 스풀에 쓰며 해시 계산 (본문을 bytes로 복사하지 않음)
+    [upload] = await ingest_multipart(request, "file", MAX_PRESCRIPTION_UPLOAD_BYTES)
+    logger.info(f"처방전 추출 시작: 파일명 {upload.filename}")
+    try:
+        # 파일 해시로 객체 키를 만들어 같은 초에 올라온 파일끼리 덮어쓰지 않게 함
+        object_key = content_address_key(upload.file_hash, ".pdf", prefix="prescriptions")
         
-        patient_result, detailed_info = await process_ocr_result(ocr_result)
+        # S3 업로드 큐에 등록 (이미 있는 객체는 건너뜀, 결과를 기다리지 않음)
+        await upload_service.enqueue_upload(upload, object_key, "application/pdf")
         
-        # create_multidisciplinary_care 함수를 통해 결과 처리
-        final_result = await langchain_handler.create_multidisciplinary_care(patient_result, detailed_info)
+        # OCR -> 환자/약품 정보 그래프 -> 다학제 진료 계획 -> medical_charts 저장
+        result = await prescription_handler.process_prescription_file(upload)
+        chart_id = result["chart_id"]
 
-        # final_result를 medical_charts 테이블에 저장
         async with create_connection_async() as conn:
-            chart_id = await insert_medical_chart_from_prescription(conn, patient_result.id, final_result)
-            logger.info(f"의료 차트 저장 완료: 차트 ID {chart_id}")
+            await insert_stored_object(conn, object_key, upload.file_hash, upload.size, "application/pdf", upload.filename)
+            await link_stored_object(conn, object_key, request_id, "medical_charts", chart_id)
+    finally:
+        upload.close()
 
     logger.info(f"처방전 추출 및 저장 성공")
-    return {"result": final_result, "chart_id": chart_id}
+    return {"result": result["result"], "chart_id": chart_id}
+
+@app.post("/extract_prescription/images", response_model=Any, openapi_extra=multipart_request_body("files", multiple=True))
+@async_timing_decorator
+async def extract_prescription_from_images(request: Request, response: Response):
+    """휴대폰으로 찍은 처방전 사진들을 한 건의 PDF로 합친 뒤 처방전 추출을 실행한다."""
+    request_id = uuid.uuid4().hex
+    response.headers["X-Request-ID"] = request_id
+
+    photos = await ingest_multipart(request, "files", MAX_IMAGE_UPLOAD_BYTES, max_files=IMAGE_MAX_FILES)
+    logger.info(f"사진 처방전 추출 시작: {len(photos)}장")
+    pdf_upload = None
+    try:
+        # 메모리에 있는 사진은 bytes로, 디스크에 있는 사진은 경로로 프로세스 풀에 넘김
+        sources = [photo.read_bytes() if photo.in_memory else photo.path for photo in photos]
+        try:
+            pdf_bytes = await build_pdf_from_images(sources)
+        except Exception as e:
+            logger.error(f"사진 PDF 변환 실패: {str(e)}")
+            raise HTTPException(status_code=400, detail="이미지 파일을 읽을 수 없습니다")
+
+        pdf_upload = SpooledUpload("prescription.pdf", "application/pdf")
+        pdf_upload.write(pdf_bytes)
+        pdf_upload.finish()
+        object_key = content_address_key(pdf_upload.file_hash, ".pdf", prefix="prescriptions")
+        await upload_service.enqueue_upload(pdf_upload, object_key, "application/pdf")
+
+        result = await prescription_handler.process_prescription_file(pdf_upload)
+        chart_id = result["chart_id"]
+
+        async with create_connection_async() as conn:
+            await insert_stored_object(conn, object_key, pdf_upload.file_hash, pdf_upload.size, "application/pdf",
+                                       photos[0].filename)
+            await link_stored_object(conn, object_key, request_id, "medical_charts", chart_id)
+    finally:
+        for photo in photos:
+            photo.close()
+        if pdf_upload is not None:
+            pdf_upload.close()
+
+    logger.info(f"사진 처방전 추출 및 저장 성공")
+    return {"result": result["result"], "chart_id": chart_id}
+
+@app.post("/extract_prescriptions/batch", openapi_extra=multipart_request_body("files", multiple=True))
+@async_timing_decorator
+async def extract_prescriptions_batch(request: Request, concurrency: Optional[int] = None):
+    """여러 처방전을 동시에 처리하고, 파일별 결과를 끝나는 순서대로 NDJSON으로 스트리밍한다."""
+    concurrency = max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    request_id = uuid.uuid4().hex
+
+    # 응답 스트리밍 전에 본문을 모두 받아 파일별 스풀에 둔다
+    uploads = await ingest_multipart(request, "files", MAX_PRESCRIPTION_UPLOAD_BYTES, max_files=BATCH_MAX_FILES)
+    logger.info(f"일괄 처방전 추출 시작: {len(uploads)}개 파일, 동시 처리 {concurrency}")
+    batch = []
+    try:
+        for upload in uploads:
+            batch.append({'upload': upload, 'file_name': upload.filename,
+                          'object_key': content_address_key(upload.file_hash, ".pdf", prefix="prescriptions")})
+            await upload_service.enqueue_upload(upload, batch[-1]['object_key'], "application/pdf")
+    except BaseException:
+        for upload in uploads:
+            upload.close()
+        raise
+
+    async def stream_results():
+        try:
+            async for index, result, error in prescription_handler.process_files(
+                    [item['upload'] for item in batch], concurrency=concurrency):
+                item = batch[index]
+                if error is not None:
+                    line = {"index": index, "file_name": item['file_name'], "status": "error", "error": str(error)}
+                else:
+                    upload = item['upload']
+                    async with create_connection_async() as conn:
+                        await insert_stored_object(conn, item['object_key'], upload.file_hash,
+                                                   upload.size, "application/pdf", item['file_name'])
+                        await link_stored_object(conn, item['object_key'], request_id, "medical_charts", result["chart_id"])
+                    line = {"index": index, "file_name": item['file_name'], "status": "ok",
+                            "result": result["result"], "chart_id": result["chart_id"]}
+                item['upload'].close()
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            logger.info(f"일괄 처방전 추출 완료: {len(batch)}개 파일")
+        finally:
+            for item in batch:
+                item['upload'].close()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson",
+                             headers={"X-Request-ID": request_id})
+
+@app.post("/prescription_jobs", status_code=202, openapi_extra=multipart_request_body("file"))
+@async_timing_decorator
+async def submit_prescription_job(request: Request):
+    [upload] = await ingest_multipart(request, "file", MAX_PRESCRIPTION_UPLOAD_BYTES)
+    logger.info(f"처방전 추출 작업 등록 시작: 파일명 {upload.filename}")
+    try:
+        object_key = content_address_key(upload.file_hash, ".pdf", prefix="prescriptions")
+        await upload_service.enqueue_upload(upload, object_key, "application/pdf")
+
+        # 재시작 후에도 이어서 처리할 수 있도록 파일을 디스크에 보관한 뒤 작업 등록
+        file_path = await asyncio.to_thread(spool_job_file, upload)
+        async with create_connection_async() as conn:
+            await insert_stored_object(conn, object_key, upload.file_hash, upload.size, "application/pdf", upload.filename)
+            job_id = await prescription_job_queue.submit({
+                'file_path': file_path,
+                'file_name': upload.filename,
+                'object_key': object_key
+            }, conn)
+    finally:
+        upload.close()
+    return {"job_id": job_id, "status": "queued", "status_url": f"/prescription_jobs/{job_id}"}
+
+@app.get("/prescription_jobs/{job_id}")
+async def get_prescription_job(job_id: str):
+    async with create_connection_async() as conn:
+        status = await prescription_job_queue.get_status(job_id, conn)
+    if status is None:
+        raise HTTPException(status_code=404, detail="해당 작업을 찾을 수 없습니다")
+    return status
+
+def _parse_fields(fields):
+    return [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+def _etag_response(request, payload):
+    """응답 본문 해시로 ETag를 만들고, If-None-Match가 같으면 본문 없이 304를 돌려준다."""
+    body = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    etag = f'"{hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]}"'
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+async def _list_response(request, table, after, limit, patient_id, fields):
+    limit = max(1, min(limit or LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT))
+    try:
+        async with create_connection_async() as conn:
+            items, next_after = await list_rows(conn, table, after=after, limit=limit,
+                                                patient_id=patient_id, fields=_parse_fields(fields))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _etag_response(request, {"items": items, "next_after": next_after})
+
+async def _get_response(request, table, row_id, fields, not_found):
+    try:
+        async with create_connection_async() as conn:
+            item = await get_row(conn, table, row_id, fields=_parse_fields(fields))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if item is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    return _etag_response(request, item)
+
+@app.get("/patients")
+async def list_patients(request: Request, after: Optional[int] = None, limit: Optional[int] = None,
+                        fields: Optional[str] = None):
+    return await _list_response(request, "patients", after, limit, None, fields)
+
+@app.get("/patients/{patient_id}")
+async def get_patient(request: Request, patient_id: int, fields: Optional[str] = None):
+    return await _get_response(request, "patients", patient_id, fields, "해당 환자를 찾을 수 없습니다")
+
+@app.get("/patients/{patient_id}/medications")
+async def get_patient_medications(patient_id: int, before: Optional[int] = None, limit: Optional[int] = None):
+    limit = max(1, min(limit or LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT))
+    async with create_connection_async() as conn:
+        items, next_before = await get_medication_history(conn, patient_id, before=before, limit=limit)
+    return {"items": items, "next_before": next_before}
+
+# 복합제 품목명에는 "/"가 들어갈 수 있으므로 path 변환기로 받음 (예: 아목시실린/클라불란산칼륨)
+@app.get("/medications/{item_name:path}/patients")
+async def get_medication_patients(item_name: str, after: Optional[int] = None, limit: Optional[int] = None):
+    limit = max(1, min(limit or LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT))
+    async with create_connection_async() as conn:
+        items, next_after = await get_patients_by_medication(conn, item_name, after=after, limit=limit)
+    return {"items": items, "next_after": next_after}
+
+@app.get("/search")
+@async_timing_decorator
+async def search(q: str, scope: Optional[str] = None, limit: Optional[int] = None, offset: int = 0):
+    """약품 정보(품목명/효능효과/주의사항/요약 보고서)와 차트 본문을 검색한다. scope는 쉼표로 구분한 테이블 이름."""
+    scopes = _parse_fields(scope)
+    unknown = [table for table in scopes or [] if table not in SEARCH_INDEXES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"검색할 수 없는 대상: {unknown}")
+    limit = max(1, min(limit or LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT))
+    try:
+        query = build_match_query(q)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    async with create_connection_async() as conn:
+        items, next_offset = await search_documents(conn, query, scopes, limit=limit, offset=max(offset, 0))
+    return {"items": items, "next_offset": next_offset}
 
-@app.post("/transcribe_audio")
+@app.get("/medical_charts")
+async def list_medical_charts(request: Request, patient_id: Optional[int] = None, after: Optional[int] = None,
+                              limit: Optional[int] = None, fields: Optional[str] = None):
+    return await _list_response(request, "medical_charts", after, limit, patient_id, fields)
+
+@app.get("/medical_charts/{chart_id}")
+async def get_medical_chart(request: Request, chart_id: int, fields: Optional[str] = None):
+    return await _get_response(request, "medical_charts", chart_id, fields, "해당 차트를 찾을 수 없습니다")
+
+@app.get("/voice_medical_charts")
+async def list_voice_medical_charts(request: Request, patient_id: Optional[int] = None, after: Optional[int] = None,
+                                    limit: Optional[int] = None, fields: Optional[str] = None):
+    return await _list_response(request, "voice_medical_charts", after, limit, patient_id, fields)
+
+@app.get("/voice_medical_charts/{chart_id}")
+async def get_voice_medical_chart(request: Request, chart_id: int, fields: Optional[str] = None):
+    return await _get_response(request, "voice_medical_charts", chart_id, fields, "해당 차트를 찾을 수 없습니다")
+
+async def _chart_pdf_response(chart_table, chart_id):
+    async with create_connection_async() as conn:
+        chart = await get_chart(conn, chart_table, chart_id)
+    if chart is None:
+        raise HTTPException(status_code=404, detail="해당 차트를 찾을 수 없습니다")
+    path = await export_chart_pdf(chart_table, chart)
+    # FileResponse는 파일을 청크 단위로 스트리밍
+    return FileResponse(path, media_type="application/pdf", filename=f"{chart_table}-{chart_id}.pdf")
+
+@app.get("/medical_charts/{chart_id}/pdf")
+@async_timing_decorator
+async def export_medical_chart_pdf(chart_id: int):
+    return await _chart_pdf_response("medical_charts", chart_id)
+
+@app.get("/voice_medical_charts/{chart_id}/pdf")
+@async_timing_decorator
+async def export_voice_medical_chart_pdf(chart_id: int):
+    return await _chart_pdf_response("voice_medical_charts", chart_id)
+
+@app.post("/transcribe_audio", openapi_extra=multipart_request_body("file"))
 @async_timing_decorator
-async def transcribe_audio_endpoint(file: UploadFile = File(...)):
-    logger.info(f"음성 파일 전사 시작: 파일명 {file.filename}")
+async def transcribe_audio_endpoint(request: Request, response: Response):
+    request_id = uuid.uuid4().hex
+    response.headers["X-Request-ID"] = request_id
+    # 음성 파일은 STT에 경로로 넘겨야 하므로 처음부터 디스크에 스풀
+    [upload] = await ingest_multipart(request, "file", MAX_AUDIO_UPLOAD_BYTES, memory_limit=0)
+    logger.info(f"음성 파일 전사 시작: 파일명 {upload.filename}")
     try:
-        file_content = await file.read()
-        file_hash = calculate_file_hash(file_content)
+        file_hash = upload.file_hash
+        extension = os.path.splitext(upload.filename or "")[1]
+        object_key = content_address_key(file_hash, extension, prefix="audio")
 
-        # S3에 파일 업로드 (비동기적으로 실행하고 결과를 기다리지 않음)
-        asyncio.create_task(upload_file_to_s3(file_content, file.filename))
+        # S3 업로드 큐에 등록 (이미 있는 객체는 건너뜀, 결과를 기다리지 않음)
+        await upload_service.enqueue_upload(upload, object_key, upload.content_type)
         
         # 데이터베이스 연결
         async with create_connection_async() as conn:
@@ -153,24 +523,19 @@ async def transcribe_audio_endpoint(file: UploadFile = File(...)):
             #         logger.info("중복된 파일이 감지되어 기존 결과를 반환합니다.")
             #         return {"id": existing_chart['id'], "content": existing_chart['content']}
             
-            # 새로운 파일인 경우 처리 계속
-            temp_file_path = f"tmp/{file.filename}"
-            with open(temp_file_path, "wb") as temp_file:
-                temp_file.write(file_content)
-            transcribe_result = transcribe_audio(temp_file_path)
-            logger.info(f"음성 파일 전사 성공: {file.filename}")
+            # 새로운 파일인 경우 처리 계속 (Clova 요청은 blocking이므로 스레드에서 실행)
+            with timed("transcribe_audio", upstream="stt"), span("transcribe_audio", upstream="stt"):
+                audio_path = upload.materialize()
+                transcribe_result = await get_upstream("stt").call(
+                    lambda: asyncio.to_thread(transcribe_audio, audio_path))
+            logger.info(f"음성 파일 전사 성공: {upload.filename}")
             final_result = await langchain_handler.create_medical_chart(transcribe_result['text'])
-            logger.info(f"의료 차트 생성 성공: {file.filename}")
-            
-            file_metadata = {
-                'file_name': file.filename,
-                'file_size': len(file_content),
-                'file_type': file.content_type,
-                'file_hash': file_hash
-            }
+            logger.info(f"의료 차트 생성 성공: {upload.filename}")
             
             # 데이터베이스에 저장
             chart_id = await insert_voice_medical_chart(conn, 0, final_result)
+            await insert_stored_object(conn, object_key, file_hash, upload.size, upload.content_type, upload.filename)
+            await link_stored_object(conn, object_key, request_id, "voice_medical_charts", chart_id)
             if chart_id:
                 final_result = {"id": chart_id, "content": final_result}
             else:
@@ -181,82 +546,115 @@ async def transcribe_audio_endpoint(file: UploadFile = File(...)):
     except Exception as e:
         logger.error(f"음성 파일 전사 중 오류 발생: {str(e)}")
         raise
+    finally:
+        upload.close()
+
+def _raise_update_failure(current_version, expected_version, not_found):
+    if current_version is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    raise HTTPException(status_code=409, detail={
+        "message": "다른 사용자가 먼저 수정했습니다. 최신 내용을 다시 읽은 뒤 수정해 주세요.",
+        "expected_version": expected_version,
+        "current_version": current_version
+    })
 
 @app.put("/update_prescription/{prescription_id}")
 @async_timing_decorator
 async def update_prescription_endpoint(prescription_id: int, prescription: PrescriptionData):
     logger.info(f"처방전 업데이트 시작: ID {prescription_id}")
-    try:
-        conn = create_connection()
-        if conn is None:
-            raise HTTPException(status_code=500, detail="데이터베이스 연결 실패")
-        
-        create_tables(conn)
-        
-        # 기존 처방전 검색
-        existing_prescription = get_prescription_by_id(conn, prescription_id)
-        if not existing_prescription:
-            conn.close()
-            raise HTTPException(status_code=404, detail="해당 처방전을 찾을 수 없습니다")
-        
-        # 처방전 업데이트
-        success = update_prescription(conn, prescription_id, prescription)
-        conn.close()
-        
-        if success:
-            logger.info(f"처방전 업데이트 성공: ID {prescription_id}")
-            return {"message": "처방전이 성공적으로 업데이트되었습니다."}
-        else:
-            raise HTTPException(status_code=500, detail="처방전 업데이트 실패")
-    except HTTPException as he:
-        logger.error(f"처방전 업데이트 중 HTTP 오류 발생: {str(he)}")
-        raise
-    except Exception as e:
-        logger.error(f"처방전 업데이트 중 오류 발생: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    if prescription.id is not None and prescription.id != prescription_id:
+        raise HTTPException(status_code=400, detail="요청 URL의 처방전 ID와 페이로드의 ID가 일치하지 않습니다")
+    if prescription.version is None:
+        raise HTTPException(status_code=428, detail="수정하려면 읽은 처방전의 version이 필요합니다")
+
+    async with create_connection_async() as conn:
+        new_version = await update_prescription(conn, prescription_id, prescription, prescription.version)
+        if new_version is None:
+            _raise_update_failure(await get_version(conn, "prescriptions", prescription_id),
+                                  prescription.version, "해당 처방전을 찾을 수 없습니다")
+
+    logger.info(f"처방전 업데이트 성공: ID {prescription_id}, 버전 {new_version}")
+    return {"message": "처방전이 성공적으로 업데이트되었습니다.", "version": new_version}
 
 class MedicalChartUpdate(BaseModel):
     id: int
     content: str
+    # 클라이언트가 읽은 차트 버전 (낙관적 동시성 제어)
+    version: Optional[int] = None
 
 @app.put("/update_medical_chart/{chart_id}")
 @async_timing_decorator
 async def update_medical_chart_endpoint(chart_id: int, medical_chart: MedicalChartUpdate):
     logger.info(f"의료 차트 업데이트 시작: 차트 ID {chart_id}")
-    try:
-        conn = create_connection()
-        if conn is None:
-            raise HTTPException(status_code=500, detail="데이터베이스 연결 실패")
-        
-        create_tables(conn)
-        
-        # 기존 의료 차트 검색
-        existing_chart = get_medical_chart_by_id(conn, chart_id)
-        if not existing_chart:
-            conn.close()
-            raise HTTPException(status_code=404, detail="해당 의료 차트를 찾을 수 없습니다")
-        
-        # 요청된 차트 ID와 페이로드의 ID가 일치하는지 확인
-        if chart_id != medical_chart.id:
-            conn.close()
-            raise HTTPException(status_code=400, detail="요청 URL의 차트 ID와 페이로드의 ID가 일치하지 않습니다")
-        
-        # 의료 차트 업데이트
-        success = update_medical_chart(conn, chart_id, medical_chart.content)
-        conn.close()
-        
-        if success:
-            logger.info(f"의료 차트 업데이트 성공: 차트 ID {chart_id}")
-            return {"message": "의료 차트가 성공적으로 업데이트되었습니다."}
-        else:
-            raise HTTPException(status_code=500, detail="의료 차트 업데이트 실패")
-    except HTTPException as he:
-        logger.error(f"의료 차트 업데이트 중 HTTP 오류 발생: {str(he)}")
-        raise
-    except Exception as e:
-        logger.error(f"의료 차트 업데이트 중 오류 발생: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    # 요청된 차트 ID와 페이로드의 ID가 일치하는지 확인
+    if chart_id != medical_chart.id:
+        raise HTTPException(status_code=400, detail="요청 URL의 차트 ID와 페이로드의 ID가 일치하지 않습니다")
+    if medical_chart.version is None:
+        raise HTTPException(status_code=428, detail="수정하려면 읽은 차트의 version이 필요합니다")
+
+    async with create_connection_async() as conn:
+        new_version = await update_medical_chart(conn, chart_id, medical_chart.content, medical_chart.version)
+        if new_version is None:
+            _raise_update_failure(await get_version(conn, "medical_charts", chart_id),
+                                  medical_chart.version, "해당 의료 차트를 찾을 수 없습니다")
+
+    logger.info(f"의료 차트 업데이트 성공: 차트 ID {chart_id}, 버전 {new_version}")
+    return {"message": "의료 차트가 성공적으로 업데이트되었습니다.", "version": new_version}
+
+@app.get("/upload_queue/stats")
+async def upload_queue_stats():
+    return upload_service.stats()
+
+@app.get("/metadata_rules/stats")
+async def metadata_rules_stats():
+    return rule_hit_stats.stats()
+
+@app.get("/admission/stats")
+async def admission_stats():
+    return admission_controller.stats()
+
+@app.get("/upstreams/stats")
+async def upstreams_stats():
+    return upstream_stats()
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_worker(seconds: float = 10, interval_ms: Optional[float] = None, idle: bool = False,
+                         lines: bool = False):
+    """이 워커 프로세스의 모든 스레드 스택을 seconds 동안 샘플링해 collapsed 스택(flamegraph 입력)으로 반환한다."""
+    if not 0 < seconds <= PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds는 0초 초과 {PROFILER_MAX_SECONDS:g}초 이하여야 합니다")
+    if interval_ms is not None and interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms는 1 이상이어야 합니다")
+    sampler = await profile_process(seconds, interval_ms, include_idle=idle, include_lines=lines)
+    if sampler is None:
+        raise HTTPException(status_code=409, detail="이미 프로파일링이 진행 중입니다")
+    return PlainTextResponse(sampler.collapsed(), headers={"X-Profile-Samples": str(sampler.samples)})
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_request_profile(profile_id: str):
+    path = profile_path(profile_id)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="해당 프로파일을 찾을 수 없습니다")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.collapsed")
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus 텍스트 형식 (단계별 지연 시간 히스토그램, 실행 중 수, 예외 수, 캐시 적중)
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # 멀티 워커(serve.py): 모든 워커가 남긴 값을 합쳐 내보낸다.
+        # register_stats로 등록한 통계는 응답한 워커 하나의 값뿐이라 이 모드에서는 내보내지 않음
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 if __name__ == "__main__":
+    # 단일 프로세스 실행. 자동 재시작은 개발 환경(APP_ENV=development)에서만 켠다. 운영 서버는 serve.py
+    import uvicorn
     logger.info("애플리케이션 시작")
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", 8000)),
+                reload=os.getenv("APP_ENV") == "development")
\ No newline at end of file
@@ -0,0 +1,144 @@
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, Optional
+from loguru import logger
+from metrics import record_cache
+
+NOT_FOUND = "Not Found"
+# 이 신뢰도 이상이면 LLM 추출을 건너뜀
+METADATA_RULE_THRESHOLD = float(os.getenv("METADATA_RULE_THRESHOLD", 0.9))
+
+NAME_PATTERN = re.compile(r"(?:환\s*자\s*)?(?:성\s*명|환\s*자\s*명|수\s*진\s*자(?:\s*명)?)\s*[:：]?\s*([가-힣]{2,4})(?![가-힣])")
+# 주민등록번호 (뒷자리 마스킹 허용)
+RRN_PATTERN = re.compile(r"(?<!\d)(\d{2})(\d{2})(\d{2})\s*-\s*([1-8])[\d*Xx●]{6}(?![\d*])")
+BIRTH_DATE_PATTERN = re.compile(r"생\s*년\s*월\s*일\s*[:：]?\s*(\d{4})\s*[.\-/년]\s*(\d{1,2})\s*[.\-/월]\s*(\d{1,2})")
+AGE_PATTERN = re.compile(r"(?:나\s*이|연\s*령|만)\s*[:：]?\s*(\d{1,3})\s*세?")
+GENDER_PATTERN = re.compile(r"성\s*별\s*[:：]?\s*(남|여|M|F)", re.IGNORECASE)
+ISSUE_DATE_PATTERN = re.compile(r"(?:교\s*부|발\s*행|처\s*방)\s*(?:연\s*월\s*일|일\s*자|일)?\s*[:：]?\s*(\d{4})\s*[.\-/년]\s*(\d{1,2})\s*[.\-/월]\s*(\d{1,2})")
+
+# 라벨 뒤에 오더라도 이름이 아닌 단어
+NAME_STOPWORDS = {"주민", "주민등록", "번호", "생년", "생년월일", "성별", "나이", "연령", "환자", "보험", "기관", "의료", "면허"}
+
+# 주민등록번호 뒷자리 첫 숫자 -> (출생 세기, 성별)
+RRN_CENTURY_GENDER = {
+    '1': (1900, "남성"), '2': (1900, "여성"), '5': (1900, "남성"), '6': (1900, "여성"),
+    '3': (2000, "남성"), '4': (2000, "여성"), '7': (2000, "남성"), '8': (2000, "여성"),
+}
+
+# 항목별 신뢰도 가중치
+NAME_WEIGHT = 0.4
+RRN_WEIGHT = 0.6
+LABELED_AGE_WEIGHT = 0.3
+LABELED_GENDER_WEIGHT = 0.3
+
+
+@dataclass
+class RuleMetadata:
+    metadata: Dict[str, Any]
+    confidence: float
+    sources: Dict[str, str] = field(default_factory=dict)
+
+
+def _valid_date(year, month, day) -> Optional[date]:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _age_on(birth_date, reference):
+    return reference.year - birth_date.year - ((reference.month, reference.day) < (birth_date.month, birth_date.day))
+
+
+def _reference_date(text):
+    match = ISSUE_DATE_PATTERN.search(text)
+    if match:
+        issued = _valid_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        if issued:
+            return issued
+    return date.today()
+
+
+def extract_metadata_by_rules(text: str) -> RuleMetadata:
+    """표준 처방전 서식의 라벨과 주민등록번호로 이름/나이/성별을 추출하고 신뢰도를 매긴다."""
+    metadata = {"name": NOT_FOUND, "age": NOT_FOUND, "gender": NOT_FOUND}
+    sources = {}
+    confidence = 0.0
+    reference = _reference_date(text)
+
+    for match in NAME_PATTERN.finditer(text):
+        name = match.group(1)
+        if name not in NAME_STOPWORDS and not any(name.startswith(stopword) for stopword in NAME_STOPWORDS):
+            metadata["name"] = name
+            sources["name"] = "label"
+            confidence += NAME_WEIGHT
+            break
+
+    for match in RRN_PATTERN.finditer(text):
+        century, gender = RRN_CENTURY_GENDER[match.group(4)]
+        birth_date = _valid_date(century + int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        if birth_date and birth_date <= reference:
+            metadata["age"] = _age_on(birth_date, reference)
+            metadata["gender"] = gender
+            metadata["birth_date"] = birth_date.isoformat()
+            sources["age"] = sources["gender"] = "resident_number"
+            confidence += RRN_WEIGHT
+            break
+
+    if metadata["age"] == NOT_FOUND:
+        match = BIRTH_DATE_PATTERN.search(text)
+        birth_date = _valid_date(*(int(group) for group in match.groups())) if match else None
+        if birth_date and birth_date <= reference:
+            metadata["age"] = _age_on(birth_date, reference)
+            metadata["birth_date"] = birth_date.isoformat()
+            sources["age"] = "birth_date"
+            confidence += LABELED_AGE_WEIGHT
+        else:
+            match = AGE_PATTERN.search(text)
+            if match and 0 <= int(match.group(1)) <= 120:
+                metadata["age"] = int(match.group(1))
+                sources["age"] = "label"
+                confidence += LABELED_AGE_WEIGHT
+
+    if metadata["gender"] == NOT_FOUND:
+        match = GENDER_PATTERN.search(text)
+        if match:
+            metadata["gender"] = "남성" if match.group(1).upper() in ("남", "M") else "여성"
+            sources["gender"] = "label"
+            confidence += LABELED_GENDER_WEIGHT
+
+    return RuleMetadata(metadata, round(min(confidence, 1.0), 2), sources)
+
+
+class RuleHitStats:
+    """규칙 기반 추출로 LLM 호출을 건너뛴 비율."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.hits = 0
+
+    def record(self, hit):
+        self.attempts += 1
+        if hit:
+            self.hits += 1
+
+    @property
+    def hit_rate(self):
+        return round(self.hits / self.attempts, 4) if self.attempts else 0.0
+
+    def stats(self):
+        return {'attempts': self.attempts, 'hits': self.hits, 'llm_fallbacks': self.attempts - self.hits,
+                'hit_rate': self.hit_rate}
+
+
+rule_hit_stats = RuleHitStats()
+
+
+def log_rule_result(result: RuleMetadata, hit: bool):
+    rule_hit_stats.record(hit)
+    # 적중하지 않으면 LLM 추출로 넘어감
+    record_cache("metadata_rules", hit)
+    logger.info(f"규칙 기반 메타데이터 추출: 신뢰도 {result.confidence} ({'LLM 생략' if hit else 'LLM 사용'}), "
+                f"근거 {result.sources}, 누적 적중률 {rule_hit_stats.hit_rate:.2%}")
@@ -0,0 +1,118 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# 현재 요청의 엔드포인트(라우트 경로 템플릿). HTTP 미들웨어에서 설정하며, 요청 밖의 작업은 background
+current_endpoint = ContextVar("current_endpoint", default="background")
+
+# 게이지는 멀티 워커(PROMETHEUS_MULTIPROC_DIR)에서 살아 있는 워커 값의 합(livesum) 또는 최댓값(livemax)으로 합친다
+
+# 수 ms의 DB 조회부터 수십 초 걸리는 LLM 호출까지
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+STAGE_DURATION = Histogram(
+    "livecare_stage_duration_seconds", "파이프라인 단계(함수)별 실행 시간",
+    ("stage", "endpoint", "upstream"), buckets=LATENCY_BUCKETS)
+STAGE_IN_FLIGHT = Gauge(
+    "livecare_stage_in_flight", "실행 중인 파이프라인 단계 수", ("stage",),
+    multiprocess_mode="livesum")
+STAGE_ERRORS = Counter(
+    "livecare_stage_errors_total", "파이프라인 단계별 예외 수", ("stage", "endpoint", "upstream", "error"))
+CACHE_REQUESTS = Counter(
+    "livecare_cache_requests_total", "캐시 조회 결과", ("cache", "result"))
+
+HTTP_DURATION = Histogram(
+    "livecare_http_request_duration_seconds", "엔드포인트별 응답 시간 (스트리밍 응답은 헤더 전송까지)",
+    ("endpoint", "method", "status"), buckets=LATENCY_BUCKETS)
+HTTP_IN_FLIGHT = Gauge(
+    "livecare_http_requests_in_flight", "처리 중인 HTTP 요청 수", ("endpoint",),
+    multiprocess_mode="livesum")
+
+S3_UPLOAD_DURATION = Histogram(
+    "livecare_s3_upload_duration_seconds", "S3 업로드 시간 (재시도 한 번 단위)", buckets=LATENCY_BUCKETS)
+S3_UPLOAD_QUEUE_WAIT = Histogram(
+    "livecare_s3_upload_queue_wait_seconds", "S3 업로드 큐 대기 시간", buckets=LATENCY_BUCKETS)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "livecare_admission_in_flight", "입장 제어 풀별 실행 중인 요청 수", ("pool",),
+    multiprocess_mode="livesum")
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "livecare_admission_queue_depth", "입장 제어 풀별 대기 중인 요청 수", ("pool",),
+    multiprocess_mode="livesum")
+ADMISSION_SHED = Counter(
+    "livecare_admission_shed_total", "입장 제어로 거절한 요청 수 (429)", ("pool", "reason"))
+ADMISSION_WAIT = Histogram(
+    "livecare_admission_wait_seconds", "입장 제어 대기 시간", ("pool",), buckets=LATENCY_BUCKETS)
+
+# 0: closed, 1: half_open, 2: open
+CIRCUIT_STATE = Gauge(
+    "livecare_circuit_state", "업스트림별 서킷 브레이커 상태 (0 닫힘, 1 반열림, 2 열림)", ("upstream",),
+    multiprocess_mode="livemax")
+CIRCUIT_REJECTED = Counter(
+    "livecare_circuit_rejected_total", "서킷이 열려 보내지 않은 업스트림 호출 수", ("upstream",))
+UPSTREAM_HEDGES = Counter(
+    "livecare_upstream_hedges_total", "헤지(중복) 요청 수 (sent: 보냄, won: 먼저 끝남)", ("upstream", "result"))
+DEADLINE_EXCEEDED = Counter(
+    "livecare_deadline_exceeded_total", "요청 마감 시각을 넘겨 중단한 업스트림 호출 수", ("upstream",))
+
+
+class Timer:
+    __slots__ = ("start", "elapsed")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+
+
+@contextmanager
+def timed(stage, upstream=""):
+    """블록 실행 시간을 stage/엔드포인트/업스트림별로 기록한다. 예외는 종류별로 세고 다시 던진다."""
+    endpoint = current_endpoint.get()
+    in_flight = STAGE_IN_FLIGHT.labels(stage)
+    in_flight.inc()
+    timer = Timer()
+    try:
+        yield timer
+    except Exception as e:
+        STAGE_ERRORS.labels(stage, endpoint, upstream, type(e).__name__).inc()
+        raise
+    finally:
+        timer.elapsed = time.perf_counter() - timer.start
+        in_flight.dec()
+        STAGE_DURATION.labels(stage, endpoint, upstream).observe(timer.elapsed)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+class StatsCollector:
+    """기존 stats() 딕셔너리를 스크레이프할 때 읽어 메트릭으로 내보낸다.
+
+    counters에 있는 키는 prefix_total{label=키} 카운터로, 나머지 숫자 값은 prefix_키 게이지로 내보낸다.
+    """
+
+    def __init__(self, prefix, stats, counters=(), label="result", description=""):
+        self.prefix = prefix
+        self.stats = stats
+        self.counters = counters
+        self.label = label
+        self.description = description
+
+    def collect(self):
+        stats = self.stats()
+        counter = CounterMetricFamily(self.prefix, self.description, labels=[self.label])
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if key in self.counters:
+                counter.add_metric([key], value)
+            else:
+                yield GaugeMetricFamily(f"{self.prefix}_{key}", f"{self.description} {key}", value=value)
+        yield counter
+
+
+def register_stats(prefix, stats, counters=(), label="result", description=""):
+    REGISTRY.register(StatsCollector(prefix, stats, counters, label, description))
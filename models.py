@@ -14,6 +14,8 @@ class PrescriptionData(BaseModel):
     medication_name: List[str] = []
     medication_dosage: Dict[str, str] = {}
     prescription_days: Optional[int] = None
+    # 수정 요청 시 클라이언트가 읽은 버전 (낙관적 동시성 제어)
+    version: Optional[int] = None
 
 class DrugIngredient(BaseModel):
     성분명: str
@@ -48,4 +50,5 @@ class Patient(BaseModel):
     name: str = None
     age: Union[int, str] = None
     gender: str = None
+    birth_date: Optional[str] = None
     medications: Optional[List[str]] = None
\ No newline at end of file
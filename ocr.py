@@ -1,19 +1,180 @@
 import aiohttp
+import asyncio
+import hashlib
+import io
+import json
 import os
+from collections import OrderedDict
 from dotenv import load_dotenv
+from loguru import logger
+from pypdf import PdfReader, PdfWriter
 from decorators import async_timing_decorator
+from metrics import record_cache
+from tracing import span, set_attribute
+from resilience import get_upstream, raise_for_upstream_status
+from database import create_connection_async, get_ocr_page_cache, insert_ocr_page_cache
 
 # Load environment variables
 load_dotenv()
 
+OCR_URL = os.getenv("UPSTAGE_OCR_URL", "https://api.upstage.ai/v1/document-ai/ocr")
+# 페이지별 OCR 요청 동시 실행 수
+OCR_PAGE_CONCURRENCY = int(os.getenv("OCR_PAGE_CONCURRENCY", 4))
+# 프로세스 메모리에 두는 페이지 결과 수 (그 밖의 결과는 SQLite 캐시에서 읽음)
+OCR_MEMORY_CACHE_SIZE = int(os.getenv("OCR_MEMORY_CACHE_SIZE", 256))
+
+_session = None
+_memory_cache = OrderedDict()
+
+
+def get_session():
+    # 요청마다 세션을 만들지 않고 연결을 재사용
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession()
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def split_pdf_pages(file_contents):
+    """PDF를 한 페이지짜리 PDF들로 나눈다. PDF가 아니면 None. CPU 작업이므로 스레드에서 호출한다."""
+    if isinstance(file_contents, (bytes, bytearray, memoryview)):
+        if bytes(file_contents[:5]) != b"%PDF-":
+            return None
+        stream = io.BytesIO(file_contents)
+    else:
+        file_contents.seek(0)
+        if file_contents.read(5) != b"%PDF-":
+            return None
+        file_contents.seek(0)
+        stream = file_contents
+
+    reader = PdfReader(stream)
+    if len(reader.pages) <= 1:
+        stream.seek(0)
+        return [stream.read()]
+    pages = []
+    for page in reader.pages:
+        writer = PdfWriter()
+        writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        pages.append(buffer.getvalue())
+    return pages
+
+
+def _read_all(file_contents):
+    if isinstance(file_contents, (bytes, bytearray, memoryview)):
+        return file_contents
+    file_contents.seek(0)
+    return file_contents.read()
+
+
+@async_timing_decorator(upstream="ocr", log=False)
+async def _request_ocr(page_contents):
+    set_attribute("bytes", len(page_contents))
+    api_key = os.getenv("UPSTAGE_API_KEY")
+    headers = {"Authorization": f"Bearer {api_key}"}
+
+    async def request():
+        data = aiohttp.FormData()
+        data.add_field('document', page_contents, filename="document.pdf")
+        async with get_session().post(OCR_URL, headers=headers, data=data) as response:
+            raise_for_upstream_status("ocr", response.status)
+            response.raise_for_status()
+            return await response.json()
+
+    # 과금되는 호출이라 헤지하지 않음
+    return await get_upstream("ocr").call(request)
+
+
+async def _cached_page_result(page_hash):
+    if page_hash in _memory_cache:
+        record_cache("ocr_page_memory", True)
+        _memory_cache.move_to_end(page_hash)
+        return _memory_cache[page_hash]
+    record_cache("ocr_page_memory", False)
+    with span("ocr.page_cache_lookup"):
+        async with create_connection_async() as conn:
+            cached = await get_ocr_page_cache(conn, page_hash)
+    record_cache("ocr_page_db", cached is not None)
+    if cached is not None:
+        _remember(page_hash, cached)
+    return cached
+
+
+def _remember(page_hash, result):
+    _memory_cache[page_hash] = result
+    _memory_cache.move_to_end(page_hash)
+    while len(_memory_cache) > OCR_MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+
+async def _ocr_page(page_contents, semaphore):
+    page_hash = hashlib.sha256(page_contents).hexdigest()
+    cached = await _cached_page_result(page_hash)
+    if cached is not None:
+        return cached, True
+    async with semaphore:
+        result = await _request_ocr(page_contents)
+    _remember(page_hash, result)
+    with span("ocr.page_cache_store"):
+        async with create_connection_async() as conn:
+            await insert_ocr_page_cache(conn, page_hash, json.dumps(result, ensure_ascii=False))
+    return result, False
+
+
+def merge_page_results(page_results):
+    """페이지별 OCR 응답을 하나의 문서 응답으로 합친다. 페이지 순서대로 번호를 다시 매기고 단어 박스는 그대로 둔다."""
+    merged_pages = []
+    metadata_pages = []
+    texts = []
+    confidences = []
+    billed_pages = 0
+    for result, cached in page_results:
+        if not cached:
+            billed_pages += result.get('numBilledPages', len(result.get('pages', [])))
+        for page in result.get('pages', []):
+            page = dict(page)
+            page['id'] = len(merged_pages)
+            merged_pages.append(page)
+            metadata_pages.append({'page': page['id'] + 1, 'width': page.get('width'), 'height': page.get('height')})
+            if page.get('confidence') is not None:
+                confidences.append(page['confidence'])
+        texts.append(result.get('text', ''))
+
+    first = page_results[0][0] if page_results else {}
+    return {
+        'apiVersion': first.get('apiVersion'),
+        'modelVersion': first.get('modelVersion'),
+        'mimeType': first.get('mimeType'),
+        'confidence': sum(confidences) / len(confidences) if confidences else first.get('confidence'),
+        'metadata': {'pages': metadata_pages},
+        'numBilledPages': billed_pages,
+        'pages': merged_pages,
+        'text': '\n'.join(texts)
+    }
+
+
 @async_timing_decorator
 async def document_ocr(file_contents):
-    async with aiohttp.ClientSession() as session:
-        api_key = os.getenv("UPSTAGE_API_KEY")
-        url = "https://api.upstage.ai/v1/document-ai/ocr"
-        headers = {"Authorization": f"Bearer {api_key}"}
-        data = aiohttp.FormData()
-        data.add_field('document', file_contents)
-        async with session.post(url, headers=headers, data=data) as response:
-            response_json = await response.json()
-    return response_json
\ No newline at end of file
+    """문서를 OCR한다. PDF는 페이지 단위로 나눠 동시에 요청하고, 페이지 내용 해시로 결과를 캐시한다."""
+    pages = await asyncio.to_thread(split_pdf_pages, file_contents)
+    if pages is None:
+        # PDF가 아닌 문서(이미지 등)는 통째로 한 페이지처럼 처리
+        pages = [bytes(await asyncio.to_thread(_read_all, file_contents))]
+
+    semaphore = asyncio.Semaphore(OCR_PAGE_CONCURRENCY)
+    page_results = await asyncio.gather(*(_ocr_page(page, semaphore) for page in pages))
+    cache_hits = sum(1 for _, cached in page_results if cached)
+    logger.info(f"OCR 완료: {len(pages)}페이지 (캐시 적중 {cache_hits}페이지)")
+
+    if len(page_results) == 1:
+        return page_results[0][0]
+    return merge_page_results(page_results)
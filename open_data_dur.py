@@ -10,7 +10,7 @@ load_dotenv()
 API_KEY = os.getenv('OPEN_DATA_API_KEY')
 
 # 기본 URL 설정
-BASE_URL = "http://apis.data.go.kr/1471000/DURPrdlstInfoService03"
+BASE_URL = f"{os.getenv('DATA_GO_KR_BASE_URL', 'http://apis.data.go.kr/1471000')}/DURPrdlstInfoService03"
 
 # API 엔드포인트 목록과 설명
 API_ENDPOINTS = {
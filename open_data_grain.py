@@ -4,14 +4,30 @@ from dotenv import load_dotenv
 import aiohttp
 import re
 from loguru import logger
+from decorators import async_timing_decorator
+from metrics import record_cache
+from tracing import set_attribute
+from resilience import get_upstream, raise_for_upstream_status, UpstreamError
 
 class OpenDataGrain:
     def __init__(self):
         load_dotenv()
         self.API_KEY = os.getenv('OPEN_DATA_API_KEY')
+        # 공공데이터포털 식약처 API 주소 (부하 테스트에서는 로컬 가짜 서버로 바꿈)
+        self.BASE_URL = os.getenv('DATA_GO_KR_BASE_URL', "http://apis.data.go.kr/1471000")
 
+    @staticmethod
+    async def _request_pill_info(session, url, params):
+        async with session.get(url, params=params) as response:
+            raise_for_upstream_status("data_go_kr", response.status)
+            if response.status != 200:
+                return None
+            return await response.json()
+
+    @async_timing_decorator(upstream="data_go_kr", log=False)
     async def get_pill_info(self, session, item_name):
-        url = "http://apis.data.go.kr/1471000/MdcinGrnIdntfcInfoService01/getMdcinGrnIdntfcInfoList01"
+        set_attribute("item_name", item_name)
+        url = f"{self.BASE_URL}/MdcinGrnIdntfcInfoService01/getMdcinGrnIdntfcInfoList01"
         params = {
             'serviceKey': self.API_KEY,
             'item_name': item_name,
@@ -20,33 +36,38 @@ class OpenDataGrain:
             'type': 'json'
         }
         
-        async with session.get(url, params=params) as response:
-            if response.status == 200:
-                data = await response.json()
-                if 'body' in data and 'items' in data['body']:
-                    items = data['body']['items']
-                    if len(items) >= 2:
-                        filtered_items = [item for item in items if item['ITEM_NAME'].startswith(item_name)]
-                        if filtered_items:
-                            return item_name, filtered_items
-                    return item_name, data['body']['items']
-                else:
-                    # 아이템 이름의 마지막 부분이 숫자로 구성된 경우 제거하고 다시 검색
-                    new_item_name = re.sub(r'\d+$', '', item_name)
-                    if new_item_name != item_name:
-                        return await self.get_pill_info(session, new_item_name)
-                    else:
-                        # print(f"경고: {item_name}에 대한 예상치 못한 응답 구조")
-                        # print(f"응답 데이터: {data}")
-                        return item_name, None
+        try:
+            # 같은 조회를 다시 보내도 안전하므로 p95 안에 응답이 없으면 헤지 요청을 보냄
+            data = await get_upstream("data_go_kr").call(
+                lambda: self._request_pill_info(session, url, params), hedge=True)
+        except UpstreamError as e:
+            # 공공데이터 API 장애는 조회 결과 없음으로 처리하고 나머지 약품 처리를 계속함
+            logger.warning(f"낱알식별 정보 조회 실패: {item_name} - {e}")
+            return item_name, None
+        if data is None:
+            return item_name, None
+        if 'body' in data and 'items' in data['body']:
+            items = data['body']['items']
+            if len(items) >= 2:
+                filtered_items = [item for item in items if item['ITEM_NAME'].startswith(item_name)]
+                if filtered_items:
+                    return item_name, filtered_items
+            return item_name, data['body']['items']
+        else:
+            # 아이템 이름의 마지막 부분이 숫자로 구성된 경우 제거하고 다시 검색
+            new_item_name = re.sub(r'\d+$', '', item_name)
+            if new_item_name != item_name:
+                return await self.get_pill_info(session, new_item_name)
             else:
+                # print(f"경고: {item_name}에 대한 예상치 못한 응답 구조")
+                # print(f"응답 데이터: {data}")
                 return item_name, None
 
     def calculate_word_ratio(self, word, item_name):
         word_count = sum(1 for char in word if char in item_name)
         return word_count / len(item_name)
 
-    async def search_pills_from_text(self, text):
+    def extract_candidate_words(self, text):
         # 텍스트에서 단어 추출 및 중복 제거
         words = re.findall(r'\w+', text)
         unique_words = sorted(set(words))
@@ -70,27 +91,54 @@ class OpenDataGrain:
                 filtered_unique_words.append(word)
         
         unique_words = filtered_unique_words
-        logger.debug(f"unique_words: {unique_words}")
+        # OCR 단어에는 환자 이름이나 주민등록번호 조각이 섞일 수 있어 개수만 기록
+        logger.debug(f"unique_words: {len(unique_words)}개")
+        
+        return [
+            word.replace("밀리그램", "").replace("mg", "").rstrip('_')
+            for word in unique_words
+            if len(word) > 2 and not word.isdigit() and not word.isascii()
+        ]
+
+    @staticmethod
+    def filter_pill_info(word, pill_info):
+        # 결과 필터링: 단어로 시작하는 약품 정보만 선택
+        if not pill_info:
+            return None
+        filtered_info = [
+            item for item in pill_info
+            if item['ITEM_NAME'].startswith(word)
+        ]
+        return filtered_info or None
+
+    async def iter_pills_from_text(self, text, cache=None):
+        """검색이 끝나는 순서대로 (후보 단어 순번, 단어, 필터링된 약품 정보)를 내보낸다.
+
+        cache(dict)를 넘기면 같은 단어의 조회 결과를 여러 문서가 재사용한다.
+        """
+        candidate_words = self.extract_candidate_words(text)
+        
+        async def search(index, session, word):
+            if cache is not None:
+                record_cache("pill_lookup", word in cache)
+                if word in cache:
+                    return (index, *cache[word])
+            result = await self.get_pill_info(session, word)
+            if cache is not None:
+                cache[word] = result
+            word, pill_info = result
+            return index, word, pill_info
         
         # 비동기 세션 생성 및 약품 정보 조회
         async with aiohttp.ClientSession() as session:
-            tasks = [
-                self.get_pill_info(session, word.replace("밀리그램", "").replace("mg", "").rstrip('_'))
-                for word in unique_words
-                if len(word) > 2 and not word.isdigit() and not word.isascii()
-            ]
-            results = await asyncio.gather(*tasks)
-        
-        # 결과 필터링: 단어로 시작하는 약품 정보만 선택
-        filtered_results = {}
-        for word, pill_info in results:
-            if pill_info:
-                filtered_info = [
-                    item for item in pill_info
-                    if item['ITEM_NAME'].startswith(word)
-                ]
+            tasks = [search(index, session, word) for index, word in enumerate(candidate_words)]
+            for next_result in asyncio.as_completed(tasks):
+                index, word, pill_info = await next_result
+                filtered_info = self.filter_pill_info(word, pill_info)
                 if filtered_info:
-                    filtered_results[word] = filtered_info
-        
-        return filtered_results
+                    yield index, word, filtered_info
 
+    async def search_pills_from_text(self, text):
+        results = [result async for result in self.iter_pills_from_text(text)]
+        results.sort(key=lambda result: result[0])
+        return {word: pill_info for _, word, pill_info in results}
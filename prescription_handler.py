@@ -1,19 +1,28 @@
 import asyncio
 import logging
 from typing import Dict, Any, List, Tuple
-from database import get_prescription_by_hash, insert_prescription, insert_patient, get_patient_by_id
+from database import (
+    get_prescription_by_hash, insert_prescription, insert_patient, insert_patient_for_job, get_patient_by_id,
+    create_connection_async, insert_medical_chart_from_prescription
+)
 from decorators import async_timing_decorator
+from metrics import record_cache
 from models import PrescriptionData, MedicationInfo, Patient
 from ocr import document_ocr
 from open_data_grain import OpenDataGrain
-from langchain_handler import LangChainHandler
+from langchain_handler import get_langchain_handler
 from drug_product_info import DrugProductInfo
+from stage_graph import StageGraph
+from layout import extract_regions
+from metadata_rules import extract_metadata_by_rules, log_rule_result, METADATA_RULE_THRESHOLD, NOT_FOUND
+from upload_ingest import SpooledUpload
+from log_config import remember_patient_name
 from loguru import logger
 
 class PrescriptionHandler:
     def __init__(self):
         self.open_data_grain = OpenDataGrain()
-        self.langchain_handler = LangChainHandler()
+        self.langchain_handler = get_langchain_handler()
         self.drug_product_info = DrugProductInfo()
 
     async def check_existing_prescription(self, file_hash: str, conn) -> PrescriptionData | None:
@@ -24,25 +33,33 @@ class PrescriptionHandler:
         return None
 
     @async_timing_decorator
-    async def process_new_prescription(self, ocr_result: Dict[str, Any], conn) -> Patient:
+    async def process_new_prescription(self, ocr_result: Dict[str, Any], conn, job_id=None) -> Patient:
+        """job_id를 주면 작업당 한 번만 환자를 저장한다 (재시도해도 이전 실행이 저장한 환자 id를 씀)."""
         logger.info("처방전 처리 시작")
         
         text = ocr_result.get('text', '')
         logger.info(f"추출된 텍스트 길이: {len(text)} 문자")
+        # 약품 표와 환자 정보 블록만 후속 단계로 넘김 (찾지 못하면 전체 텍스트)
+        regions = extract_regions(ocr_result)
 
         logger.info("알약 이름 검색 시작")
-        item_names = await self.get_pill_item_names(text)
+        item_names = await self.get_pill_item_names(regions.medication_text)
         logger.info(f"알약 이름 검색 완료: {item_names}")
         
         logger.info("메타데이터 추출 시작")
-        metadata = await self.langchain_handler.extract_metadata(text, item_names, temperature=0.0)
+        metadata = await self.extract_patient_metadata(regions.patient_text, item_names)
         logger.info(f"메타데이터 추출 완료: {metadata}")
         
         # 환자 정보 추출 및 저장
         patient_data = Patient(**metadata)
         if item_names:
             patient_data.medications = item_names
-        patient_id = await insert_patient(conn, patient_data)
+        if job_id is None:
+            patient_id = await insert_patient(conn, patient_data)
+        else:
+            patient_id, created = await insert_patient_for_job(conn, job_id, patient_data)
+            if not created:
+                logger.info(f"이전 실행에서 저장한 환자를 사용합니다: 환자 ID {patient_id} (작업 {job_id})")
         if patient_id:
             patient_data.id = patient_id
         
@@ -50,14 +67,140 @@ class PrescriptionHandler:
 
         return patient_data
 
+    async def extract_patient_metadata(self, text: str, item_names=None) -> Dict[str, Any]:
+        # 표준 서식에서 규칙으로 충분히 확실하게 추출되면 LLM 호출을 생략
+        rule_result = extract_metadata_by_rules(text)
+        # 이후 로그(LLM 응답 등)에 나오는 환자 이름을 가리도록 등록
+        remember_patient_name(rule_result.metadata.get("name"))
+        hit = rule_result.confidence >= METADATA_RULE_THRESHOLD
+        log_rule_result(rule_result, hit)
+        if hit:
+            return rule_result.metadata
+        metadata = await self.langchain_handler.extract_metadata(text, item_names, temperature=0.0)
+        if isinstance(metadata, dict):
+            remember_patient_name(metadata.get("name"))
+            # LLM은 생년월일을 돌려주지 않으므로 규칙으로 찾은 생년월일(주민등록번호 앞자리)과 성별로 채움
+            # (환자 식별 키에 필요. 없으면 같은 환자의 처방전마다 새 환자 행이 생김)
+            for key in ("birth_date", "gender"):
+                if metadata.get(key) in (None, "", NOT_FOUND) and rule_result.metadata.get(key) not in (None, NOT_FOUND):
+                    metadata[key] = rule_result.metadata[key]
+        return metadata
+
+    @staticmethod
+    def first_item_name(items):
+        if isinstance(items, list) and len(items) > 0 and isinstance(items[0], dict) and 'ITEM_NAME' in items[0]:
+            return items[0]['ITEM_NAME']
+        return None
+
     async def get_pill_item_names(self, text: str) -> list:
         pill_results = await self.open_data_grain.search_pills_from_text(text)
         item_names = []
         for items in pill_results.values():
-            if isinstance(items, list) and len(items) > 0 and isinstance(items[0], dict) and 'ITEM_NAME' in items[0]:
-                item_names.append(items[0]['ITEM_NAME'])
+            item_name = self.first_item_name(items)
+            if item_name:
+                item_names.append(item_name)
         logger.debug(f"알약 검색 결과: {len(item_names)} 개 항목 발견")
         return item_names
+
+    async def fetch_shared_drug_info(self, item_name):
+        # 동시에 도는 조회끼리 커밋/롤백이 섞이지 않고, 여러 처방전이 공유하는 조회는
+        # 요청별 연결이 먼저 닫혀도 끝까지 진행되도록 조회마다 자체 연결을 사용
+        async with create_connection_async() as conn:
+            async with self.drug_product_info:
+                return await self.drug_product_info.get_drug_product_info(item_name, conn)
+
+    @async_timing_decorator
+    async def process_prescription_graph(self, ocr_result: Dict[str, Any], drug_cache=None,
+                                         pill_cache=None) -> Tuple[Patient, List[Dict[str, Any]]]:
+        """process_new_prescription + get_detailed_drug_info를 의존성 그래프로 실행한다.
+
+        알약 검색과 메타데이터 추출은 동시에 시작하고, 약품 상세 조회는 약품명이 하나 확인될 때마다
+        환자 저장을 기다리지 않고 바로 시작한다. drug_cache/pill_cache(dict)를 넘기면
+        일괄 처리 중인 다른 처방전과 조회 결과를 공유한다.
+        """
+        text = ocr_result.get('text', '')
+        logger.info(f"처방전 그래프 처리 시작: 텍스트 길이 {len(text)} 문자")
+        # 약품 표와 환자 정보 블록만 후속 단계로 넘김 (찾지 못하면 전체 텍스트)
+        regions = extract_regions(ocr_result)
+        graph = StageGraph("prescription")
+
+        async def fetch_detail(item_name):
+            if drug_cache is None:
+                drug_info = await self.fetch_shared_drug_info(item_name)
+            else:
+                record_cache("drug_lookup", item_name in drug_cache)
+                if item_name not in drug_cache:
+                    drug_cache[item_name] = asyncio.create_task(self.fetch_shared_drug_info(item_name))
+                drug_info = await asyncio.shield(drug_cache[item_name])
+            if not drug_info:
+                logger.warning(f"약품 정보를 찾을 수 없음: {item_name}")
+            return drug_info
+
+        async def collect_details(*drug_infos):
+            detailed_info = [drug_info for drug_info in drug_infos if drug_info]
+            logger.debug(f"상세 약품 정보: {len(detailed_info)} 개 항목 검색 완료")
+            return detailed_info
+
+        async def resolve_pill_names():
+            resolved = []
+            async for index, _, items in self.open_data_grain.iter_pills_from_text(regions.medication_text,
+                                                                                   cache=pill_cache):
+                item_name = self.first_item_name(items)
+                if not item_name:
+                    continue
+                resolved.append((index, item_name))
+                # 약품명이 확인되는 즉시 상세 조회 시작
+                if not graph.has(f"drug_info:{item_name}"):
+                    graph.add(f"drug_info:{item_name}", lambda name=item_name: fetch_detail(name))
+            item_names = [item_name for _, item_name in sorted(resolved)]
+            detail_stages = list(dict.fromkeys(f"drug_info:{item_name}" for item_name in item_names))
+            graph.add("detailed_info", collect_details, deps=detail_stages)
+            logger.info(f"알약 이름 검색 완료: {item_names}")
+            return item_names
+
+        async def extract_metadata():
+            # 메타데이터 추출은 알약 정보를 사용하지 않으므로 알약 검색을 기다리지 않는다
+            return await self.extract_patient_metadata(regions.patient_text)
+
+        async def save_patient(item_names, metadata):
+            patient_data = Patient(**metadata)
+            if item_names:
+                patient_data.medications = item_names
+            # 다른 단계가 같은 연결로 읽는 중에 쓰면 오래된 스냅샷 때문에 바로 database is locked가 나므로 별도 연결 사용
+            async with create_connection_async() as patient_conn:
+                patient_id = await insert_patient(patient_conn, patient_data)
+            if patient_id:
+                patient_data.id = patient_id
+            return patient_data
+
+        async with self.drug_product_info:
+            graph.add("pill_names", resolve_pill_names)
+            graph.add("metadata", extract_metadata)
+            graph.add("patient", save_patient, deps=("pill_names", "metadata"))
+            results = await graph.run()
+
+        graph.log_critical_path()
+        return results["patient"], results["detailed_info"]
+
+    async def process_prescription_file(self, file_source, drug_cache=None, pill_cache=None) -> Dict[str, Any]:
+        """처방전 파일 하나를 OCR부터 의료 차트 저장까지 처리한다. file_source는 SpooledUpload 또는 bytes."""
+        if isinstance(file_source, SpooledUpload):
+            with file_source.payload() as body:
+                ocr_result = await document_ocr(body)
+        else:
+            ocr_result = await document_ocr(file_source)
+        logger.debug(f"OCR 텍스트 길이: {len(ocr_result.get('text', ''))}")
+
+        patient_result, detailed_info = await self.process_prescription_graph(
+            ocr_result, drug_cache=drug_cache, pill_cache=pill_cache)
+
+        final_result = await self.langchain_handler.create_multidisciplinary_care(patient_result, detailed_info)
+
+        async with create_connection_async() as conn:
+            chart_id = await insert_medical_chart_from_prescription(conn, patient_result.id, final_result)
+            logger.info(f"의료 차트 저장 완료: 차트 ID {chart_id}")
+
+        return {"result": final_result, "chart_id": chart_id, "patient_id": patient_result.id}
     
     async def get_detailed_drug_info(self, metadata_result: Patient, conn) -> List[Dict[str, Any]]:
         async with self.drug_product_info:
@@ -82,8 +225,31 @@ class PrescriptionHandler:
         else:
             logger.error("처방전 저장 실패")
         return result
-    async def process_files(self, files, conn):
-        tasks = [self.process_new_prescription(file, conn) for file in files]
-        results = await asyncio.gather(*tasks)
-        return results
+    async def process_files(self, files, concurrency=4):
+        """여러 처방전 파일을 동시에 최대 concurrency개씩 처리하고, 끝나는 순서대로 (순번, 결과, 예외)를 내보낸다.
+
+        약품 조회 결과는 일괄 처리 전체에서 공유한다.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        drug_cache = {}
+        pill_cache = {}
+
+        async def process(index, file_source):
+            async with semaphore:
+                try:
+                    return index, await self.process_prescription_file(file_source, drug_cache, pill_cache), None
+                except Exception as e:
+                    logger.error(f"일괄 처방전 처리 오류: {index}번 파일 - {e}")
+                    return index, None, e
+
+        tasks = [asyncio.create_task(process(index, file_source)) for index, file_source in enumerate(files)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            # 클라이언트 연결이 끊기면 남은 처리와 shield로 보호된 약품 조회까지 취소하고 정리될 때까지 대기
+            pending = tasks + list(drug_cache.values())
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
 
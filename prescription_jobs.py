@@ -0,0 +1,63 @@
+import os
+from loguru import logger
+from database import insert_medical_chart_for_job
+from job_queue import JobQueue
+from models import Patient
+from ocr import document_ocr
+
+JOB_KIND = "extract_prescription"
+JOB_SPOOL_DIR = os.getenv("JOB_SPOOL_DIR", "tmp/jobs")
+
+
+def spool_job_file(upload):
+    """작업 파일을 디스크에 보관한다. 재시작 후에도 OCR 단계를 다시 실행할 수 있어야 하기 때문이다.
+
+    업로드 스풀이 디스크에 있으면 하드 링크로 복사 없이 보관한다.
+    실패한 작업의 파일은 확인을 위해 남겨 두고, 성공한 작업의 파일만 save_chart 단계에서 지운다.
+    """
+    return upload.link_to(JOB_SPOOL_DIR)
+
+
+def create_prescription_job_queue(prescription_handler, langchain_handler):
+    async def run_ocr(job, state, conn):
+        with open(job['payload']['file_path'], "rb") as f:
+            ocr_result = await document_ocr(f)
+        logger.debug(f"OCR 텍스트 길이: {len(ocr_result.get('text', ''))}")
+        return {'ocr_result': ocr_result}
+
+    async def extract_patient(job, state, conn):
+        # 이전 실행이 환자를 저장한 뒤 체크포인트 전에 중단됐다면 그 환자를 그대로 쓴다
+        patient_result = await prescription_handler.process_new_prescription(state['ocr_result'], conn,
+                                                                             job_id=job['id'])
+        return {'patient': patient_result.model_dump()}
+
+    async def fetch_drug_info(job, state, conn):
+        patient_result = Patient(**state['patient'])
+        detailed_info = await prescription_handler.get_detailed_drug_info(patient_result, conn)
+        return {'detailed_info': detailed_info}
+
+    async def create_care_plan(job, state, conn):
+        patient_result = Patient(**state['patient'])
+        final_result = await langchain_handler.create_multidisciplinary_care(patient_result, state['detailed_info'])
+        return {'result': final_result}
+
+    async def save_chart(job, state, conn):
+        payload = job['payload']
+        # 이전 실행이 차트를 저장한 뒤 체크포인트 전에 중단됐다면 그 차트를 그대로 쓴다 (중복 차트 방지)
+        chart_id, created = await insert_medical_chart_for_job(conn, job['id'], payload['object_key'],
+                                                               state['patient']['id'], state['result'])
+        logger.info(f"의료 차트 저장 완료: 차트 ID {chart_id}" + ("" if created else " (이전 실행에서 저장됨)"))
+        try:
+            os.remove(payload['file_path'])
+        except OSError:
+            pass
+        return {'chart_id': chart_id}
+
+    return JobQueue(JOB_KIND, [
+        ('ocr', run_ocr),
+        ('patient', extract_patient),
+        ('drug_info', fetch_drug_info),
+        ('care_plan', create_care_plan),
+        ('save_chart', save_chart),
+    ], result_keys=('result', 'chart_id'))
+
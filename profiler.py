@@ -0,0 +1,187 @@
+import asyncio
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from loguru import logger
+
+# 관리자 API 토큰 (X-Admin-Token 헤더). 설정하지 않으면 관리자 엔드포인트와 요청 프로파일링을 쓸 수 없다.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", 60))
+# 샘플링 간격. 10ms면 스레드 수십 개 기준 오버헤드가 1% 안팎
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", 10))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "tmp/profiles")
+
+# 아무 일도 하지 않고 기다리는 스택의 맨 위 프레임 (파일 이름, 함수 이름)
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    # aiosqlite 연결 스레드 (C 구현 큐에서 대기하므로 맨 위 파이썬 프레임이 run)
+    ("core.py", "run"),
+}
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# 프로파일링 중인 요청 id. 이 컨텍스트에서 만들어진 태스크를 그 요청의 태스크로 기록한다.
+_profile_id = ContextVar("profile_id", default=None)
+# 태스크 -> 프로파일 id
+_task_profiles = weakref.WeakKeyDictionary()
+_profile_lock = threading.Lock()
+
+
+def is_admin_token(token):
+    return bool(ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def _frame_label(frame, include_lines):
+    code = frame.f_code
+    file_name = os.path.basename(code.co_filename)
+    # co_qualname(클래스 이름 포함)은 파이썬 3.11부터
+    name = getattr(code, "co_qualname", code.co_name)
+    if include_lines:
+        return f"{name} ({file_name}:{frame.f_lineno})"
+    return f"{name} ({file_name})"
+
+
+def _is_idle(frame):
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+class StackSampler:
+    """별도 스레드에서 sys._current_frames()로 모든 스레드의 스택을 주기적으로 읽어 collapsed 형식으로 센다.
+
+    결과는 "스레드;바깥 프레임;...;안쪽 프레임 샘플 수" 줄들로, flamegraph.pl이나 speedscope에 그대로 넣을 수 있다.
+    thread_filter(thread_id)가 거짓인 스레드의 샘플은 버린다.
+    """
+
+    def __init__(self, interval=None, include_idle=False, include_lines=False, thread_filter=None):
+        self.interval = (interval if interval is not None else PROFILER_INTERVAL_MS) / 1000
+        self.include_idle = include_idle
+        self.include_lines = include_lines
+        self.thread_filter = thread_filter
+        self.counts = Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            if not self.include_idle and _is_idle(frame):
+                continue
+            if self.thread_filter is not None and not self.thread_filter(thread_id):
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame, self.include_lines))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, str(thread_id)))
+            self.counts[";".join(reversed(labels))] += 1
+        self.samples += 1
+
+    def run(self, seconds):
+        """seconds 동안 현재 스레드에서 샘플링한다. stop()을 호출하면 일찍 끝난다."""
+        start = time.perf_counter()
+        deadline = start + min(seconds, PROFILER_MAX_SECONDS)
+        while not self._stop.wait(self.interval) and time.perf_counter() < deadline:
+            self.sample()
+        self.elapsed = time.perf_counter() - start
+        return self
+
+    def start(self, seconds=None):
+        self._thread = threading.Thread(target=self.run, args=(seconds or PROFILER_MAX_SECONDS,),
+                                        name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+async def profile_process(seconds, interval=None, include_idle=False, include_lines=False):
+    """워커 프로세스 전체를 seconds 동안 샘플링한다. 이벤트 루프는 그동안 계속 요청을 처리한다."""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        sampler = StackSampler(interval, include_idle, include_lines)
+        await asyncio.to_thread(sampler.run, seconds)
+    finally:
+        _profile_lock.release()
+    logger.info(f"프로파일링 완료: {sampler.elapsed:.1f}초, 샘플 {sampler.samples}회, 스택 {len(sampler.counts)}종")
+    return sampler
+
+
+def _task_factory(loop, coro, context=None):
+    # 파이썬 3.11부터 create_task(context=...)가 context를 넘긴다. 3.10은 만드는 쪽 컨텍스트를 그대로 복사
+    if context is None:
+        task = asyncio.Task(coro, loop=loop)
+        profile_id = _profile_id.get()
+    else:
+        task = asyncio.Task(coro, loop=loop, context=context)
+        profile_id = context.get(_profile_id)
+    if profile_id is not None:
+        _task_profiles[task] = profile_id
+    return task
+
+
+def install_task_tracking(loop=None):
+    """요청 단위 프로파일링을 위해 태스크가 만들어질 때 어느 요청 소속인지 기록한다."""
+    loop = loop or asyncio.get_running_loop()
+    if loop.get_task_factory() is None:
+        loop.set_task_factory(_task_factory)
+
+
+@contextmanager
+def profile_request(profile_id=None):
+    """블록 안(이 요청)에서 만들어진 태스크가 이벤트 루프에서 실행 중일 때만 샘플을 기록한다.
+
+    스레드 풀로 넘긴 작업은 요청을 구분할 수 없어 포함하지 않는다.
+    """
+    profile_id = profile_id or uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    loop_thread_id = threading.get_ident()
+    token = _profile_id.set(profile_id)
+
+    def owned_by_request(thread_id):
+        if thread_id != loop_thread_id:
+            return False
+        # current_task(loop)는 다른 스레드에서도 해당 루프에서 실행 중인 태스크를 돌려준다
+        task = asyncio.current_task(loop)
+        return task is not None and _task_profiles.get(task) == profile_id
+
+    sampler = StackSampler(include_idle=False, thread_filter=owned_by_request).start()
+    try:
+        yield profile_id, sampler
+    finally:
+        _profile_id.reset(token)
+        sampler.stop()
+
+
+def profile_path(profile_id):
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    return os.path.join(PROFILE_DIR, f"{profile_id}.collapsed")
+
+
+def save_profile(profile_id, sampler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(profile_path(profile_id), "w", encoding="utf-8") as f:
+        f.write(sampler.collapsed())
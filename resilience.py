@@ -0,0 +1,293 @@
+import asyncio
+import os
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import aiohttp
+from loguru import logger
+from metrics import CIRCUIT_STATE, CIRCUIT_REJECTED, UPSTREAM_HEDGES, DEADLINE_EXCEEDED
+
+# 연속 실패가 이 횟수에 이르면 서킷을 연다
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+# 서킷을 연 뒤 반열림(시험 호출)으로 넘어가기까지 기다리는 시간(초)
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30.0))
+# 반열림 상태에서 동시에 허용하는 시험 호출 수
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", 1))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+# 헤지 요청은 전체 호출의 이 비율까지만 보냄 (업스트림 호출량 제한)
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", 0.1))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.05))
+# p95를 계산할 최근 성공 호출 수와, 헤지를 시작하기 전에 필요한 최소 표본 수
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", 200))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+HEDGE_TOKEN_CAP = 10.0
+
+# 업스트림별 호출 제한 시간(초). UPSTREAM_TIMEOUT_<이름> 환경 변수로 바꿀 수 있다
+DEFAULT_UPSTREAM_TIMEOUTS = {
+    "data_go_kr": 10.0,
+    "ocr": 60.0,
+    "stt": 300.0,
+    "llm": 120.0,
+}
+
+# 업스트림 장애로 보는 예외 (응답 파싱 오류 등은 장애로 세지 않음)
+FAILURE_TYPES = (
+    asyncio.TimeoutError,
+    aiohttp.ClientError,
+    OSError,
+)
+# openai 예외 이름. openai는 첫 LLM 호출 때 import되므로(시작 시간 단축) 모듈을 직접 import하지 않는다
+OPENAI_FAILURE_NAMES = ("APIConnectionError", "InternalServerError", "RateLimitError")
+
+
+def _failure_types():
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return FAILURE_TYPES
+    return FAILURE_TYPES + tuple(getattr(openai, name) for name in OPENAI_FAILURE_NAMES)
+
+STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def is_failure(error):
+    """업스트림 장애로 셀 예외인지. 4xx 응답(잘못된 요청)은 업스트림 장애가 아니다."""
+    if isinstance(error, UpstreamError):
+        return True
+    if not isinstance(error, _failure_types()):
+        return False
+    # aiohttp.ClientResponseError는 status, requests.HTTPError는 response.status_code
+    status = getattr(error, "status", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    return not isinstance(status, int) or status >= 500 or status == 429
+
+# 요청 처리 마감 시각 (time.monotonic 기준). HTTP 미들웨어가 X-Request-Timeout으로 설정한다
+_deadline = ContextVar("deadline", default=None)
+
+
+class UpstreamError(Exception):
+    def __init__(self, upstream, message):
+        super().__init__(message)
+        self.upstream = upstream
+
+
+class UpstreamStatusError(UpstreamError):
+    """업스트림이 5xx/429로 응답함."""
+
+
+class UpstreamTimeout(UpstreamError):
+    pass
+
+
+class CircuitOpenError(UpstreamError):
+    def __init__(self, upstream, retry_after):
+        super().__init__(upstream, f"{upstream} 서킷이 열려 있습니다")
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, upstream=None):
+        super().__init__(f"요청 마감 시각 초과{f' ({upstream})' if upstream else ''}")
+        self.upstream = upstream
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """블록 안의 업스트림 호출이 seconds 안에 끝나도록 마감 시각을 설정한다. 더 짧은 바깥 마감이 있으면 유지한다."""
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def raise_for_upstream_status(upstream, status):
+    # 4xx(잘못된 요청, 결과 없음)는 업스트림 장애가 아니므로 호출한 쪽에서 처리
+    if status >= 500 or status == 429:
+        raise UpstreamStatusError(upstream, f"{upstream} 응답 상태 {status}")
+
+
+class CircuitBreaker:
+    """연속 실패가 쌓이면 열고(즉시 거절), reset_timeout 뒤 반열림 상태에서 시험 호출로 회복을 확인한다."""
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None, half_open_probes=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or CIRCUIT_RESET_TIMEOUT
+        self.half_open_probes = half_open_probes or CIRCUIT_HALF_OPEN_PROBES
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        CIRCUIT_STATE.labels(name).set(0)
+
+    def _transition(self, state):
+        if state != self.state:
+            logger.warning(f"서킷 브레이커 {self.name}: {self.state} -> {state}")
+        self.state = state
+        CIRCUIT_STATE.labels(self.name).set(STATE_VALUES[state])
+
+    def before_call(self):
+        if self.state == "open":
+            waited = time.monotonic() - self.opened_at
+            if waited < self.reset_timeout:
+                CIRCUIT_REJECTED.labels(self.name).inc()
+                raise CircuitOpenError(self.name, self.reset_timeout - waited)
+            self._transition("half_open")
+            self.probes = 0
+        if self.state == "half_open":
+            if self.probes >= self.half_open_probes:
+                CIRCUIT_REJECTED.labels(self.name).inc()
+                raise CircuitOpenError(self.name, 1)
+            self.probes += 1
+
+    def record_success(self):
+        self.failures = 0
+        if self.state == "half_open":
+            self._transition("closed")
+
+    def record_failure(self):
+        if self.state == "half_open":
+            self._open()
+            return
+        self.failures += 1
+        if self.state == "closed" and self.failures >= self.failure_threshold:
+            self._open()
+
+    def record_abandoned(self):
+        # 결과를 모른 채 끝난 호출 (취소, 요청 마감). 반열림 시험 자리만 돌려준다
+        if self.state == "half_open" and self.probes > 0:
+            self.probes -= 1
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self.failures = 0
+        self._transition("open")
+
+
+class Upstream:
+    """외부 API 하나에 대한 호출 정책: 제한 시간(요청 마감 반영), 서킷 브레이커, 멱등 조회의 헤지 요청."""
+
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout or float(os.getenv(f"UPSTREAM_TIMEOUT_{name.upper()}",
+                                                  DEFAULT_UPSTREAM_TIMEOUTS.get(name, 30.0)))
+        self.breaker = CircuitBreaker(name)
+        self.latencies = deque(maxlen=HEDGE_WINDOW)
+        self._p95 = None
+        self._p95_samples = 0
+        self.hedge_tokens = 1.0
+
+    def hedge_delay(self):
+        """최근 성공 호출 지연 시간의 p95. 표본이 적으면 None (헤지하지 않음)."""
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        # 정렬 비용을 줄이려고 표본이 10개 늘 때마다 다시 계산
+        if self._p95 is None or len(self.latencies) - self._p95_samples >= 10 or self._p95_samples > len(self.latencies):
+            ordered = sorted(self.latencies)
+            self._p95 = max(ordered[int(0.95 * (len(ordered) - 1))], HEDGE_MIN_DELAY)
+            self._p95_samples = len(self.latencies)
+        return self._p95
+
+    def _call_timeout(self):
+        remaining = remaining_time()
+        if remaining is None or remaining >= self.timeout:
+            return self.timeout, False
+        if remaining <= 0:
+            DEADLINE_EXCEEDED.labels(self.name).inc()
+            raise DeadlineExceeded(self.name)
+        return remaining, True
+
+    async def _attempt(self, func, timeout, deadline_bound):
+        self.breaker.before_call()
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(func(), timeout)
+        except asyncio.TimeoutError:
+            if deadline_bound:
+                self.breaker.record_abandoned()
+                DEADLINE_EXCEEDED.labels(self.name).inc()
+                raise DeadlineExceeded(self.name)
+            self.breaker.record_failure()
+            raise UpstreamTimeout(self.name, f"{self.name} 응답 시간 초과 ({timeout:.1f}초)")
+        except asyncio.CancelledError:
+            self.breaker.record_abandoned()
+            raise
+        except Exception as e:
+            if is_failure(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+    async def call(self, func, hedge=False):
+        """func()(코루틴 함수)를 호출한다. hedge=True면 p95 안에 끝나지 않을 때 같은 요청을 한 번 더 보낸다.
+
+        멱등 조회에만 hedge를 쓴다. 서킷이 열려 있으면 CircuitOpenError, 요청 마감을 넘기면 DeadlineExceeded.
+        """
+        timeout, deadline_bound = self._call_timeout()
+        self.hedge_tokens = min(self.hedge_tokens + HEDGE_MAX_RATIO, HEDGE_TOKEN_CAP)
+        delay = self.hedge_delay() if hedge and HEDGE_ENABLED else None
+        if delay is None or delay >= timeout:
+            return await self._attempt(func, timeout, deadline_bound)
+
+        first = asyncio.create_task(self._attempt(func, timeout, deadline_bound))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or self.hedge_tokens < 1.0 or self.breaker.state != "closed":
+            return await first
+
+        self.hedge_tokens -= 1.0
+        UPSTREAM_HEDGES.labels(self.name, "sent").inc()
+        second = asyncio.create_task(self._attempt(func, timeout - delay, deadline_bound))
+        pending = {first, second}
+        errors = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (first, second):
+                    if task not in done:
+                        continue
+                    if task.exception() is None:
+                        if task is second:
+                            UPSTREAM_HEDGES.labels(self.name, "won").inc()
+                        return task.result()
+                    errors.append(task.exception())
+            raise errors[0]
+        finally:
+            # 늦은 쪽 요청은 취소
+            for task in (first, second):
+                task.cancel()
+
+
+# 업스트림 이름 -> Upstream (프로세스 단위로 공유)
+_upstreams = {}
+
+
+def get_upstream(name):
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        upstream = _upstreams[name] = Upstream(name)
+    return upstream
+
+
+def upstream_stats():
+    return {name: {'state': upstream.breaker.state, 'timeout': upstream.timeout,
+                   'p95_seconds': round(upstream._p95, 4) if upstream._p95 is not None else None,
+                   'samples': len(upstream.latencies)}
+            for name, upstream in _upstreams.items()}
@@ -1,33 +1,107 @@
-import boto3
+import asyncio
+import hashlib
+import io
 import os
+import threading
 from dotenv import load_dotenv
 from decorators import async_timing_decorator
-from botocore.exceptions import ClientError
 from loguru import logger
 
 # Load environment variables
 load_dotenv()
 
 service_name = 's3'
-endpoint_url = 'https://kr.object.ncloudstorage.com'
+endpoint_url = os.getenv('S3_ENDPOINT_URL', 'https://kr.object.ncloudstorage.com')
 region_name = 'kr-standard'
 access_key = os.getenv('NAVER_ACCESS_KEY')
 secret_key = os.getenv('NAVER_SECRET_KEY')
 
-s3 = boto3.client(service_name, endpoint_url=endpoint_url, aws_access_key_id=access_key,
-                  aws_secret_access_key=secret_key)
-
 bucket_name = 'livecare'
 
+# 이 크기 이상의 파일(주로 음성 파일)은 멀티파트로 업로드
+MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+MULTIPART_CHUNK_SIZE = int(os.getenv('S3_MULTIPART_CHUNK_SIZE', 8 * 1024 * 1024))
+
+# boto3 import와 클라이언트 생성은 첫 업로드 때 한다 (서버 시작 시간 단축, fork 전 클라이언트 생성 방지)
+_client = None
+_transfer_config = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """S3 클라이언트와 전송 설정. 업로드 워커 스레드들이 함께 쓴다 (boto3 클라이언트는 스레드 안전)."""
+    global _client, _transfer_config
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import boto3
+                from boto3.s3.transfer import TransferConfig
+                _transfer_config = TransferConfig(
+                    multipart_threshold=MULTIPART_THRESHOLD,
+                    multipart_chunksize=MULTIPART_CHUNK_SIZE,
+                    max_concurrency=4,
+                )
+                _client = boto3.client(service_name, endpoint_url=endpoint_url, aws_access_key_id=access_key,
+                                       aws_secret_access_key=secret_key)
+    return _client, _transfer_config
+
+
+def get_file_url(file_name):
+    return f"https://{bucket_name}.kr.object.ncloudstorage.com/{file_name}"
+
+
+def calculate_content_hash(file_content):
+    return hashlib.sha256(file_content).hexdigest()
+
+
+def content_address_key(file_hash, extension="", prefix="objects"):
+    """파일 해시로부터 객체 키를 만든다. 같은 내용은 항상 같은 키가 되어 업로드가 멱등해진다."""
+    if extension and not extension.startswith('.'):
+        extension = f".{extension}"
+    return f"{prefix}/{file_hash[:2]}/{file_hash}{extension.lower()}"
+
+
+def object_exists_sync(file_name):
+    """HEAD 요청으로 객체 존재 여부만 확인한다. 워커 스레드에서 호출해야 한다."""
+    from botocore.exceptions import ClientError
+    client, _ = get_client()
+    try:
+        client.head_object(Bucket=bucket_name, Key=file_name)
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+
+def upload_file_to_s3_sync(file_content, file_name, content_type=None):
+    """블로킹 업로드. 이벤트 루프가 아닌 워커 스레드에서 호출해야 한다.
+
+    임계값 이상의 파일은 boto3 전송 매니저가 멀티파트 업로드로 처리한다.
+    실패 시 예외를 그대로 올려 호출 측에서 재시도 여부를 결정하게 한다.
+    """
+    extra_args = {'ContentType': content_type} if content_type else None
+    client, transfer_config = get_client()
+    client.upload_fileobj(io.BytesIO(file_content), bucket_name, file_name,
+                          ExtraArgs=extra_args, Config=transfer_config)
+    return get_file_url(file_name)
+
+
+def upload_path_to_s3_sync(file_path, file_name, content_type=None):
+    """디스크 파일을 읽으며 업로드한다(큰 파일은 멀티파트). 워커 스레드에서 호출해야 한다."""
+    extra_args = {'ContentType': content_type} if content_type else None
+    client, transfer_config = get_client()
+    client.upload_file(file_path, bucket_name, file_name, ExtraArgs=extra_args, Config=transfer_config)
+    return get_file_url(file_name)
+
+
 @async_timing_decorator
 async def upload_file_to_s3(file_content, file_name):
+    from botocore.exceptions import ClientError
     try:
-        s3.put_object(Bucket=bucket_name, Key=file_name, Body=file_content)
-        file_url = f"https://{bucket_name}.kr.object.ncloudstorage.com/{file_name}"
+        file_url = await asyncio.to_thread(upload_file_to_s3_sync, file_content, file_name)
         logger.info(f"파일 업로드 성공: {file_url}")
         return file_url
     except ClientError as e:
         logger.error(f"S3 업로드 실패: {e}")
         return None
-
-# ... 기존의 다른 함수들 ...
\ No newline at end of file
@@ -0,0 +1,24 @@
+import argparse
+import asyncio
+from loguru import logger
+from database import create_connection_async, create_tables, rebuild_search_index, SEARCH_INDEXES
+
+
+async def rebuild(tables):
+    async with create_connection_async() as conn:
+        # 검색 테이블이 없으면 먼저 생성
+        await create_tables(conn)
+        for table in tables:
+            await rebuild_search_index(conn, table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="전문 검색 인덱스를 원본 테이블에서 다시 색인합니다.")
+    parser.add_argument("tables", nargs="*", help=f"다시 색인할 테이블 {list(SEARCH_INDEXES)} (생략하면 전체)")
+    args = parser.parse_args()
+    unknown = [table for table in args.tables if table not in SEARCH_INDEXES]
+    if unknown:
+        parser.error(f"알 수 없는 테이블: {unknown}")
+    tables = args.tables or list(SEARCH_INDEXES)
+    logger.info(f"검색 인덱스 재구축 시작: {', '.join(tables)}")
+    asyncio.run(rebuild(tables))
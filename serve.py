@@ -0,0 +1,82 @@
+"""운영 서버 실행: gunicorn 마스터가 앱을 미리 import(preload)한 뒤 UvicornWorker 여러 개를 fork한다.
+
+무거운 모듈(langchain, openai, boto3 등)은 마스터에서 한 번만 import해 워커들이 메모리를 공유한다.
+HTTP 클라이언트, DB 연결, 프로세스 풀은 fork 뒤 각 워커가 처음 쓸 때(또는 lifespan 시작 시) 만든다.
+캐시, 입장 제어 한도, 서킷 브레이커는 워커별로 따로 동작한다.
+
+    python serve.py
+    WEB_CONCURRENCY=4 PORT=8000 python serve.py
+
+/metrics는 PROMETHEUS_MULTIPROC_DIR에 워커별로 남긴 값을 합쳐 내보낸다 (시작할 때마다 비움).
+"""
+import os
+import shutil
+from dotenv import load_dotenv
+from gunicorn.app.base import BaseApplication
+
+load_dotenv()
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8000))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", min(4, os.cpu_count() or 1)))
+# 워커가 이 시간(초) 동안 응답(heartbeat)이 없으면 재시작. 비동기 워커라 요청 처리 시간과는 무관
+SERVER_TIMEOUT = int(os.getenv("SERVER_TIMEOUT", 30))
+# 종료 시 진행 중인 작업과 남은 S3 업로드를 처리할 시간(초)
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", 120))
+SERVER_KEEPALIVE = int(os.getenv("SERVER_KEEPALIVE", 5))
+# 워커당 이 수만큼 요청을 처리하면 재시작 (0이면 끔). 워커들이 동시에 재시작하지 않도록 jitter를 더한다
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", 0))
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", 0))
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "tmp/prometheus")
+
+
+def prepare_metrics_dir():
+    # prometheus_client는 import할 때 이 환경 변수를 보고 값 저장 방식을 정하므로 앱 import 전에 설정
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = PROMETHEUS_MULTIPROC_DIR
+
+
+def child_exit(server, worker):
+    # 종료된 워커의 livesum/livemax 게이지 값은 더 이상 합치지 않음
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+class Server(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # preload_app이므로 마스터에서 한 번 실행된다. 클라이언트는 만들지 않고 모듈만 import
+        from langchain_handler import preload_modules
+        preload_modules()
+        import boto3  # noqa: F401
+        import requests  # noqa: F401
+        from main import app
+        return app
+
+
+def main():
+    prepare_metrics_dir()
+    Server({
+        "bind": f"{HOST}:{PORT}",
+        "workers": WEB_CONCURRENCY,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "timeout": SERVER_TIMEOUT,
+        "graceful_timeout": SERVER_GRACEFUL_TIMEOUT,
+        "keepalive": SERVER_KEEPALIVE,
+        "max_requests": SERVER_MAX_REQUESTS,
+        "max_requests_jitter": SERVER_MAX_REQUESTS_JITTER,
+        "child_exit": child_exit,
+    }).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+import time
+from loguru import logger
+from tracing import span
+
+# 현재 실행 중인 단계 이름 (실행 중 추가된 단계의 부모를 기록하는 데 사용)
+_current_stage = contextvars.ContextVar("current_stage", default=None)
+
+
+class StageGraph:
+    """비동기 단계들의 의존성 그래프 실행기.
+
+    add(name, func, deps)로 단계를 등록하면 의존 단계가 모두 끝나는 즉시 func(*의존 단계 결과)가 실행된다.
+    실행 중인 단계 안에서도 add()로 새 단계를 추가할 수 있어, 입력이 하나씩 도착할 때마다
+    후속 작업을 바로 시작할 수 있다. 실행이 끝나면 critical_path()로 요청의 임계 경로를 얻는다.
+    """
+
+    def __init__(self, name="pipeline"):
+        self.name = name
+        self.deps = {}
+        # 실행 중인 단계가 추가한 단계 -> (부모 단계, 추가 시각)
+        self.parents = {}
+        self.tasks = {}
+        self.timings = {}
+        self.origin = None
+
+    def add(self, name, func, deps=()):
+        if name in self.tasks:
+            raise ValueError(f"이미 등록된 단계입니다: {name}")
+        missing = [dep for dep in deps if dep not in self.tasks]
+        if missing:
+            raise ValueError(f"등록되지 않은 의존 단계: {missing}")
+        if self.origin is None:
+            self.origin = time.perf_counter()
+        self.deps[name] = tuple(deps)
+        parent = _current_stage.get()
+        if parent is not None:
+            self.parents[name] = (parent, time.perf_counter() - self.origin)
+        self.tasks[name] = asyncio.create_task(self._run_stage(name, func), name=f"{self.name}:{name}")
+        return self.tasks[name]
+
+    async def _run_stage(self, name, func):
+        args = [await self.tasks[dep] for dep in self.deps[name]]
+        _current_stage.set(name)
+        start = time.perf_counter()
+        # drug_info:약품명 같은 동적 단계는 이름을 묶고 약품명은 속성으로 남김
+        stage, _, key = name.partition(":")
+        try:
+            with span(f"{self.name}.{stage}", **({'key': key} if key else {})):
+                return await func(*args)
+        finally:
+            self.timings[name] = (start - self.origin, time.perf_counter() - self.origin)
+
+    def has(self, name):
+        return name in self.tasks
+
+    async def result(self, name):
+        return await self.tasks[name]
+
+    async def run(self):
+        """등록된(그리고 실행 중 추가되는) 모든 단계가 끝날 때까지 기다린다. 한 단계라도 실패하면 나머지를 취소한다."""
+        try:
+            while True:
+                pending = [task for task in self.tasks.values() if not task.done()]
+                if not pending:
+                    break
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+        except BaseException:
+            for task in self.tasks.values():
+                task.cancel()
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in self.tasks.items()}
+
+    def critical_path(self):
+        """가장 늦게 끝난 단계에서 시작해, 가장 늦게 준비를 끝낸 선행 단계를 거꾸로 따라간 경로.
+
+        선행 단계는 의존 단계(끝난 시각)와 이 단계를 추가한 부모 단계(추가한 시각) 중 가장 늦은 것이다.
+        """
+        if not self.timings:
+            return []
+        current = max(self.timings, key=lambda name: self.timings[name][1])
+        cutoff = None
+        path = []
+        while current is not None:
+            start, end = self.timings[current]
+            end = cutoff if cutoff is not None else end
+            path.append({'stage': current, 'start': round(start, 3), 'duration': round(end - start, 3)})
+            candidates = [(self.timings[dep][1], dep, None) for dep in self.deps[current] if dep in self.timings]
+            if current in self.parents and self.parents[current][0] in self.timings:
+                parent, spawned_at = self.parents[current]
+                candidates.append((spawned_at, parent, spawned_at))
+            if not candidates:
+                break
+            _, current, cutoff = max(candidates, key=lambda candidate: candidate[0])
+        path.reverse()
+        return path
+
+    def log_critical_path(self):
+        path = self.critical_path()
+        total = path[-1]['start'] + path[-1]['duration'] if path else 0.0
+        summary = " -> ".join(f"{step['stage']}({step['duration']:.2f}s)" for step in path)
+        logger.info(f"{self.name} 임계 경로 {total:.2f}초: {summary}")
+        return path
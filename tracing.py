@@ -0,0 +1,321 @@
+import asyncio
+import json
+import os
+import random
+import secrets
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+import aiohttp
+from loguru import logger
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+# none | jsonl | otlp
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "logs/traces.jsonl")
+# 로컬 OpenTelemetry 컬렉터의 OTLP/HTTP(JSON) 수신 주소
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "livecare_backend")
+# 내보낼 트레이스 비율 (Server-Timing 헤더에는 영향 없음)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 1.0))
+# 응답에 Server-Timing 헤더로 단계별 시간 요약을 붙일지 여부
+TRACE_SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "0") == "1"
+TRACE_SERVER_TIMING_LIMIT = int(os.getenv("TRACE_SERVER_TIMING_LIMIT", 8))
+# 트레이스 하나에 보관하는 최대 스팬 수 (일괄 처리 요청의 메모리 제한)
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 2000))
+TRACE_EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_EXPORT_QUEUE_SIZE", 1000))
+TRACE_EXPORT_BATCH = int(os.getenv("TRACE_EXPORT_BATCH", 50))
+
+# OTLP span kind
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+
+# 현재 실행 중인 스팬. asyncio 태스크는 만들어질 때의 컨텍스트를 복사하므로
+# gather/create_task로 띄운 동시 호출도 띄운 쪽 스팬의 자식이 된다.
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "kind", "start_ns", "_start", "duration",
+                 "attributes", "error")
+
+    def __init__(self, trace, name, parent_id=None, kind=KIND_INTERNAL, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def end(self):
+        self.duration = self.elapsed()
+        self.trace.finish(self)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ns': self.start_ns,
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': {key: _redact_value(value) for key, value in self.attributes.items()},
+            'error': _redact_value(self.error),
+        }
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.start_ns + int(self.duration * 1e9)),
+            'attributes': [{'key': key, 'value': _otlp_value(_redact_value(value))}
+                           for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': _redact_value(self.error)} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _redact_value(value):
+    # 오류 메시지와 속성에 환자 정보가 섞일 수 있어 내보내기 전에 로그와 같은 규칙으로 가림
+    # (log_config가 이 모듈을 import하므로 여기서 import)
+    from log_config import LOG_REDACT, redact
+    if LOG_REDACT and isinstance(value, str):
+        return redact(value)
+    return value
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class Trace:
+    """요청(또는 백그라운드 작업) 하나의 스팬 모음."""
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self.dropped = 0
+        # end_after_body로 루트 스팬 종료를 응답 본문 전송 뒤로 미룬 경우
+        self.deferred = False
+
+    def finish(self, span):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def server_timing(self, root):
+        """Server-Timing 헤더 값: 스팬 이름별 합계 시간(ms)과 호출 수를 큰 순서대로.
+
+        동시에 실행된 스팬은 합계가 전체 시간보다 클 수 있다.
+        """
+        totals = {}
+        for span in self.spans:
+            if span is root:
+                continue
+            total = totals.setdefault(span.name, [0.0, 0])
+            total[0] += span.duration
+            total[1] += 1
+        entries = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)[:TRACE_SERVER_TIMING_LIMIT]
+        parts = [f'{_timing_token(name)};dur={total * 1000:.1f};desc="x{count}"' for name, (total, count) in entries]
+        parts.append(f"total;dur={root.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def _timing_token(name):
+    return "".join(char if char.isascii() and (char.isalnum() or char in "._-") else "_" for char in name)
+
+
+@contextmanager
+def start_trace(name, **attributes):
+    """새 트레이스의 루트 스팬을 연다. 블록이 끝나면 트레이스를 내보내기 큐에 넣는다."""
+    if not TRACING_ENABLED:
+        yield None
+        return
+    root = Span(Trace(), name, kind=KIND_SERVER, attributes=attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except Exception as e:
+        root.error = f"{type(e).__name__}: {e}"
+        root.trace.deferred = False
+        raise
+    finally:
+        _current_span.reset(token)
+        if not root.trace.deferred:
+            end_trace(root)
+
+
+def end_trace(root):
+    """루트 스팬을 닫고 트레이스를 내보내기 큐에 넣는다. 두 번째 호출부터는 무시한다."""
+    if root.duration is not None:
+        return
+    root.end()
+    if random.random() < TRACE_SAMPLE_RATE:
+        trace_exporter.submit(root.trace)
+
+
+def _end_trace_soon(loop, root):
+    if not loop.is_closed():
+        loop.call_soon_threadsafe(end_trace, root)
+
+
+def end_after_body(response, root):
+    """스트리밍 응답은 본문을 다 보낸 뒤에 루트 스팬을 닫는다 (일괄 처리 스팬이 본문 스트리밍 중에 생김).
+
+    start_trace 블록 안에서 불러야 하며, 그러면 블록이 끝나도 트레이스를 내보내지 않는다.
+    """
+    if root is None or getattr(response, "body_iterator", None) is None:
+        return response
+    body_iterator = response.body_iterator
+
+    async def end_when_sent():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        except Exception as e:
+            root.error = root.error or f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            end_trace(root)
+
+    wrapped = end_when_sent()
+    # 본문을 한 번도 읽지 않고 버려진 경우(전송 전 연결 끊김)에도 트레이스를 내보냄
+    weakref.finalize(wrapped, _end_trace_soon, asyncio.get_running_loop(), root)
+    root.trace.deferred = True
+    response.body_iterator = wrapped
+    return response
+
+
+@contextmanager
+def span(name, upstream="", **attributes):
+    """현재 트레이스에 자식 스팬을 연다. 트레이스 밖에서는 아무것도 기록하지 않는다."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    if upstream:
+        attributes['upstream'] = upstream
+    child = Span(parent.trace, name, parent.span_id, KIND_CLIENT if upstream else KIND_INTERNAL, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def set_attribute(key, value):
+    current = _current_span.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+def current_trace_id():
+    current = _current_span.get()
+    return current.trace.trace_id if current is not None else None
+
+
+class TraceExporter:
+    """끝난 트레이스를 백그라운드에서 JSON Lines 파일이나 OTLP 컬렉터로 보낸다. 큐가 가득 차면 버린다."""
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter or TRACE_EXPORTER
+        self.queue = None
+        self.task = None
+        self.session = None
+        self.exported = 0
+        self.dropped = 0
+
+    async def start(self):
+        if self.exporter == "none" or self.task is not None:
+            return
+        if self.exporter not in ("jsonl", "otlp"):
+            logger.error(f"알 수 없는 TRACE_EXPORTER: {self.exporter}")
+            return
+        self.queue = asyncio.Queue(maxsize=TRACE_EXPORT_QUEUE_SIZE)
+        self.task = asyncio.create_task(self._run(), name="trace-exporter")
+        logger.info(f"트레이스 내보내기 시작: {self.exporter}")
+
+    async def stop(self, timeout=5.0):
+        if self.task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"트레이스 내보내기 시간 초과: 미전송 {self.queue.qsize()}건")
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        if self.session is not None:
+            await self.session.close()
+        self.task = self.queue = self.session = None
+
+    def submit(self, trace):
+        if self.queue is None:
+            return
+        try:
+            self.queue.put_nowait(trace)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < TRACE_EXPORT_BATCH and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                if self.exporter == "jsonl":
+                    await asyncio.to_thread(self._append_jsonl, batch)
+                else:
+                    await self._post_otlp(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.warning(f"트레이스 내보내기 실패 ({len(batch)}건): {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    @staticmethod
+    def _append_jsonl(batch):
+        os.makedirs(os.path.dirname(TRACE_JSONL_PATH) or ".", exist_ok=True)
+        with open(TRACE_JSONL_PATH, "a", encoding="utf-8") as f:
+            for trace in batch:
+                f.write(json.dumps({'trace_id': trace.trace_id, 'dropped_spans': trace.dropped,
+                                    'spans': [span.to_dict() for span in trace.spans]},
+                                   ensure_ascii=False, default=str) + "\n")
+
+    async def _post_otlp(self, batch):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': TRACE_SERVICE_NAME}}]},
+            'scopeSpans': [{'scope': {'name': 'livecare'},
+                            'spans': [span.to_otlp() for trace in batch for span in trace.spans]}],
+        }]}
+        async with self.session.post(TRACE_OTLP_ENDPOINT, json=payload) as response:
+            response.raise_for_status()
+
+
+trace_exporter = TraceExporter()
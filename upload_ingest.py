@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+from fastapi import HTTPException
+from loguru import logger
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    # python-multipart 0.0.13 이전
+    from multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "tmp/uploads")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# 이 크기까지는 메모리에 두고, 넘으면 디스크 임시 파일로 옮긴다
+UPLOAD_MEMORY_LIMIT = int(os.getenv("UPLOAD_MEMORY_LIMIT", 4 * 1024 * 1024))
+
+# 엔드포인트별 최대 업로드 크기 (바이트)
+MAX_PRESCRIPTION_UPLOAD_BYTES = int(os.getenv("MAX_PRESCRIPTION_UPLOAD_BYTES", 20 * 1024 * 1024))
+MAX_AUDIO_UPLOAD_BYTES = int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", 200 * 1024 * 1024))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", 500 * 1024 * 1024))
+# 사진 한 장당 최대 크기
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", 30 * 1024 * 1024))
+
+UPLOAD_SIZE_LIMITS = {
+    "/extract_prescription": MAX_PRESCRIPTION_UPLOAD_BYTES,
+    "/prescription_jobs": MAX_PRESCRIPTION_UPLOAD_BYTES,
+    "/extract_prescriptions/batch": MAX_BATCH_UPLOAD_BYTES,
+    "/extract_prescription/images": MAX_BATCH_UPLOAD_BYTES,
+    "/transcribe_audio": MAX_AUDIO_UPLOAD_BYTES,
+}
+
+
+class SpooledUpload:
+    """업로드 본문을 한 번만 저장해 두고 S3/OCR/STT가 복사 없이 나눠 쓰게 하는 스풀 파일.
+
+    작은 파일은 메모리(BytesIO)에 두고 view()로 memoryview를 넘기며,
+    memory_limit를 넘으면 디스크 임시 파일로 옮겨 path로 넘긴다.
+    """
+
+    def __init__(self, filename=None, content_type=None, memory_limit=UPLOAD_MEMORY_LIMIT):
+        self.filename = filename
+        self.content_type = content_type
+        self.memory_limit = memory_limit
+        self.size = 0
+        self.file_hash = None
+        self.path = None
+        self._hasher = hashlib.sha256()
+        self._buffer = io.BytesIO()
+        self._file = None
+
+    @property
+    def in_memory(self):
+        return self._file is None
+
+    def write(self, chunk):
+        self._hasher.update(chunk)
+        self.size += len(chunk)
+        if self._file is None and self.size > self.memory_limit:
+            self._rollover()
+        if self._file is None:
+            self._buffer.write(chunk)
+        else:
+            self._file.write(chunk)
+
+    def _rollover(self):
+        os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+        suffix = os.path.splitext(self.filename or "")[1]
+        self._file = tempfile.NamedTemporaryFile(dir=UPLOAD_SPOOL_DIR, suffix=suffix, delete=False)
+        self.path = self._file.name
+        self._file.write(self._buffer.getbuffer())
+        self._buffer = None
+
+    def finish(self):
+        self.file_hash = self._hasher.hexdigest()
+        if self._file is not None:
+            self._file.close()
+        return self
+
+    def view(self):
+        """메모리에 있는 경우 본문의 memoryview (복사 없음)."""
+        if not self.in_memory:
+            raise ValueError("디스크에 저장된 업로드는 path를 사용해야 합니다")
+        return self._buffer.getbuffer()
+
+    @contextmanager
+    def payload(self):
+        """메모리면 memoryview, 디스크면 새로 연 파일 객체를 넘긴다. aiohttp FormData에 그대로 쓸 수 있다."""
+        if self.in_memory:
+            view = self.view()
+            try:
+                yield view
+            finally:
+                view.release()
+        else:
+            with open(self.path, "rb") as f:
+                yield f
+
+    def read_bytes(self):
+        # 라이브러리가 bytes만 받는 경우에만 사용 (복사 발생)
+        if self.in_memory:
+            return self._buffer.getvalue()
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def materialize(self):
+        """파일 경로가 필요한 소비자(STT 등)를 위해 메모리 본문을 디스크에 쓰고 경로를 반환한다."""
+        if self.in_memory:
+            self._rollover()
+            self._file.close()
+        return self.path
+
+    def link_to(self, directory):
+        """같은 내용을 가리키는 새 경로를 만든다(가능하면 하드 링크). 소유권은 호출자에게 넘어간다."""
+        os.makedirs(directory, exist_ok=True)
+        suffix = os.path.splitext(self.filename or "")[1]
+        fd, new_path = tempfile.mkstemp(dir=directory, suffix=suffix)
+        os.close(fd)
+        if self.in_memory:
+            with open(new_path, "wb") as f:
+                f.write(self._buffer.getbuffer())
+            return new_path
+        os.remove(new_path)
+        try:
+            os.link(self.path, new_path)
+        except OSError:
+            # 다른 파일 시스템이면 복사
+            with open(self.path, "rb") as src, open(new_path, "wb") as dst:
+                while chunk := src.read(UPLOAD_CHUNK_SIZE):
+                    dst.write(chunk)
+        return new_path
+
+    def close(self):
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+        self._buffer = None
+
+
+def multipart_request_body(field, multiple=False):
+    """request.stream()으로 직접 읽는 엔드포인트의 OpenAPI 요청 본문 정의 (openapi_extra에 넘김)."""
+    schema = {'type': 'string', 'format': 'binary'}
+    if multiple:
+        schema = {'type': 'array', 'items': schema}
+    return {'requestBody': {'required': True, 'content': {'multipart/form-data': {'schema': {
+        'type': 'object', 'required': [field], 'properties': {field: schema}}}}}}
+
+
+def _too_large(max_size):
+    return HTTPException(status_code=413, detail=f"업로드 파일이 최대 크기({max_size // (1024 * 1024)}MB)를 초과했습니다")
+
+
+async def _write(upload, data, max_size):
+    if upload.size + len(data) > max_size:
+        raise _too_large(max_size)
+    if upload.in_memory and upload.size + len(data) <= upload.memory_limit:
+        upload.write(data)
+    else:
+        # 디스크 쓰기는 이벤트 루프 밖에서
+        await asyncio.to_thread(upload.write, data)
+
+
+async def ingest_multipart(request, field, max_size, max_files=1, memory_limit=UPLOAD_MEMORY_LIMIT):
+    """multipart 본문을 request.stream()에서 받는 대로 field 파일마다 SpooledUpload에 쓴다.
+
+    Starlette 폼 파싱(UploadFile 임시 파일)을 거치지 않으므로 본문은 스풀에 한 번만 저장되고,
+    해시 계산과 크기 제한 검사도 받는 도중에 한다. 다른 필드는 읽고 버린다.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="multipart/form-data 요청이어야 합니다")
+    body_limit = UPLOAD_SIZE_LIMITS.get(request.url.path)
+
+    # 파서 콜백은 동기라서 이벤트만 모아 두고, 청크마다 비동기로 스풀에 쓴다
+    events = []
+    header = [b"", b""]
+    part_headers = {}
+
+    def on_header_field(data, start, end):
+        header[0] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header[1] += data[start:end]
+
+    def on_header_end():
+        part_headers[header[0].lower()] = header[1]
+        header[0] = header[1] = b""
+
+    def on_headers_finished():
+        events.append(('begin', dict(part_headers)))
+        part_headers.clear()
+
+    def on_part_data(data, start, end):
+        events.append(('data', data[start:end]))
+
+    def on_part_end():
+        events.append(('end', None))
+
+    parser = MultipartParser(boundary, {
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+        'on_part_end': on_part_end,
+    })
+    uploads = []
+    current = None
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if body_limit and received > body_limit:
+                raise _too_large(body_limit)
+            try:
+                parser.write(chunk)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"multipart 본문을 읽을 수 없습니다: {e}")
+            for kind, value in events:
+                if kind == 'begin':
+                    _, options = parse_options_header(value.get(b"content-disposition"))
+                    filename = options.get(b"filename")
+                    if options.get(b"name", b"").decode("utf-8", "replace") != field or filename is None:
+                        current = None
+                        continue
+                    if len(uploads) >= max_files:
+                        raise HTTPException(status_code=413, detail=f"한 번에 최대 {max_files}개 파일까지 올릴 수 있습니다")
+                    content_type = value.get(b"content-type")
+                    current = SpooledUpload(filename.decode("utf-8", "replace"),
+                                            content_type.decode("latin-1") if content_type else None, memory_limit)
+                    uploads.append(current)
+                elif kind == 'data':
+                    if current is not None:
+                        await _write(current, value, max_size)
+                elif current is not None:
+                    await asyncio.to_thread(current.finish)
+                    current = None
+            events.clear()
+        if current is not None:
+            raise HTTPException(status_code=400, detail="업로드 본문이 중간에 끊겼습니다")
+    except BaseException:
+        for upload in uploads:
+            upload.close()
+        raise
+    if not uploads:
+        raise HTTPException(status_code=422, detail=f"업로드 파일이 없습니다: {field}")
+    for upload in uploads:
+        logger.debug(f"업로드 수신 완료: {upload.filename} {upload.size} 바이트 (메모리: {upload.in_memory})")
+    return uploads
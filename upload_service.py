@@ -0,0 +1,218 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from loguru import logger
+from metrics import S3_UPLOAD_DURATION, S3_UPLOAD_QUEUE_WAIT
+from s3 import upload_file_to_s3_sync, upload_path_to_s3_sync, object_exists_sync
+
+UPLOAD_QUEUE_DIR = os.getenv("S3_UPLOAD_QUEUE_DIR", "tmp/s3_queue")
+# 업로드/확인이 끝난 키를 기억하는 최대 수 (넘으면 가장 오래 안 쓴 키부터 잊고 다음에는 HEAD로 확인)
+S3_KNOWN_KEYS_SIZE = int(os.getenv("S3_KNOWN_KEYS_SIZE", 10000))
+
+
+@dataclass
+class UploadJob:
+    # file_content(bytes/memoryview)나 file_path 중 하나. file_path는 업로드가 끝나면 삭제한다.
+    file_content: bytes
+    file_name: str
+    content_type: str = None
+    skip_if_exists: bool = True
+    file_path: str = None
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+    def cleanup(self):
+        if self.file_path:
+            try:
+                os.remove(self.file_path)
+            except OSError:
+                pass
+
+
+class S3UploadService:
+    """요청 처리와 분리된 백그라운드 S3 업로드 서비스.
+
+    lifespan에서 start()/stop()을 호출한다. 업로드는 제한된 크기의 큐에 쌓이고,
+    워커 태스크가 스레드 풀에서 blocking boto3 호출을 실행한다.
+    """
+
+    def __init__(self, max_queue_size=None, num_workers=None, max_retries=None,
+                 backoff_base=None, enqueue_timeout=None):
+        self.max_queue_size = max_queue_size or int(os.getenv('S3_UPLOAD_QUEUE_SIZE', 100))
+        self.num_workers = num_workers or int(os.getenv('S3_UPLOAD_WORKERS', 4))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('S3_UPLOAD_MAX_RETRIES', 3))
+        self.backoff_base = backoff_base or float(os.getenv('S3_UPLOAD_BACKOFF_BASE', 0.5))
+        self.enqueue_timeout = enqueue_timeout or float(os.getenv('S3_UPLOAD_ENQUEUE_TIMEOUT', 5.0))
+
+        self.queue = None
+        self.executor = None
+        self.workers = []
+        self.in_flight = 0
+        self.counters = {'enqueued': 0, 'uploaded': 0, 'skipped_existing': 0, 'failed': 0, 'retried': 0, 'rejected': 0}
+        # 이 프로세스에서 업로드/확인이 끝난 콘텐츠 주소 키 (HEAD 요청도 생략)
+        self.known_keys = OrderedDict()
+        # 최근 업로드 지연 시간(초) - 큐 대기 시간과 업로드 시간을 따로 기록
+        self.upload_latencies = deque(maxlen=1000)
+        self.wait_latencies = deque(maxlen=1000)
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="s3-upload")
+        self.workers = [asyncio.create_task(self._worker(i), name=f"s3-upload-worker-{i}")
+                        for i in range(self.num_workers)]
+        logger.info(f"S3 업로드 서비스 시작: 워커 {self.num_workers}개, 큐 크기 {self.max_queue_size}")
+
+    async def stop(self, timeout=None):
+        if self.queue is None:
+            return
+        timeout = timeout if timeout is not None else float(os.getenv('S3_UPLOAD_DRAIN_TIMEOUT', 30.0))
+        logger.info(f"S3 업로드 큐 드레인 시작: 대기 중 {self.queue.qsize()}건")
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"S3 업로드 큐 드레인 시간 초과: 미처리 {self.queue.qsize()}건")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.executor.shutdown(wait=True)
+        self.workers = []
+        self.queue = None
+        logger.info("S3 업로드 서비스 종료")
+
+    async def enqueue(self, file_content, file_name, content_type=None, skip_if_exists=True) -> bool:
+        """업로드를 큐에 넣는다. 큐가 가득 차면 enqueue_timeout 동안 기다린 뒤 포기한다.
+
+        skip_if_exists가 참이면 file_name을 콘텐츠 주소 키로 보고, 이미 존재하는 객체는 다시 올리지 않는다.
+        """
+        return await self._put(UploadJob(file_content, file_name, content_type, skip_if_exists))
+
+    async def enqueue_file(self, file_path, file_name, content_type=None, skip_if_exists=True) -> bool:
+        """디스크 파일 업로드를 큐에 넣는다. file_path의 소유권은 서비스로 넘어오며 처리 후 삭제된다."""
+        return await self._put(UploadJob(None, file_name, content_type, skip_if_exists, file_path))
+
+    async def enqueue_upload(self, upload, file_name, content_type=None, skip_if_exists=True) -> bool:
+        """SpooledUpload를 큐에 넣는다. 디스크에 있는 경우 하드 링크를 넘겨 복사하지 않는다."""
+        if skip_if_exists and self._is_known(file_name):
+            self.counters['skipped_existing'] += 1
+            return True
+        if upload.in_memory:
+            return await self.enqueue(upload.view(), file_name, content_type, skip_if_exists)
+        file_path = await asyncio.to_thread(upload.link_to, UPLOAD_QUEUE_DIR)
+        return await self.enqueue_file(file_path, file_name, content_type, skip_if_exists)
+
+    def _is_known(self, key):
+        if key not in self.known_keys:
+            return False
+        self.known_keys.move_to_end(key)
+        return True
+
+    def _remember_key(self, key):
+        self.known_keys[key] = None
+        self.known_keys.move_to_end(key)
+        while len(self.known_keys) > S3_KNOWN_KEYS_SIZE:
+            self.known_keys.popitem(last=False)
+
+    async def _put(self, job) -> bool:
+        if job.skip_if_exists and self._is_known(job.file_name):
+            self.counters['skipped_existing'] += 1
+            job.cleanup()
+            return True
+        if self.queue is None:
+            logger.error(f"S3 업로드 서비스가 시작되지 않았습니다: {job.file_name}")
+            job.cleanup()
+            return False
+        try:
+            await asyncio.wait_for(self.queue.put(job), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.counters['rejected'] += 1
+            logger.error(f"S3 업로드 큐가 가득 차 업로드를 건너뜁니다: {job.file_name}")
+            job.cleanup()
+            return False
+        self.counters['enqueued'] += 1
+        return True
+
+    async def _worker(self, worker_id):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            self.in_flight += 1
+            try:
+                wait_time = time.perf_counter() - job.enqueued_at
+                self.wait_latencies.append(wait_time)
+                S3_UPLOAD_QUEUE_WAIT.observe(wait_time)
+                await self._upload_with_retry(loop, job)
+            except Exception as e:
+                logger.error(f"S3 업로드 워커 {worker_id} 오류: {e}")
+            finally:
+                job.cleanup()
+                self.in_flight -= 1
+                self.queue.task_done()
+
+    def _upload_if_missing(self, job):
+        if job.skip_if_exists and object_exists_sync(job.file_name):
+            return None
+        if job.file_path:
+            return upload_path_to_s3_sync(job.file_path, job.file_name, job.content_type)
+        return upload_file_to_s3_sync(job.file_content, job.file_name, job.content_type)
+
+    async def _upload_with_retry(self, loop, job):
+        for attempt in range(self.max_retries + 1):
+            start_time = time.perf_counter()
+            try:
+                file_url = await loop.run_in_executor(
+                    self.executor, self._upload_if_missing, job)
+                if job.skip_if_exists:
+                    self._remember_key(job.file_name)
+                if file_url is None:
+                    self.counters['skipped_existing'] += 1
+                    logger.info(f"이미 존재하는 객체로 업로드를 건너뜁니다: {job.file_name}")
+                    return None
+                upload_time = time.perf_counter() - start_time
+                self.upload_latencies.append(upload_time)
+                S3_UPLOAD_DURATION.observe(upload_time)
+                self.counters['uploaded'] += 1
+                logger.info(f"파일 업로드 성공: {file_url}")
+                return file_url
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    self.counters['failed'] += 1
+                    logger.error(f"S3 업로드 실패 ({attempt + 1}회 시도): {job.file_name} - {e}")
+                    return None
+                # 지수 백오프 + 지터
+                delay = self.backoff_base * (2 ** attempt) * (1 + random.random())
+                self.counters['retried'] += 1
+                logger.warning(f"S3 업로드 재시도 {attempt + 1}/{self.max_retries} ({delay:.2f}초 후): {job.file_name} - {e}")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _percentile(values, q):
+        if not values:
+            return None
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return round(ordered[index], 4)
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize() if self.queue else 0,
+            'queue_capacity': self.max_queue_size,
+            'in_flight': self.in_flight,
+            'workers': len(self.workers),
+            **self.counters,
+            'upload_latency_seconds': {
+                'p50': self._percentile(self.upload_latencies, 0.50),
+                'p95': self._percentile(self.upload_latencies, 0.95),
+                'max': self._percentile(self.upload_latencies, 1.0),
+            },
+            'queue_wait_seconds': {
+                'p50': self._percentile(self.wait_latencies, 0.50),
+                'p95': self._percentile(self.wait_latencies, 0.95),
+                'max': self._percentile(self.wait_latencies, 1.0),
+            },
+        }
+
+
+upload_service = S3UploadService()